@@ -361,12 +361,8 @@ class ShowPredictionPlots(BaseCommand):
             model_type = cfg.DEFAULT_MODEL_TYPE
         model.load(model_path)
 
-        user_angles = []
-        user_throttles = []
-        pilot_angles = []
-        pilot_throttles = []       
-
         from donkeycar.parts.tub_v2 import Tub
+        from donkeycar.pipeline.types import TubRecord
         from pathlib import Path
 
         base_path = Path(os.path.expanduser(tub_paths)).absolute().as_posix()
@@ -375,18 +371,18 @@ class ShowPredictionPlots(BaseCommand):
         records = records[:limit]
         bar = IncrementalBar('Inferencing', max=len(records))
 
-        for record in records:
-            img_filename = os.path.join(base_path, Tub.images(), record['cam/image_array'])
-            img = load_image(img_filename, cfg)
-            user_angle = float(record["user/angle"])
-            user_throttle = float(record["user/throttle"])
-            pilot_angle, pilot_throttle = model.run(img)
+        def tub_records():
+            for record in records:
+                yield TubRecord(cfg, base_path, record)
+                bar.next()
 
-            user_angles.append(user_angle)
-            user_throttles.append(user_throttle)
-            pilot_angles.append(pilot_angle)
-            pilot_throttles.append(pilot_throttle)
-            bar.next()
+        # runs the model once per batch of records instead of per record
+        predictions = model.predict_batch(tub_records(),
+                                          batch_size=cfg.BATCH_SIZE)
+        user_angles = [float(record["user/angle"]) for record in records]
+        user_throttles = [float(record["user/throttle"]) for record in records]
+        pilot_angles = predictions[:, 0]
+        pilot_throttles = predictions[:, 1]
 
         angles_df = pd.DataFrame({'user_angle': user_angles, 'pilot_angle': pilot_angles})
         throttles_df = pd.DataFrame({'user_throttle': user_throttles, 'pilot_throttle': pilot_throttles})
@@ -425,6 +421,152 @@ class ShowPredictionPlots(BaseCommand):
         self.plot_predictions(cfg, args.tub, args.model, args.limit, args.type)
 
 
+class Benchmark(BaseCommand):
+    """ Compares speed and outputs of pilots, like the keras, tflite and
+        onnx versions of one model, on the images of the same tub. """
+
+    @staticmethod
+    def model_type(model_path, model_type):
+        ext = os.path.splitext(model_path)[1]
+        if ext == '.tflite':
+            return 'tflite_linear'
+        if ext == '.onnx':
+            return 'onnx_linear'
+        return model_type
+
+    @staticmethod
+    def benchmark(pilot, images, batch_size):
+        """
+        Returns the per frame latency of run() in ms, the frames per second
+        of predict_batch() and the predictions.
+        """
+        import time
+        pilot.run(images[0])
+        latencies = []
+        for image in images:
+            start = time.perf_counter()
+            pilot.run(image)
+            latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        predictions = pilot.predict_batch(images, batch_size=batch_size)
+        batch_fps = len(images) / (time.perf_counter() - start)
+        return {'mean': float(np.mean(latencies)),
+                'p99': float(np.percentile(latencies, 99)),
+                'batch_fps': batch_fps}, predictions
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='benchmark',
+                                         usage='%(prog)s [options]')
+        parser.add_argument('--tub', required=True, help='tub with images')
+        parser.add_argument('--model', nargs='+', required=True,
+                            help='models to compare, like pilot.h5 '
+                                 'pilot.tflite pilot.onnx')
+        parser.add_argument('--type', default=None,
+                            help='model type of the keras models')
+        parser.add_argument('--limit', type=int, default=500,
+                            help='how many records to process')
+        parser.add_argument('--config', default='./config.py',
+                            help=HELP_CONFIG)
+        return parser.parse_args(args)
+
+    def run(self, args):
+        from donkeycar.parts.tub_v2 import Tub
+        from donkeycar.pipeline.types import TubRecord
+
+        args = self.parse_args(args)
+        cfg = load_config(args.config)
+        base_path = os.path.expanduser(args.tub)
+        records = list(Tub(base_path, read_only=True))[:args.limit]
+        images = [TubRecord(cfg, base_path, record).image()
+                  for record in records]
+        reference = None
+        print(f'{"model":<40} {"run ms":>8} {"p99 ms":>8} {"batch fps":>10} '
+              f'{"max diff":>9}')
+        for model_path in args.model:
+            model_type = self.model_type(model_path, args.type)
+            pilot = get_model_by_type(model_type, cfg)
+            pilot.load(os.path.expanduser(model_path))
+            result, predictions = self.benchmark(pilot, images,
+                                                 cfg.BATCH_SIZE)
+            if reference is None:
+                reference = predictions
+            diff = np.abs(predictions[:, :2] - reference[:, :2]).max()
+            print(f'{os.path.basename(model_path):<40} {result["mean"]:8.2f} '
+                  f'{result["p99"]:8.2f} {result["batch_fps"]:10.1f} '
+                  f'{diff:9.4f}')
+
+
+class ShowPartGraph(BaseCommand):
+    """ Prints the dependency graph of the parts in the drive loop of a
+        template, see PartGraph, and its critical path. """
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='dag',
+                                         usage='%(prog)s [options]')
+        parser.add_argument('--config', default='./config.py',
+                            help=HELP_CONFIG)
+        parser.add_argument('--template', default='complete',
+                            help='template of the drive loop')
+        parser.add_argument('--mock', action='store_true',
+                            help='use a mock camera, no drive train and no '
+                                 'display, to build the graph off the car')
+        parser.add_argument('--loops', type=int, default=0,
+                            help='run the parts this many times and weigh '
+                                 'the critical path by their run time, '
+                                 'needs --mock')
+        parsed_args = parser.parse_args(args)
+        if parsed_args.loops and not parsed_args.mock:
+            # running the parts would drive the car
+            parser.error('--loops needs --mock')
+        return parsed_args
+
+    def run(self, args):
+        import importlib
+        from prettytable import PrettyTable
+        from donkeycar.vehicle import PartGraph, build_vehicle
+
+        args = self.parse_args(args)
+        cfg = load_config(args.config)
+        if cfg is None:
+            return
+        if args.mock:
+            cfg.CAMERA_TYPE = 'MOCK'
+            cfg.DRIVE_TRAIN_TYPE = 'None'
+            cfg.USE_SSD1306_128_32 = False
+        template = importlib.import_module(
+            f'donkeycar.templates.{args.template}')
+        vehicle = build_vehicle(template.drive, cfg)
+        for _ in range(args.loops):
+            vehicle.update_parts()
+        vehicle.stop()
+
+        graph = PartGraph(vehicle.parts)
+        levels = graph.levels()
+        names = [vehicle.profiler.names[entry['part']]
+                 for entry in vehicle.parts]
+        records = [vehicle.profiler.records[entry['part']]
+                   for entry in vehicle.parts]
+        measured = any(record.count for record in records)
+        weights = [record.mean() if measured else 1 for record in records]
+        pt = PrettyTable(['#', 'part', 'level', 'depends on', 'inputs',
+                          'outputs', 'ms'])
+        for i, entry in enumerate(vehicle.parts):
+            inputs = list(entry['inputs'])
+            if entry.get('run_condition'):
+                inputs.append(f'if {entry["run_condition"]}')
+            pt.add_row([i, names[i], levels[i],
+                        ', '.join(str(dep) for dep in sorted(graph.deps[i])),
+                        '\n'.join(inputs), '\n'.join(entry['outputs']),
+                        f'{weights[i]:.3f}' if measured else ''])
+        pt.align = 'l'
+        print(pt)
+        path, length = graph.critical_path(weights)
+        print(f'{len(names)} parts in {max(levels, default=-1) + 1} levels')
+        print('Critical path: ' + ' -> '.join(names[i] for i in path)
+              + (f' ({length:.3f} ms)' if measured else
+                 f' ({len(path)} parts)'))
+
+
 class Train(BaseCommand):
 
     def parse_args(self, args):
@@ -445,6 +587,9 @@ class Train(BaseCommand):
         parser.add_argument('--comment', type=str,
                             help='comment added to model database - use '
                                  'double quotes for multiple words')
+        parser.add_argument('--quantize', choices=['int8', 'fp16', 'dynamic'],
+                            help='quantize the tflite model, int8 is '
+                                 'calibrated on the training data')
         parsed_args = parser.parse_args(args)
         return parsed_args
 
@@ -458,7 +603,7 @@ class Train(BaseCommand):
         if framework == 'tensorflow':
             from donkeycar.pipeline.training import train
             train(cfg, args.tub, args.model, args.type, args.transfer,
-                  args.comment)
+                  args.comment, args.quantize)
         elif framework == 'pytorch':
             from donkeycar.parts.pytorch.torch_train import train
             train(cfg, args.tub, args.model, args.type,
@@ -468,6 +613,24 @@ class Train(BaseCommand):
                   f"'tensorflow' or 'pytorch'")
 
 
+class ConvertToColumnar(BaseCommand):
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubcolumnar', usage='%(prog)s [options]')
+        parser.add_argument('--tub', nargs='+', help='tubs to convert')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of records converted at once')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def run(self, args):
+        args = self.parse_args(args)
+        from donkeycar.parts.datastore_columnar import convert_to_columnar
+        for tub_path in args.tub:
+            count = convert_to_columnar(tub_path, batch_size=args.batch_size)
+            print(f'Converted {count} records of {tub_path}')
+
+
 class Gui(BaseCommand):
     def run(self, args):
         from donkeycar.management.kivy_ui import main
@@ -484,11 +647,14 @@ def execute_from_command_line():
         'calibrate': CalibrateCar,
         'tubclean': TubManager,
         'tubplot': ShowPredictionPlots,
+        'tubcolumnar': ConvertToColumnar,
         'makemovie': MakeMovieShell,
         'createjs': CreateJoystick,
         'cnnactivations': ShowCnnActivations,
         'update': UpdateCar,
         'train': Train,
+        'benchmark': Benchmark,
+        'dag': ShowPartGraph,
         'ui': Gui,
     }
     
@@ -675,6 +675,7 @@ class PilotLoader(BoxLayout, FileChooserBase):
         if self.file_path and self.pilot:
             try:
                 self.pilot.load(os.path.join(self.file_path))
+                pilot_screen().clear_predictions()
                 rc_handler.data['pilot_' + self.num] = self.file_path
                 rc_handler.data['model_type_' + self.num] = self.model_type
             except FileNotFoundError:
@@ -701,15 +702,48 @@ class OverlayImage(FullImage):
     keras_part = ObjectProperty()
     pilot_record = ObjectProperty()
     throttle_field = StringProperty('user/throttle')
+    # number of records the pilot predicts in one batch
+    batch_size = NumericProperty(32)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.predictions = dict()
+
+    def on_keras_part(self, obj, keras_part):
+        """ Kivy method that is called if self.keras_part changes. """
+        self.clear_predictions()
+
+    def clear_predictions(self):
+        self.predictions.clear()
+
+    def get_prediction(self, record, augmentation):
+        """ Returns the pilot output for the record. On a miss the pilot
+            predicts a whole batch of records around the current index, so
+            stepping through the tub only runs the model once per batch. """
+        index = record.underlying['_index']
+        if index not in self.predictions:
+            records = tub_screen().ids.tub_loader.records
+            start = max(0, pilot_screen().index - self.batch_size // 4)
+            batch = records[start:start + self.batch_size]
+            if not any(r is record for r in batch):
+                batch = [record]
+            outputs = self.keras_part.predict_batch(
+                batch, batch_size=len(batch), augmentation=augmentation)
+            self.predictions = {r.underlying['_index']: output
+                                for r, output in zip(batch, outputs)}
+        return self.predictions[index]
 
     def get_image(self, record):
         from donkeycar.management.makemovie import MakeMovie
         img_arr = copy(super().get_image(record))
         augmentation = pilot_screen().augmentation if pilot_screen().auglist \
             else None
-        if augmentation:
-            img_arr = pilot_screen().augmentation.augment(img_arr)
         angle = record.underlying['user/angle']
+        if augmentation:
+            # Pass the angle, so a flipped image shows the mirrored angle
+            images, angles = augmentation.augment_batch(
+                img_arr[np.newaxis], np.array([angle]))
+            img_arr, angle = images[0], angles[0]
         throttle = get_norm_value(record.underlying[self.throttle_field],
                                   tub_screen().ids.config_manager.config,
                                   rc_handler.field_properties[
@@ -719,16 +753,16 @@ class OverlayImage(FullImage):
         if not self.keras_part:
             return img_arr
 
-        output = self.keras_part.evaluate(record, augmentation)
+        output = self.get_prediction(record, augmentation)
         rgb = (0, 0, 255)
         MakeMovie.draw_line_into_image(output[0], output[1], True, img_arr, rgb)
         out_record = copy(record)
-        out_record.underlying['pilot/angle'] = output[0]
+        out_record.underlying['pilot/angle'] = float(output[0])
         # rename and denormalise the throttle output
         pilot_throttle_field \
             = rc_handler.data['user_pilot_map'][self.throttle_field]
         out_record.underlying[pilot_throttle_field] \
-            = get_norm_value(output[1], tub_screen().ids.config_manager.config,
+            = get_norm_value(float(output[1]), tub_screen().ids.config_manager.config,
                              rc_handler.field_properties[self.throttle_field],
                              normalised=False)
         self.pilot_record = out_record
@@ -778,34 +812,45 @@ class PilotScreen(Screen):
             return text
         return rc_handler.data['user_pilot_map'][text]
 
+    def update_auglist(self):
+        """ Sets the augmentations from the state of the toggle buttons. """
+        buttons = [('MULTIPLY', self.ids.button_bright),
+                   ('BLUR', self.ids.button_blur),
+                   ('FLIP', self.ids.button_flip)]
+        self.auglist = [aug for aug, button in buttons
+                        if button.state == 'down']
+
     def set_brightness(self, val=None):
         if self.ids.button_bright.state == 'down':
             self.config.AUG_MULTIPLY_RANGE = (val, val)
-            if self.ids.button_blur.state == 'down':
-                self.auglist = ['MULTIPLY', 'BLUR']
-            else:
-                self.auglist = ['MULTIPLY']
+            self.update_auglist()
 
     def remove_brightness(self):
-        self.auglist = ['BLUR'] if self.ids.button_blur.state == 'down' else[]
+        self.update_auglist()
 
     def set_blur(self, val=None):
         if self.ids.button_blur.state == 'down':
             self.config.AUG_BLUR_RANGE = (val, val)
-            if self.ids.button_bright.state == 'down':
-                self.auglist = ['MULTIPLY', 'BLUR']
-            else:
-                self.auglist = ['BLUR']
+            self.update_auglist()
 
     def remove_blur(self):
-        self.auglist = ['MULTIPLY'] if self.ids.button_bright.state == 'down' \
-            else []
+        self.update_auglist()
+
+    def set_flip(self):
+        # Always flip in the preview
+        self.config.AUG_FLIP_PROBABILITY = 1.0
+        self.update_auglist()
 
     def on_auglist(self, obj, auglist):
         self.config.AUGMENTATIONS = self.auglist
         self.augmentation = ImageAugmentation(self.config)
+        self.clear_predictions()
         self.on_current_record(None, self.current_record)
 
+    def clear_predictions(self):
+        self.ids.img_1.clear_predictions()
+        self.ids.img_2.clear_predictions()
+
     def status(self, msg):
         self.ids.status.text = msg
 
@@ -1,3 +1,6 @@
+import itertools
+from collections import deque
+
 import moviepy.editor as mpy
 from tensorflow.python.keras import activations
 from tensorflow.python.keras import backend as K
@@ -60,12 +63,12 @@ class MakeMovie(object):
         self.end_index = args.end if args.end != -1 else len(self.tub)
         num_frames = self.end_index - start
 
-        # Move to the correct offset
-        self.current = 0
-        self.iterator = self.tub.__iter__()
-        while self.current < start:
-            self.iterator.next()
-            self.current += 1
+        # Seek directly to the correct offset
+        self.current = start
+        self.iterator = iter(self.tub[start:self.end_index])
+        # records, images and predictions of the current batch
+        self.frames = deque()
+        self.batch_size = getattr(self.cfg, 'BATCH_SIZE', 64)
 
         self.scale = args.scale
         self.keras_part = None
@@ -106,14 +109,11 @@ class MakeMovie(object):
         green = (0, 255, 0)
         self.draw_line_into_image(user_angle, user_throttle, False, img, green)
         
-    def draw_model_prediction(self, img):
+    def model_input(self, img):
         """
-        query the model for it's prediction, draw the predictions
-        as a blue line on the image
+        Convert the image into the model input shape, returns None if the
+        shapes don't match
         """
-        if self.keras_part is None:
-            return
-
         expected = tuple(self.keras_part.get_input_shape()[1:])
         actual = img.shape
 
@@ -127,10 +127,35 @@ class MakeMovie(object):
         if expected != actual:
             print(f"expected input dim {expected} didn't match actual dim "
                   f"{actual}")
+            return None
+        return img
+
+    def load_frames(self):
+        """
+        Load the next batch of records and images and query the model once
+        for the predictions of the whole batch
+        """
+        records = list(itertools.islice(self.iterator, self.batch_size))
+        images = [img_to_arr(Image.open(
+            os.path.join(self.tub.images_base_path, rec['cam/image_array'])))
+            for rec in records]
+        predictions = [None] * len(records)
+        if self.keras_part is not None and records:
+            inputs = [self.model_input(img) for img in images]
+            if all(x is not None for x in inputs):
+                predictions = self.keras_part.predict_batch(
+                    inputs, batch_size=len(inputs))
+        self.frames.extend(zip(records, images, predictions))
+
+    def draw_model_prediction(self, prediction, img):
+        """
+        draw the predictions of the model as a blue line on the image
+        """
+        if prediction is None:
             return
 
         blue = (0, 0, 255)
-        pilot_angle, pilot_throttle = self.keras_part.run(img)
+        pilot_angle, pilot_throttle = prediction[:2]
         self.draw_line_into_image(pilot_angle, pilot_throttle, True, img, blue)
 
     def draw_steering_distribution(self, img):
@@ -147,7 +172,7 @@ class MakeMovie(object):
 
         pred_img = normalize_image(img)
         pred_img = pred_img.reshape((1,) + pred_img.shape)
-        angle_binned, _ = self.keras_part.model.predict(pred_img)
+        angle_binned, _ = self.keras_part.call_model(pred_img)
 
         x = 4
         dx = 4
@@ -230,9 +255,9 @@ class MakeMovie(object):
         if self.current >= self.end_index:
             return None
 
-        rec = self.iterator.next()
-        img_path = os.path.join(self.tub.images_base_path, rec['cam/image_array'])
-        image = img_to_arr(Image.open(img_path))
+        if not self.frames:
+            self.load_frames()
+        rec, image, prediction = self.frames.popleft()
 
         if self.do_salient:
             image = self.draw_salient(image)
@@ -241,7 +266,7 @@ class MakeMovie(object):
         
         if self.user: self.draw_user_input(rec, image)
         if self.keras_part is not None:
-            self.draw_model_prediction(image)
+            self.draw_model_prediction(prediction, image)
             self.draw_steering_distribution(image)
 
         if self.scale != 1:
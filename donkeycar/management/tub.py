@@ -4,6 +4,7 @@ tub.py
 Manage tubs
 '''
 
+import argparse
 import json
 import os
 import sys
@@ -13,13 +14,29 @@ from stat import S_ISREG, ST_ATIME, ST_CTIME, ST_MODE, ST_MTIME
 
 import tornado.web
 
-from donkeycar.parts.tub_v2 import Tub
+from donkeycar.parts.tub_v2 import Tub, compact_tub
 
 
 class TubManager:
 
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubclean', usage='%(prog)s [options] <path>')
+        parser.add_argument('path', nargs='+', help='data path for the web editor, or tubs to compact')
+        parser.add_argument('--compact', action='store_true',
+                            help='remove deleted records and unused images from the tubs')
+        parser.add_argument('--no-index-map', action='store_true',
+                            help='do not keep the original record index as _original_index')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
     def run(self, args):
-        WebServer(args[0]).start()
+        args = self.parse_args(args)
+        if args.compact:
+            for tub_path in args.path:
+                records, images = compact_tub(tub_path, keep_index_map=not args.no_index_map)
+                print(f'Compacted {tub_path}: removed {records} records and {images} images')
+        else:
+            WebServer(args.path[0]).start()
 
 
 class WebServer(tornado.web.Application):
@@ -5,14 +5,31 @@ Created on Sun Jun 25 11:07:48 2017
 
 @author: wroscoe
 """
+import threading
+import time
+
+import numpy as np
+
 
 class Memory:
     """
-    A convenience class to save key/value pairs.
+    A convenience class to save key/value pairs. Each key gets a fixed slot
+    in a list of values, so the compiled drive loop of the Vehicle reads and
+    writes channels by index instead of looking up keys.
     """
     def __init__(self, *args, **kw):
-        self.d = {}
-    
+        self.slots = {}
+        self.data = []
+
+    def slot(self, key):
+        """ Returns the index of key in data, adds the key if it is new """
+        index = self.slots.get(key)
+        if index is None:
+            index = len(self.data)
+            self.slots[key] = index
+            self.data.append(None)
+        return index
+
     def __setitem__(self, key, value):
         if type(key) is not tuple:
             print('tuples')
@@ -20,41 +37,142 @@ class Memory:
             value=(value,)
         
         for i, k in enumerate(key):
-            self.d[k] = value[i]
+            self.data[self.slot(k)] = value[i]
         
     def __getitem__(self, key):
         if type(key) is tuple:
-            return [self.d[k] for k in key]
+            return [self.data[self.slots[k]] for k in key]
         else:
-            return self.d[key]
+            return self.data[self.slots[key]]
         
     def update(self, new_d):
-        self.d.update(new_d)
+        for k, v in new_d.items():
+            self.data[self.slot(k)] = v
         
     def put(self, keys, inputs):
         if len(keys) > 1:
             for i, key in enumerate(keys):
                 try:
-                    self.d[key] = inputs[i]
+                    self.data[self.slot(key)] = inputs[i]
                 except IndexError as e:
                     error = str(e) + ' issue with keys: ' + str(key)
                     raise IndexError(error)
         
         else:
-            self.d[keys[0]] = inputs
+            self.data[self.slot(keys[0])] = inputs
 
             
             
     def get(self, keys):
-        result = [self.d.get(k) for k in keys]
+        data = self.data
+        result = [None if i is None else data[i]
+                  for i in map(self.slots.get, keys)]
         return result
     
     def keys(self):
-        return self.d.keys()
+        return self.slots.keys()
     
     def values(self):
-        return self.d.values()
+        return list(self.data)
     
     def items(self):
-        return self.d.items()
-        
\ No newline at end of file
+        return dict(zip(self.slots, self.data)).items()
+        
+
+def copy_if_read_only(value):
+    """
+    Returns a copy of read-only arrays, like the frames of a FrameBuffer,
+    for parts which use them after the drive loop moved on.
+    """
+    if isinstance(value, np.ndarray) and not value.flags.writeable:
+        return value.copy()
+    return value
+
+
+class FrameBuffer:
+    """
+    Hands large arrays, like camera frames, from a producer to the drive
+    loop without allocating or copying them per frame. \n
+    The producer writes in place into the array returned by write_buffer()
+    and makes it the latest frame with publish(). read() returns a read-only
+    view of the latest complete frame and its sequence number. Three buffers
+    rotate, so the producer never writes into the frame being read and
+    readers never see torn frames. A frame returned by read() stays valid
+    until the next read(), that is for one drive loop when the part reads
+    once per loop. Parts which keep frames longer copy them with
+    copy_if_read_only(), like the threaded TubWriter and
+    ImageAugmentationPart, or write them into their own FrameBuffer, like
+    the LocalWebController and WebFpv video streams. \n
+    There is one producer and one reader, usually the threaded part writing
+    in update() and its run_threaded() in the drive loop. Memory stores the
+    returned view by reference. publish() stamps each frame with its
+    capture time and wakes up threads blocked in wait().
+    """
+    def __init__(self):
+        self.buffers = [None] * 3
+        self.views = [None] * 3
+        self.seqs = [0] * 3
+        self.stamps = [None] * 3
+        # index of the buffer being written, the latest published buffer and
+        # the buffer handed to the reader
+        self.write_idx, self.ready_idx, self.read_idx = 0, 1, 2
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.published = threading.Condition(self.lock)
+
+    def write_buffer(self, shape, dtype=np.uint8):
+        """
+        Returns the array to write the next frame into. It is only
+        allocated on the first frame or when the shape or type changes.
+        """
+        buffer = self.buffers[self.write_idx]
+        if buffer is None or buffer.shape != tuple(shape) \
+                or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            view = buffer.view()
+            view.flags.writeable = False
+            self.buffers[self.write_idx] = buffer
+            self.views[self.write_idx] = view
+        return buffer
+
+    def publish(self, timestamp=None):
+        """
+        Makes the written buffer the latest frame, returns its number. The
+        frame is stamped with timestamp, by default the current time.
+        """
+        with self.lock:
+            self.seq += 1
+            self.seqs[self.write_idx] = self.seq
+            self.stamps[self.write_idx] = timestamp or time.time()
+            self.write_idx, self.ready_idx = self.ready_idx, self.write_idx
+            self.published.notify_all()
+            return self.seq
+
+    def write(self, frame, timestamp=None):
+        """ Copies frame into the next buffer and publishes it """
+        np.copyto(self.write_buffer(frame.shape, frame.dtype), frame)
+        return self.publish(timestamp)
+
+    def read(self):
+        """
+        Returns the latest complete frame as read-only view and its
+        sequence number, (None, 0) before the first frame. Returns the same
+        frame again if no new one was published.
+        """
+        with self.lock:
+            if self.seqs[self.ready_idx] > self.seqs[self.read_idx]:
+                self.read_idx, self.ready_idx = self.ready_idx, self.read_idx
+            return self.views[self.read_idx], self.seqs[self.read_idx]
+
+    def timestamp(self):
+        """ Returns the time stamp of the frame returned by read() """
+        return self.stamps[self.read_idx]
+
+    def wait(self, seq, timeout=None):
+        """
+        Blocks until a frame newer than frame number seq is published or
+        the timeout in seconds expired. Returns the latest frame number.
+        """
+        with self.published:
+            self.published.wait_for(lambda: self.seq > seq, timeout)
+            return self.seq
@@ -2,6 +2,7 @@ import time
 import numpy as np
 from donkeycar.pipeline.augmentations import ImageAugmentation
 from donkeycar.config import Config
+from donkeycar.memory import copy_if_read_only
 
 
 class ImageAugmentationPart:
@@ -28,7 +29,8 @@ class ImageAugmentationPart:
                 self.img_arr = None
 
     def run_threaded(self, img_arr: np.ndarray) -> np.ndarray:
-        self.img_arr = img_arr
+        # update() augments the frame on its own thread
+        self.img_arr = copy_if_read_only(img_arr)
         time.sleep(self.delay)
         return self.aug_img_arr
 
@@ -3,18 +3,68 @@ import time
 import numpy as np
 from PIL import Image
 import glob
+from donkeycar.memory import FrameBuffer
 from donkeycar.utils import rgb2gray
 
+
 class BaseCamera:
+    """
+    Threaded cameras write frames in update() into self.buffer, then
+    run_threaded() returns the latest frame as a read-only view without
+    copying it. Cameras which set self.frame instead keep working.
+    timestamp is the capture time of the frame returned by run_threaded(),
+    None for cameras which set self.frame. Cameras which write captured
+    frames into the buffer set publishes_frames, they can drive a
+    CameraTrigger.
+    """
+    publishes_frames = False
+
+    def __init__(self):
+        self.frame = None
+        self.buffer = FrameBuffer()
+        self.seq = 0
+        self.timestamp = None
 
     def run_threaded(self):
-        return self.frame
+        frame, self.seq = self.buffer.read()
+        if not self.seq:
+            return self.frame
+        self.timestamp = self.buffer.timestamp()
+        return frame
+
+    def wait_frame(self, timeout=None):
+        """
+        Blocks until the camera captured a frame newer than the one
+        returned by run_threaded(), or the timeout in seconds expired.
+        """
+        return self.buffer.wait(self.seq, timeout)
+
+
+class CameraTrigger:
+    """
+    Part which outputs the capture time of the frame read by the camera
+    part in this loop, as cam/timestamp. Add it after the camera. Passed
+    as trigger to Vehicle.start(), the drive loop waits for the next frame
+    of the camera within the loop period.
+    """
+    def __init__(self, camera):
+        self.camera = camera
+
+    def wait(self, timeout):
+        self.camera.wait_frame(timeout)
+
+    def run(self):
+        return self.camera.timestamp
+
 
 class PiCamera(BaseCamera):
+    publishes_frames = True
+
     def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, vflip=False, hflip=False):
         from picamera.array import PiRGBArray
         from picamera import PiCamera
         
+        super().__init__()
         resolution = (image_w, image_h)
         # initialize the camera and stream
         self.camera = PiCamera() #PiCamera gets resolution (height, width)
@@ -26,9 +76,8 @@ class PiCamera(BaseCamera):
         self.stream = self.camera.capture_continuous(self.rawCapture,
             format="rgb", use_video_port=True)
 
-        # initialize the frame and the variable used to indicate
+        # initialize the variable used to indicate
         # if the thread should be stopped
-        self.frame = None
         self.on = True
         self.image_d = image_d
 
@@ -48,11 +97,12 @@ class PiCamera(BaseCamera):
         for f in self.stream:
             # grab the frame from the stream and clear the stream in
             # preparation for the next frame
-            self.frame = f.array
-            self.rawCapture.truncate(0)
-
+            timestamp = time.time()
+            frame = f.array
             if self.image_d == 1:
-                self.frame = rgb2gray(self.frame)
+                frame = rgb2gray(frame)
+            self.buffer.write(frame, timestamp)
+            self.rawCapture.truncate(0)
 
             # if the thread indicator variable is set, stop the thread
             if not self.on:
@@ -69,6 +119,8 @@ class PiCamera(BaseCamera):
 
 
 class Webcam(BaseCamera):
+    publishes_frames = True
+
     def __init__(self, image_w=160, image_h=120, image_d=3, framerate = 20, iCam = 0):
         import pygame
         import pygame.camera
@@ -86,7 +138,6 @@ class Webcam(BaseCamera):
 
         # initialize variable used to indicate
         # if the thread should be stopped
-        self.frame = None
         self.on = True
         self.image_d = image_d
 
@@ -104,10 +155,12 @@ class Webcam(BaseCamera):
                 # snapshot = self.cam.get_image()
                 # self.frame = list(pygame.image.tostring(snapshot, "RGB", False))
                 snapshot = self.cam.get_image()
+                timestamp = time.time()
                 snapshot1 = pygame.transform.scale(snapshot, self.resolution)
-                self.frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+                frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
                 if self.image_d == 1:
-                    self.frame = rgb2gray(self.frame)
+                    frame = rgb2gray(frame)
+                self.buffer.write(frame, timestamp)
 
             stop = datetime.now()
             s = 1 / self.framerate - (stop - start).total_seconds()
@@ -116,9 +169,6 @@ class Webcam(BaseCamera):
 
         self.cam.stop()
 
-    def run_threaded(self):
-        return self.frame
-
     def shutdown(self):
         # indicate that the thread should be stopped
         self.on = False
@@ -132,6 +182,8 @@ class CSICamera(BaseCamera):
     Credit: https://github.com/feicccccccc/donkeycar/blob/dev/donkeycar/parts/camera.py
     gstreamer init string from https://github.com/NVIDIA-AI-IOT/jetbot/blob/master/jetbot/camera.py
     '''
+    publishes_frames = True
+
     def gstreamer_pipeline(self, capture_width=3280, capture_height=2464, output_width=224, output_height=224, framerate=21, flip_method=0) :   
         return 'nvarguscamerasrc ! video/x-raw(memory:NVMM), width=%d, height=%d, format=(string)NV12, framerate=(fraction)%d/1 ! nvvidconv flip-method=%d ! nvvidconv ! video/x-raw, width=(int)%d, height=(int)%d, format=(string)BGRx ! videoconvert ! appsink' % (
                 capture_width, capture_height, framerate, flip_method, output_width, output_height)
@@ -143,10 +195,12 @@ class CSICamera(BaseCamera):
         gstreamer_flip = 2 - flip vertically
         gstreamer_flip = 3 - rotate CW 90
         '''
+        super().__init__()
         self.w = image_w
         self.h = image_h
         self.running = True
-        self.frame = None
+        # bgr capture buffer reused by the camera
+        self.bgr = None
         self.flip_method = gstreamer_flip
         self.capture_width = capture_width
         self.capture_height = capture_height
@@ -177,16 +231,19 @@ class CSICamera(BaseCamera):
 
     def poll_camera(self):
         import cv2
-        self.ret , frame = self.camera.read()
-        self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # capture and convert into the existing buffers, so no frame gets
+        # allocated
+        self.ret, self.bgr = self.camera.read(self.bgr)
+        timestamp = time.time()
+        if self.ret:
+            rgb = self.buffer.write_buffer(self.bgr.shape, self.bgr.dtype)
+            cv2.cvtColor(self.bgr, cv2.COLOR_BGR2RGB, dst=rgb)
+            self.buffer.publish(timestamp)
 
     def run(self):
         self.poll_camera()
-        return self.frame
+        return self.run_threaded()
 
-    def run_threaded(self):
-        return self.frame
-    
     def shutdown(self):
         self.running = False
         print('stopping CSICamera')
@@ -202,10 +259,11 @@ class V4LCamera(BaseCamera):
     python setup.py build
     pip install -e .
     '''
-    def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, dev_fn="/dev/video0", fourcc='MJPG'):
+    publishes_frames = True
 
+    def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, dev_fn="/dev/video0", fourcc='MJPG'):
+        super().__init__()
         self.running = True
-        self.frame = None
         self.image_w = image_w
         self.image_h = image_h
         self.dev_fn = dev_fn
@@ -245,7 +303,10 @@ class V4LCamera(BaseCamera):
             # Wait for the device to fill the buffer.
             select.select((self.video,), (), ())
             image_data = self.video.read_and_queue()
-            self.frame = jpg_conv.run(image_data)
+            timestamp = time.time()
+            frame = jpg_conv.run(image_data)
+            if frame is not None:
+                self.buffer.write(frame, timestamp)
 
     def shutdown(self):
         self.running = False
@@ -257,6 +318,7 @@ class MockCamera(BaseCamera):
     Fake camera. Returns only a single static frame
     '''
     def __init__(self, image_w=160, image_h=120, image_d=3, image=None):
+        super().__init__()
         if image is not None:
             self.frame = image
         else:
@@ -274,6 +336,7 @@ class ImageListCamera(BaseCamera):
     Use the images from a tub as a fake camera output
     '''
     def __init__(self, path_mask='~/mycar/data/**/images/*.jpg'):
+        super().__init__()
         self.image_filenames = glob.glob(os.path.expanduser(path_mask), recursive=True)
     
         def get_image_index(fnm):
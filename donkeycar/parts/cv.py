@@ -2,11 +2,29 @@ import time
 import cv2
 import numpy as np
 
+from donkeycar.memory import FrameBuffer
+
+
+def convert_color(img_arr, code, buffer, shape=None):
+    """
+    Converts img_arr into the next buffer of the FrameBuffer and returns
+    it as read-only view, so converting does not allocate a new image per
+    frame.
+    """
+    out = buffer.write_buffer(shape or img_arr.shape, img_arr.dtype)
+    cv2.cvtColor(img_arr, code, dst=out)
+    buffer.publish()
+    return buffer.read()[0]
+
+
 class ImgGreyscale():
 
+    def __init__(self):
+        self.buffer = FrameBuffer()
+
     def run(self, img_arr):
-        img_arr = cv2.cvtColor(img_arr, cv2.COLOR_RGB2GRAY)
-        return img_arr
+        return convert_color(img_arr, cv2.COLOR_RGB2GRAY, self.buffer,
+                             img_arr.shape[:2])
 
     def shutdown(self):
         pass
@@ -24,12 +42,14 @@ class ImgWriter():
 
 class ImgBGR2RGB():
 
+    def __init__(self):
+        self.buffer = FrameBuffer()
+
     def run(self, img_arr):
         if img_arr is None:
             return None
         try:
-            img_arr = cv2.cvtColor(img_arr, cv2.COLOR_BGR2RGB)
-            return img_arr
+            return convert_color(img_arr, cv2.COLOR_BGR2RGB, self.buffer)
         except:
             return None
 
@@ -38,11 +58,13 @@ class ImgBGR2RGB():
 
 class ImgRGB2BGR():
 
+    def __init__(self):
+        self.buffer = FrameBuffer()
+
     def run(self, img_arr):
         if img_arr is None:
             return None
-        img_arr = cv2.cvtColor(img_arr, cv2.COLOR_RGB2BGR)
-        return img_arr
+        return convert_color(img_arr, cv2.COLOR_RGB2BGR, self.buffer)
 
     def shutdown(self):
         pass
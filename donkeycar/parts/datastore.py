@@ -16,9 +16,13 @@ import sys
 import time
 
 import numpy as np
-import pandas as pd
 from PIL import Image
 
+from donkeycar.utils import LazyModule
+
+# pandas is only needed to read tubs into data frames, not to record them
+pd = LazyModule('pandas')
+
 
 class Tub(object):
     """
@@ -0,0 +1,442 @@
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from donkeycar.parts.datastore_v2 import Catalog, Manifest
+
+
+COLUMNS_DIR = 'columns'
+COLUMNS_METADATA = 'columns.json'
+
+# Fixed width column types, by manifest type
+FIXED_TYPES = {
+    'float': '<f8',
+    'int': '<i8',
+    'boolean': '|u1',
+}
+# Types stored as utf-8 strings in an offset table
+STRING_TYPES = ('str', 'image', 'image_array', 'gray16_array')
+# Private properties added to each record by Tub.write_record()
+PRIVATE_TYPES = {
+    '_index': 'int',
+    '_timestamp_ms': 'int',
+    '_session_id': 'str',
+}
+# Vectors are fixed width if all rows are numbers of the same length and
+# type, otherwise they are stored as json
+VECTOR_TYPES = ('vector', 'list')
+
+
+def vector_dtype(value):
+    """
+    Returns the fixed width type of a vector, None if it has to be stored
+    as json.
+    """
+    if not isinstance(value, list):
+        return None
+    if all(type(item) is int for item in value):
+        return '<i8'
+    if all(type(item) is float for item in value):
+        return '<f8'
+    return None
+
+
+def vector_layouts(records, keys):
+    """
+    Returns the width and fixed width type of the vector columns in keys
+    which can be stored fixed width over all records, by key.
+    """
+    layouts = dict()
+    json_keys = set()
+    for record in records:
+        for key in keys:
+            value = record.get(key)
+            if value is None or key in json_keys:
+                continue
+            dtype = vector_dtype(value)
+            layout = (len(value), dtype) if dtype else None
+            if layout is None or layouts.setdefault(key, layout) != layout:
+                json_keys.add(key)
+    return {key: layout for key, layout in layouts.items()
+            if key not in json_keys}
+
+
+class Column(object):
+    """
+    A single column of a ColumnarCatalog. \n
+    Fixed width values are stored in `<name>.bin`, strings are stored in
+    `<name>.dat` with the end offset of each row in `<name>.off`. Every
+    column has a `<name>.valid` file which flags the rows holding a value.
+    Vector columns are fixed width when they have a width and a vector
+    dtype, see vector_layouts().
+    """
+
+    def __init__(self, base_path, key, input_type, file_name, width=None,
+                 vector_type=None):
+        self.base_path = base_path
+        self.key = key
+        self.input_type = input_type
+        self.file_name = file_name
+        self.width = width
+        if input_type in VECTOR_TYPES:
+            self.fixed = vector_type is not None
+            dtype = vector_type
+        else:
+            self.fixed = input_type in FIXED_TYPES
+            dtype = FIXED_TYPES.get(input_type)
+        self.dtype = np.dtype(dtype if self.fixed else '<u8')
+        self._data = None
+        self._offsets = None
+        self._valid = None
+        self._string_length = 0
+
+    def _path(self, extension):
+        return os.path.join(self.base_path, f'{self.file_name}{extension}')
+
+    def metadata(self):
+        vector_fixed = self.fixed and self.input_type in VECTOR_TYPES
+        return {'key': self.key, 'type': self.input_type,
+                'file_name': self.file_name, 'width': self.width,
+                'vector_dtype': self.dtype.str if vector_fixed else None}
+
+    def append(self, values):
+        """
+        Appends a batch of values, None marks a missing value.
+        """
+        valid = np.array([value is not None for value in values],
+                         dtype=np.uint8)
+        with open(self._path('.valid'), 'ab') as f:
+            f.write(valid.tobytes())
+        if self.fixed:
+            self._append_fixed(values)
+        else:
+            self._append_strings(values)
+
+    def _append_fixed(self, values):
+        if self.input_type in VECTOR_TYPES:
+            for value in values:
+                if value is None:
+                    continue
+                if self.width is None:
+                    self.width = len(value)
+                if len(value) != self.width \
+                        or vector_dtype(value) != self.dtype.str:
+                    raise ValueError(f'Column {self.key} expects vectors of '
+                                     f'length {self.width} and type '
+                                     f'{self.dtype}, got {value}')
+            shape = (len(values), self.width or 0)
+            empty = [0] * (self.width or 0)
+            values = [empty if value is None else value for value in values]
+        else:
+            shape = (len(values),)
+            values = [0 if value is None else value for value in values]
+        data = np.array(values, dtype=self.dtype).reshape(shape)
+        with open(self._path('.bin'), 'ab') as f:
+            f.write(data.tobytes())
+
+    def _append_strings(self, values):
+        contents = list()
+        offsets = np.zeros(len(values), dtype=self.dtype)
+        for i, value in enumerate(values):
+            if value is not None:
+                if self.input_type not in STRING_TYPES:
+                    value = json.dumps(value)
+                encoded = value.encode('utf-8')
+                contents.append(encoded)
+                self._string_length += len(encoded)
+            offsets[i] = self._string_length
+        with open(self._path('.dat'), 'ab') as f:
+            f.write(b''.join(contents))
+        with open(self._path('.off'), 'ab') as f:
+            f.write(offsets.tobytes())
+
+    def truncate(self, count):
+        """
+        Drops rows beyond count, which an interrupted append leaves behind.
+        """
+        def _truncate(extension, size):
+            path = self._path(extension)
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+
+        _truncate('.valid', count)
+        if self.fixed:
+            width = (self.width or 0) \
+                if self.input_type in VECTOR_TYPES else 1
+            _truncate('.bin', count * width * self.dtype.itemsize)
+        else:
+            _truncate('.off', count * self.dtype.itemsize)
+            self._string_length = 0
+            if count > 0:
+                offsets = np.fromfile(self._path('.off'), dtype=self.dtype,
+                                      count=count)
+                self._string_length = int(offsets[-1])
+            _truncate('.dat', self._string_length)
+
+    def _memmap(self, extension, dtype, shape):
+        if shape[0] == 0 or (len(shape) > 1 and shape[1] == 0):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self._path(extension), dtype=dtype, mode='r',
+                         shape=shape)
+
+    def open(self, count):
+        self._valid = self._memmap('.valid', np.uint8, (count,))
+        if self.fixed:
+            shape = (count, self.width or 0) \
+                if self.input_type in VECTOR_TYPES else (count,)
+            self._data = self._memmap('.bin', self.dtype, shape)
+        else:
+            self._offsets = self._memmap('.off', self.dtype, (count,))
+            length = int(self._offsets[-1]) if count > 0 else 0
+            self._data = self._memmap('.dat', np.uint8, (length,))
+
+    def values(self):
+        """
+        Returns the column as a read-only memory mapped array for fixed
+        width columns, rows without a value hold 0. Other columns are
+        returned as an object array, which holds None for missing values.
+        """
+        if self.fixed:
+            return self._data
+        # Filled one by one, so lists stay objects of a 1d array
+        values = np.empty(len(self._valid), dtype=object)
+        for i in range(len(values)):
+            values[i] = self.value(i)
+        return values
+
+    def valid(self):
+        return self._valid
+
+    def value(self, row):
+        if not self._valid[row]:
+            return None
+        if self.fixed:
+            value = self._data[row]
+            if self.input_type in VECTOR_TYPES:
+                return value.tolist()
+            elif self.input_type == 'float':
+                return float(value)
+            elif self.input_type == 'int':
+                return int(value)
+            return bool(value)
+        start = int(self._offsets[row - 1]) if row > 0 else 0
+        end = int(self._offsets[row])
+        value = bytes(self._data[start:end]).decode('utf-8')
+        if self.input_type not in STRING_TYPES:
+            value = json.loads(value)
+        return value
+
+    def close(self):
+        self._data = None
+        self._offsets = None
+        self._valid = None
+
+
+class ColumnarCatalog(object):
+    """
+    A catalog which stores each input of the manifest in its own column
+    file, so numeric inputs can be memory mapped as NumPy arrays. \n
+    The catalog lives in the `columns` folder of a tub. `columns.json` holds
+    the column layout and the number of rows, which is only updated once a
+    batch of rows has been fully appended. layouts holds the width and type
+    of the vector columns stored fixed width, see vector_layouts(), others
+    are stored as json.
+    """
+
+    def __init__(self, base_path, inputs=[], types=[], read_only=False,
+                 layouts={}):
+        self.base_path = Path(os.path.expanduser(base_path))
+        self.metadata_path = self.base_path / COLUMNS_METADATA
+        self.read_only = read_only
+        self.columns = dict()
+        self.count = 0
+        self.current_index = 0
+        if self.metadata_path.exists():
+            self._read_metadata()
+            if not read_only:
+                for column in self.columns.values():
+                    column.truncate(self.count)
+        else:
+            if read_only:
+                raise FileNotFoundError(f'No columnar catalog at '
+                                        f'{self.base_path.as_posix()}')
+            self.base_path.mkdir(parents=True, exist_ok=True)
+            types_by_key = dict(zip(inputs, types))
+            types_by_key.update(PRIVATE_TYPES)
+            for i, (key, input_type) in enumerate(types_by_key.items()):
+                file_name = f'{i}_{key.replace("/", "_")}'
+                width, dtype = layouts.get(key, (None, None))
+                self.columns[key] = Column(self.base_path.as_posix(), key,
+                                           input_type, file_name, width,
+                                           dtype)
+            self._write_metadata()
+        if read_only:
+            for column in self.columns.values():
+                column.open(self.count)
+
+    @classmethod
+    def exists(cls, tub_path):
+        return os.path.exists(os.path.join(tub_path, COLUMNS_DIR,
+                                           COLUMNS_METADATA))
+
+    def _read_metadata(self):
+        with open(self.metadata_path, 'r') as f:
+            metadata = json.load(f)
+        self.count = metadata['count']
+        self.current_index = metadata['current_index']
+        for entry in metadata['columns']:
+            column = Column(self.base_path.as_posix(), entry['key'],
+                            entry['type'], entry['file_name'], entry['width'],
+                            entry.get('vector_dtype', '<f8'))
+            self.columns[column.key] = column
+
+    def _write_metadata(self):
+        metadata = dict()
+        metadata['count'] = self.count
+        metadata['current_index'] = self.current_index
+        metadata['columns'] = [column.metadata()
+                               for column in self.columns.values()]
+        # Write and rename, so the row count is updated atomically
+        temp_path = self.metadata_path.with_suffix('.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(metadata, f)
+        os.replace(temp_path, self.metadata_path)
+
+    def write_records(self, records):
+        if self.read_only:
+            raise RuntimeError(f'Columnar catalog {self.base_path} is '
+                               f'read-only.')
+        if not records:
+            return
+        for key, column in self.columns.items():
+            column.append([record.get(key) for record in records])
+        self.count += len(records)
+        self.current_index = records[-1]['_index'] + 1
+        self._write_metadata()
+
+    def record(self, row):
+        record = dict()
+        for key, column in self.columns.items():
+            value = column.value(row)
+            if value is not None:
+                record[key] = value
+        return record
+
+    def get_records(self, indexes):
+        """
+        Returns the records with the given record indexes (`_index`),
+        indexes without a row are skipped.
+        """
+        row_indexes = self.column('_index')
+        rows = np.searchsorted(row_indexes, indexes)
+        records = list()
+        for index, row in zip(indexes, rows):
+            if row < self.count and row_indexes[row] == index:
+                records.append(self.record(row))
+        return records
+
+    def column(self, key):
+        return self.columns[key].values()
+
+    def valid(self, key):
+        return self.columns[key].valid()
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+
+    def __len__(self):
+        return self.count
+
+
+class ColumnarIterator(object):
+    """
+    An iterator over the records of a ColumnarCatalog, which skips records
+    marked as deleted in the manifest.
+    """
+    def __init__(self, catalog, deleted_indexes=set()):
+        self.catalog = catalog
+        self.deleted_indexes = deleted_indexes
+        self.indexes = catalog.column('_index')
+        self.current_row = 0
+
+    def __next__(self):
+        while self.current_row < len(self.catalog):
+            row = self.current_row
+            self.current_row += 1
+            if int(self.indexes[row]) in self.deleted_indexes:
+                continue
+            return self.catalog.record(row)
+        raise StopIteration('No more records')
+
+    next = __next__
+
+    def __iter__(self):
+        return self
+
+
+def catalog_records(tub_path, manifest):
+    """ Yields the records of the json catalogs of a tub, in order """
+    for catalog_path in manifest.catalog_paths:
+        catalog = Catalog(tub_path / catalog_path, read_only=True)
+        try:
+            catalog.seekable.seek_line_start(1)
+            contents = catalog.seekable.readline()
+            while contents:
+                try:
+                    yield json.loads(contents)
+                except Exception:
+                    print(f'Ignoring record {contents}')
+                contents = catalog.seekable.readline()
+        finally:
+            catalog.close()
+
+
+def convert_to_columnar(tub_path, batch_size=1000):
+    """
+    Converts the json catalogs of a tub into a columnar catalog. Records
+    marked as deleted are converted too, so they can still be restored.
+    The catalogs are read twice, first to find the vector columns which
+    can be stored fixed width.
+
+    :param tub_path:    path of the tub
+    :param batch_size:  number of records appended to the columns at once
+    :return:            number of converted records
+    """
+    tub_path = Path(os.path.expanduser(tub_path)).absolute()
+    manifest = Manifest(tub_path, read_only=True)
+    columns_path = tub_path / COLUMNS_DIR
+    temp_path = tub_path / f'{COLUMNS_DIR}.tmp'
+    if temp_path.exists():
+        shutil.rmtree(temp_path)
+    vector_keys = [key for key, input_type
+                   in zip(manifest.inputs, manifest.types)
+                   if input_type in VECTOR_TYPES]
+    layouts = vector_layouts(catalog_records(tub_path, manifest),
+                             vector_keys) if vector_keys else {}
+    columnar = ColumnarCatalog(temp_path, inputs=manifest.inputs,
+                               types=manifest.types, layouts=layouts)
+    count = 0
+    try:
+        batch = list()
+        for record in catalog_records(tub_path, manifest):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                columnar.write_records(batch)
+                batch.clear()
+        columnar.write_records(batch)
+        # Mark the columns as up to date with the json catalogs
+        columnar.current_index = manifest.current_index
+        columnar._write_metadata()
+        count = len(columnar)
+    finally:
+        columnar.close()
+        manifest.close()
+
+    if columns_path.exists():
+        shutil.rmtree(columns_path)
+    os.replace(temp_path, columns_path)
+    return count
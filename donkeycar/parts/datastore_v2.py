@@ -1,12 +1,207 @@
+import bisect
+import itertools
 import json
 import mmap
 import os
+import threading
 import time
+from array import array
 from pathlib import Path
 
 
 NEWLINE = '\n'
 NEWLINE_STRIP = '\r\n'
+DELETED_FILE = 'deleted.bitmap'
+
+
+class OffsetIndex(object):
+    """
+    A persistent, append only list of cumulative line end offsets, stored
+    as uint64 values. \n
+    Entries which already exist when the index is opened are memory mapped,
+    so opening an index is O(1) regardless of its length.
+    """
+    ITEM_SIZE = 8
+
+    def __init__(self, path, read_only=False):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.file = open(self.path, 'rb' if read_only else 'a+b')
+        self._map()
+
+    def _map(self):
+        size = os.fstat(self.file.fileno()).st_size
+        usable = size - size % OffsetIndex.ITEM_SIZE
+        if usable != size and not self.read_only:
+            # Drop an entry which was only partially written
+            self.file.truncate(usable)
+        self.mmap = None
+        self.view = memoryview(b'')
+        if usable > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), length=usable,
+                                  access=mmap.ACCESS_READ)
+            self.view = memoryview(self.mmap)
+        self.mapped = self.view.cast('Q')
+        self.appended = array('Q')
+
+    def _unmap(self):
+        self.mapped.release()
+        self.view.release()
+        if self.mmap is not None:
+            self.mmap.close()
+
+    def __len__(self):
+        return len(self.mapped) + len(self.appended)
+
+    def __getitem__(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if index < 0 or index >= length:
+            raise IndexError(f'Offset index {index} out of range')
+        mapped_length = len(self.mapped)
+        if index < mapped_length:
+            return self.mapped[index]
+        return self.appended[index - mapped_length]
+
+    def __iter__(self):
+        return itertools.chain(self.mapped.tolist(), self.appended)
+
+    def __delitem__(self, key):
+        # Only supports truncation, i.e. del index[length:]
+        if not isinstance(key, slice) or key.stop is not None \
+                or key.step is not None:
+            raise TypeError('OffsetIndex only supports del index[length:]')
+        self.truncate(key.start or 0)
+
+    def append(self, offset):
+        self.extend([offset])
+
+    def extend(self, offsets):
+        if self.read_only:
+            raise RuntimeError(f'OffsetIndex {self.path} is read-only.')
+        offsets = array('Q', offsets)
+        self.file.write(offsets.tobytes())
+        self.file.flush()
+        self.appended.extend(offsets)
+
+    def truncate(self, length):
+        if length >= len(self):
+            return
+        if self.read_only:
+            raise RuntimeError(f'OffsetIndex {self.path} is read-only.')
+        self._unmap()
+        self.file.truncate(length * OffsetIndex.ITEM_SIZE)
+        self.file.flush()
+        self._map()
+
+    def clear(self):
+        self.truncate(0)
+
+    def sync(self):
+        if self.read_only:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self._unmap()
+        self.file.close()
+
+
+class IndexBitmap(object):
+    """
+    A persistent set of record indexes, stored as a bitmap with one bit per
+    index. Membership tests and the length are O(1), adding or removing
+    indexes only rewrites the bytes which changed. The file is created when
+    the first index gets added. When indexes are given, the bitmap is brought
+    in line with them.
+    """
+    # Number of set bits, by byte value
+    BIT_COUNTS = bytes(bin(value).count('1') for value in range(256))
+
+    def __init__(self, path, read_only=False, indexes=None):
+        self.path = Path(path)
+        self.read_only = read_only
+        self.file = None
+        self.bitmap = bytearray()
+        if self.path.exists():
+            with open(self.path, 'rb') as f:
+                self.bitmap = bytearray(f.read())
+        self.count = sum(self.bitmap.translate(IndexBitmap.BIT_COUNTS))
+        if indexes is not None:
+            indexes = set(int(index) for index in indexes)
+            current = set(self)
+            # Read-only bitmaps are only changed in memory
+            self._set(indexes - current, True, persist=not read_only)
+            self._set(current - indexes, False, persist=not read_only)
+
+    def _set(self, indexes, value, persist=True):
+        first, last = None, None
+        for index in indexes:
+            index = int(index)
+            if index < 0:
+                raise ValueError(f'Invalid record index {index}')
+            position, mask = index >> 3, 1 << (index & 7)
+            if position >= len(self.bitmap):
+                if not value:
+                    continue
+                self.bitmap.extend(bytes(position + 1 - len(self.bitmap)))
+            current = self.bitmap[position]
+            if bool(current & mask) == value:
+                continue
+            self.bitmap[position] = current | mask if value \
+                else current & ~mask
+            self.count += 1 if value else -1
+            first = position if first is None else min(first, position)
+            last = position if last is None else max(last, position)
+        if persist and first is not None:
+            self._write(first, last + 1)
+
+    def _write(self, start, end):
+        if self.file is None:
+            mode = 'r+b' if self.path.exists() else 'w+b'
+            self.file = open(self.path, mode)
+        self.file.seek(start)
+        self.file.write(self.bitmap[start:end])
+        self.file.flush()
+
+    def update(self, indexes):
+        if self.read_only:
+            raise RuntimeError(f'IndexBitmap {self.path} is read-only.')
+        self._set(indexes, True)
+
+    def difference_update(self, indexes):
+        if self.read_only:
+            raise RuntimeError(f'IndexBitmap {self.path} is read-only.')
+        self._set(indexes, False)
+
+    def __contains__(self, index):
+        if index < 0:
+            return False
+        position = index >> 3
+        return position < len(self.bitmap) \
+            and bool(self.bitmap[position] & (1 << (index & 7)))
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # Yields the indexes in ascending order
+        for position, value in enumerate(self.bitmap):
+            if value:
+                for bit in range(8):
+                    if value & (1 << bit):
+                        yield (position << 3) + bit
+
+    def sync(self):
+        if self.file is not None:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
 
 
 class Seekable(object):
@@ -14,39 +209,53 @@ class Seekable(object):
     A seekable file reader, writer which deals with newline delimited
     records. \n
     This reader maintains an index of line lengths, so seeking a line is a
-    O(1) operation.
+    O(1) operation. The cumulative line lengths can be kept in a persistent
+    OffsetIndex, otherwise they are rebuilt from line_lengths or by reading
+    the file.
     """
 
-    def __init__(self, file, read_only=False, line_lengths=list()):
-        self.line_lengths = list()
-        self.cumulative_lengths = list()
+    def __init__(self, file, read_only=False, line_lengths=list(),
+                 index=None):
+        self.cumulative_lengths = index if index is not None else list()
         self.method = 'r' if read_only else 'a+'
         self.file = open(file, self.method, newline=NEWLINE)
         # If file is read only improve performance by memory mapping the file.
-        if self.method == 'r':
+        # Empty files can not be memory mapped.
+        if self.method == 'r' and os.fstat(self.file.fileno()).st_size > 0:
             self.file = mmap.mmap(self.file.fileno(), length=0,
                                   access=mmap.ACCESS_READ)
         self.total_length = 0
-        if len(line_lengths) <= 0:
-            self._read_contents()
-        else:
-            self.line_lengths.extend(line_lengths)
-            for line_length in self.line_lengths:
+        if len(self.cumulative_lengths) > 0:
+            self.total_length = self.cumulative_lengths[-1]
+        elif len(line_lengths) > 0:
+            cumulative_lengths = list()
+            for line_length in line_lengths:
                 self.total_length += line_length
-                self.cumulative_lengths.append(self.total_length)
+                cumulative_lengths.append(self.total_length)
+            self.cumulative_lengths.extend(cumulative_lengths)
+        else:
+            self._read_contents()
+
+    @property
+    def line_lengths(self):
+        line_lengths = list()
+        previous = 0
+        for offset in self.cumulative_lengths:
+            line_lengths.append(offset - previous)
+            previous = offset
+        return line_lengths
 
     def _read_contents(self):
-        self.line_lengths.clear()
         self.cumulative_lengths.clear()
         self.total_length = 0
+        cumulative_lengths = list()
         self.file.seek(0)
         contents = self.file.readline()
         while len(contents) > 0:
-            line_length = len(contents)
-            self.line_lengths.append(line_length)
-            self.total_length += line_length
-            self.cumulative_lengths.append(self.total_length)
+            self.total_length += len(contents)
+            cumulative_lengths.append(self.total_length)
             contents = self.file.readline()
+        self.cumulative_lengths.extend(cumulative_lengths)
         self.seek_end_of_file()
 
     def __enter__(self):
@@ -62,12 +271,60 @@ class Seekable(object):
         else:
             line = f'{contents}{NEWLINE}'
 
-        offset = len(line)
-        self.total_length += offset
-        self.line_lengths.append(offset)
-        self.cumulative_lengths.append(self.total_length)
         self.file.write(line)
         self.file.flush()
+        self.total_length += len(line)
+        self.cumulative_lengths.append(self.total_length)
+
+    def writelines(self, lines):
+        """
+        Appends a batch of lines with a single write and flush.
+        """
+        if self.method == 'r':
+            raise RuntimeError(f'Seekable {self.file} is read-only.')
+
+        contents = list()
+        cumulative_lengths = list()
+        total_length = self.total_length
+        for line in lines:
+            if not line.endswith(NEWLINE):
+                line = f'{line}{NEWLINE}'
+            total_length += len(line)
+            cumulative_lengths.append(total_length)
+            contents.append(line)
+        self.file.write(''.join(contents))
+        self.file.flush()
+        self.total_length = total_length
+        self.cumulative_lengths.extend(cumulative_lengths)
+
+    def sync(self):
+        """
+        Forces written lines to stable storage (fsync).
+        """
+        if self.method == 'r':
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def drop_partial_line(self):
+        """
+        Truncates a trailing line which is not newline terminated, which is
+        what an interrupted write leaves behind. Returns True if the file was
+        truncated.
+        """
+        lines = self.lines()
+        if lines <= 0:
+            return False
+        current_offset = self.file.tell()
+        self.seek_line_start(lines)
+        contents = self.file.readline()
+        self.file.seek(current_offset)
+        if isinstance(contents, bytes):
+            contents = contents.decode(encoding='utf-8')
+        if contents.endswith(NEWLINE):
+            return False
+        self.truncate_until_end(lines - 1)
+        return True
 
     def _line_start_offset(self, line_number):
         return self._offset_until(line_number - 1)
@@ -94,8 +351,7 @@ class Seekable(object):
         self.file.seek(self.total_length)
 
     def truncate_until_end(self, line_number):
-        self.line_lengths = self.line_lengths[:line_number]
-        self.cumulative_lengths = self.cumulative_lengths[:line_number]
+        del self.cumulative_lengths[line_number:]
         self.total_length = self.cumulative_lengths[-1] \
             if len(self.cumulative_lengths) > 0 else 0
         self.seek_end_of_file()
@@ -123,7 +379,7 @@ class Seekable(object):
                 self.writeline(line)
 
     def lines(self):
-        return len(self.line_lengths)
+        return len(self.cumulative_lengths)
 
     def has_content(self):
         return self.lines() > 0
@@ -142,29 +398,70 @@ class Catalog(object):
     [ json object record ] \n
     [ json object record ] \n
     ...
+
+    Line offsets are kept in a binary `.catalog_index` file next to the
+    catalog. Catalogs written by older versions store their line lengths in
+    the catalog manifest, they get moved into the index when the catalog is
+    opened for writing.
     '''
     def __init__(self, path, read_only=False, start_index=0):
         self.path = Path(os.path.expanduser(path))
         self.manifest = CatalogMetadata(self.path,
                                         read_only=read_only,
                                         start_index=start_index)
+        index_path = self.path.with_suffix('.catalog_index')
+        self.index = None
+        if not read_only or index_path.exists():
+            self.index = OffsetIndex(index_path, read_only=read_only)
+        line_lengths = self.manifest.line_lengths()
+        if self.index is not None and len(self.index) > 0:
+            line_lengths = list()
         self.seekable = Seekable(self.path.as_posix(),
-                                 line_lengths=self.manifest.line_lengths(),
-                                 read_only=read_only)
+                                 line_lengths=line_lengths,
+                                 read_only=read_only,
+                                 index=self.index)
+        if not read_only:
+            if self.manifest.line_lengths():
+                # Line lengths now live in the index
+                self.manifest.update_line_lengths(list())
+            self._recover()
+
+    def _recover(self):
+        """
+        Reconciles the catalog with its line lengths after an interrupted
+        write. The catalog file is the source of truth, a trailing partial
+        record is discarded.
+        """
+        size = os.path.getsize(self.path.as_posix())
+        if size == self.seekable.total_length:
+            return
+        print(f'Recovering catalog {self.path.as_posix()}')
+        self.seekable._read_contents()
+        self.seekable.drop_partial_line()
 
     def _exit_handler(self):
         self.close()
 
     def write_record(self, record):
-        # Add record and update manifest
-        contents = json.dumps(record, allow_nan=False, sort_keys=True)
-        self.seekable.writeline(contents)
-        line_lengths = self.seekable.line_lengths
-        self.manifest.update_line_lengths(line_lengths)
+        self.write_records([record])
+
+    def write_records(self, records):
+        # Append all records, the index is appended by the seekable
+        lines = [json.dumps(record, allow_nan=False, sort_keys=True)
+                 for record in records]
+        self.seekable.writelines(lines)
+
+    def sync(self):
+        self.seekable.sync()
+        if self.index is not None:
+            self.index.sync()
+        self.manifest.sync()
 
     def close(self):
         self.manifest.close()
         self.seekable.close()
+        if self.index is not None:
+            self.index.close()
 
 
 class CatalogMetadata(object):
@@ -210,6 +507,9 @@ class CatalogMetadata(object):
         self.seekeable.truncate_until_end(0)
         self.seekeable.writeline(contents)
 
+    def sync(self):
+        self.seekeable.sync()
+
     def close(self):
         self.seekeable.close()
 
@@ -223,10 +523,29 @@ class Manifest(object):
     [ json object with user metadata ]\n
     [ json object with manifest metadata ]\n
     [ json object with catalog metadata ]\n
+
+    Records can be written in batches. They are buffered until `batch_size`
+    records are pending or the oldest pending record is older than
+    `batch_ms`, and then committed to the catalog and the manifest in one
+    go. A timer commits the batch after `batch_ms` also when no further
+    record gets written, like when recording stops. `fsync` controls the
+    durability boundary: 'never' only flushes to the OS, 'batch' fsyncs
+    every committed batch and 'close' fsyncs when the manifest gets closed. Buffered records are lost on a crash, a partially
+    committed batch is recovered when the manifest is opened again.
+
+    Indexes of records marked as deleted are kept in a bitmap file next to
+    the manifest, see IndexBitmap. Manifests written by older versions list
+    them in the catalog metadata, they get moved into the bitmap.
     '''
 
+    FSYNC_POLICIES = ('never', 'batch', 'close')
+
     def __init__(self, base_path, inputs=[], types=[], metadata=[],
-                 max_len=1000, read_only=False):
+                 max_len=1000, read_only=False, batch_size=1, batch_ms=0,
+                 fsync='never'):
+        if fsync not in Manifest.FSYNC_POLICIES:
+            raise ValueError(f'Unknown fsync policy {fsync}, expected one of '
+                             f'{Manifest.FSYNC_POLICIES}')
         self.base_path = Path(os.path.expanduser(base_path)).absolute()
         self.manifest_path = Path(os.path.join(self.base_path, 'manifest.json'))
         self.inputs = inputs
@@ -239,7 +558,20 @@ class Manifest(object):
         self.current_index = 0
         self.catalog_paths = list()
         self.catalog_metadata = dict()
-        self.deleted_indexes = set()
+        self.deleted_file = DELETED_FILE
+        self.deleted_indexes = None
+        self.batch_size = max(1, batch_size)
+        self.batch_ms = batch_ms
+        self.fsync = fsync
+        self._pending = list()
+        self._pending_since = None
+        # commits the batch after batch_ms, see write_record()
+        self._timer = None
+        self._lock = threading.RLock()
+        # Lazily loaded state for random access, see get_records()
+        self._catalog_starts = None
+        self._read_catalogs = dict()
+        self._sorted_deleted = None
         self._updated_session = False
         has_catalogs = False
 
@@ -257,6 +589,8 @@ class Manifest(object):
                 print(f'Created a new datastore at {self.base_path.as_posix()}')
             self.seekeable = Seekable(self.manifest_path, read_only=self.read_only)
 
+        if self.deleted_indexes is None:
+            self._open_deleted()
         if not has_catalogs:
             self._write_contents()
             self._add_catalog()
@@ -267,50 +601,116 @@ class Manifest(object):
             self.current_catalog = Catalog(last_known_catalog,
                                            read_only=self.read_only,
                                            start_index=self.current_index)
+            if not self.read_only:
+                self._recover()
         # Create a new session_id, which will be added to each record in the
         # tub, when Tub.write_record() is called.
         self.session_id = self.create_new_session()
 
     def write_record(self, record):
-        new_catalog = self.current_index > 0 \
-                      and (self.current_index % self.max_len) == 0
-        if new_catalog:
-            self._add_catalog()
-
-        self.current_catalog.write_record(record)
-        self.current_index += 1
-        # Update metadata to keep track of the last index
-        self._update_catalog_metadata(update=True)
-        # Set session_id update status to True if this method is called at
-        # least once. Then session id metadata  will be updated when the
-        # session gets closed
-        if not self._updated_session:
-            self._updated_session = True
+        with self._lock:
+            new_catalog = self.current_index > 0 \
+                          and (self.current_index % self.max_len) == 0
+            if new_catalog:
+                self.flush()
+                self._add_catalog()
+
+            if not self._pending:
+                self._pending_since = time.time()
+            self._pending.append(record)
+            self.current_index += 1
+            if self._batch_due():
+                self.flush()
+            elif self.batch_ms > 0 and self._timer is None:
+                self._timer = threading.Timer(self.batch_ms / 1000,
+                                              self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            # Set session_id update status to True if this method is called
+            # at least once. Then session id metadata  will be updated when
+            # the session gets closed
+            if not self._updated_session:
+                self._updated_session = True
+
+    def _batch_due(self):
+        if len(self._pending) >= self.batch_size:
+            return True
+        elapsed_ms = (time.time() - self._pending_since) * 1000
+        return self.batch_ms > 0 and elapsed_ms >= self.batch_ms
+
+    def flush(self):
+        """
+        Commits all buffered records. Catalog lines are appended first, then
+        the catalog line lengths and finally the manifest metadata.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            self.current_catalog.write_records(self._pending)
+            self._pending.clear()
+            self._pending_since = None
+            # Update metadata to keep track of the last index
+            self._update_catalog_metadata(update=True)
+            if self.fsync == 'batch':
+                self.sync()
+
+    def sync(self):
+        self.current_catalog.sync()
+        self.deleted_indexes.sync()
+        self.seekeable.sync()
+
+    def _recover(self):
+        # The last catalog is the source of truth for the current index, it
+        # can disagree with the manifest after an interrupted batch.
+        catalog_manifest = self.current_catalog.manifest
+        current_index = catalog_manifest.start_index() \
+            + self.current_catalog.seekable.lines()
+        if current_index != self.current_index:
+            print(f'Recovering manifest index {self.current_index} -> '
+                  f'{current_index}')
+            self.current_index = current_index
+            self._update_catalog_metadata(update=True)
 
     def delete_records(self, record_indexes):
         # Does not actually delete the record, but marks it as deleted.
         if isinstance(record_indexes, int):
             record_indexes = {record_indexes}
-        self.deleted_indexes.update(record_indexes)
-        self._update_catalog_metadata(update=True)
+        with self._lock:
+            self.flush()
+            self.deleted_indexes.update(record_indexes)
+            self._sorted_deleted = None
+            self._update_catalog_metadata(update=True)
 
     def restore_records(self, record_indexes):
         # Does not actually delete the record, but marks it as deleted.
         if isinstance(record_indexes, int):
             record_indexes = {record_indexes}
-        self.deleted_indexes.difference_update(record_indexes)
-        self._update_catalog_metadata(update=True)
+        with self._lock:
+            self.flush()
+            self.deleted_indexes.difference_update(record_indexes)
+            self._sorted_deleted = None
+            self._update_catalog_metadata(update=True)
 
     def _add_catalog(self):
         current_length = len(self.catalog_paths)
         catalog_name = f'catalog_{current_length}.catalog'
         catalog_path = os.path.join(self.base_path, catalog_name)
+        # Catalogs are not numbered consecutively after a compaction
+        while os.path.exists(catalog_path):
+            current_length += 1
+            catalog_name = f'catalog_{current_length}.catalog'
+            catalog_path = os.path.join(self.base_path, catalog_name)
         current_catalog = self.current_catalog
         self.current_catalog = Catalog(catalog_path,
                                        start_index=self.current_index,
                                        read_only=self.read_only)
         # Store relative paths
         self.catalog_paths.append(catalog_name)
+        if self._catalog_starts is not None:
+            self._catalog_starts.append(self.current_index)
         self._update_catalog_metadata(update=True)
         if current_catalog:
             current_catalog.close()
@@ -331,7 +731,19 @@ class Manifest(object):
         self.catalog_paths = catalog_metadata['paths']
         self.current_index = catalog_metadata['current_index']
         self.max_len = catalog_metadata['max_len']
-        self.deleted_indexes = set(catalog_metadata['deleted_indexes'])
+        self.deleted_file = catalog_metadata.get('deleted_file',
+                                                 DELETED_FILE)
+        # Older versions only know the list of deleted indexes, which wins
+        # over the bitmap if they changed it
+        self._open_deleted(catalog_metadata.get('deleted_indexes'))
+
+    def _open_deleted(self, indexes=None):
+        if self.deleted_indexes is not None:
+            self.deleted_indexes.close()
+        self.deleted_indexes = IndexBitmap(self.base_path / self.deleted_file,
+                                           read_only=self.read_only,
+                                           indexes=indexes)
+        self._sorted_deleted = None
 
     def _write_contents(self):
         self.seekeable.truncate_until_end(0)
@@ -341,18 +753,58 @@ class Manifest(object):
         self.seekeable.writeline(json.dumps(self.manifest_metadata))
         self._update_catalog_metadata(update=False)
 
-    def _update_catalog_metadata(self, update=True):
-        if update:
-            self.seekeable.truncate_until_end(4)
-        # Catalog metadata
+    def _build_catalog_metadata(self):
         catalog_metadata = dict()
         catalog_metadata['paths'] = self.catalog_paths
         catalog_metadata['current_index'] = self.current_index
         catalog_metadata['max_len'] = self.max_len
-        catalog_metadata['deleted_indexes'] = list(self.deleted_indexes)
+        catalog_metadata['deleted_file'] = self.deleted_file
+        # Kept next to the bitmap, for readers of older versions
+        catalog_metadata['deleted_indexes'] = self._deleted_list()
+        return catalog_metadata
+
+    def _update_catalog_metadata(self, update=True):
+        if update:
+            self.seekeable.truncate_until_end(4)
+        # Catalog metadata
+        catalog_metadata = self._build_catalog_metadata()
         self.catalog_metadata = catalog_metadata
         self.seekeable.writeline(json.dumps(catalog_metadata))
 
+    def replace_catalogs(self, catalog_paths, current_index):
+        """
+        Atomically replaces manifest.json with a manifest pointing to a new
+        set of catalogs, without deleted indexes. Used by tub compaction, the
+        manifest needs to be opened again afterwards.
+        """
+        self.catalog_paths = list(catalog_paths)
+        self.current_index = current_index
+        # Point to a new, empty bitmap, so the old one stays valid until the
+        # manifest is replaced
+        old_deleted_path = self.base_path / self.deleted_file
+        self.deleted_file = self._new_deleted_file()
+        self._open_deleted()
+        lines = [json.dumps(self.inputs), json.dumps(self.types),
+                 json.dumps(self.metadata),
+                 json.dumps(self.manifest_metadata),
+                 json.dumps(self._build_catalog_metadata())]
+        temp_path = self.manifest_path.with_suffix('.tmp')
+        with open(temp_path, 'w', newline=NEWLINE) as f:
+            f.write(''.join(f'{line}{NEWLINE}' for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.manifest_path)
+        if old_deleted_path.exists():
+            os.remove(old_deleted_path)
+
+    def _new_deleted_file(self):
+        generation = 0
+        name = DELETED_FILE
+        while (self.base_path / name).exists() or name == self.deleted_file:
+            generation += 1
+            name = f'deleted_{generation}.bitmap'
+        return name
+
     def create_new_session(self):
         """ Creates a new session id and appends it to the metadata."""
         sessions = self.manifest_metadata.get('sessions', {})
@@ -375,12 +827,120 @@ class Manifest(object):
             manifest.json"""
         # If records were received, write updated session_id dictionary into
         # the metadata, otherwise keep the session_id information unchanged
-        if self._updated_session:
-            self.seekeable.update_line(4, json.dumps(self.manifest_metadata))
-        self.current_catalog.close()
-        self.seekeable.close()
+        with self._lock:
+            if not self.read_only:
+                self.flush()
+            if self._updated_session:
+                self.seekeable.update_line(4,
+                                           json.dumps(self.manifest_metadata))
+            if self.fsync in ('batch', 'close'):
+                self.sync()
+            for catalog in self._read_catalogs.values():
+                catalog.close()
+            self._read_catalogs.clear()
+            self.current_catalog.close()
+            self.deleted_indexes.close()
+            self.seekeable.close()
+
+    def _catalog_start_indexes(self):
+        if self._catalog_starts is None:
+            starts = list()
+            for catalog_path in self.catalog_paths[:-1]:
+                path = os.path.join(self.base_path, catalog_path)
+                metadata = CatalogMetadata(path, read_only=True)
+                starts.append(metadata.start_index())
+                metadata.close()
+            starts.append(self.current_catalog.manifest.start_index())
+            self._catalog_starts = starts
+        return self._catalog_starts
+
+    def _catalog_at(self, position):
+        if position == len(self.catalog_paths) - 1:
+            return self.current_catalog
+        catalog = self._read_catalogs.get(position)
+        if catalog is None:
+            path = os.path.join(self.base_path, self.catalog_paths[position])
+            catalog = Catalog(path, read_only=True)
+            self._read_catalogs[position] = catalog
+        return catalog
+
+    def _deleted_list(self):
+        if self._sorted_deleted is None:
+            # The bitmap iterates in ascending order
+            self._sorted_deleted = list(self.deleted_indexes)
+        return self._sorted_deleted
+
+    def index_of(self, position):
+        """
+        Returns the record index of the record at the given position, where
+        positions only count records which are not marked as deleted, like
+        iterating over the manifest does.
+        """
+        length = len(self)
+        if position < 0:
+            position += length
+        if not 0 <= position < length:
+            raise IndexError(f'Position {position} out of range')
+        sorted_deleted = self._deleted_list()
+        # Shift by the number of deleted indexes up to the candidate until
+        # the candidate does not move anymore
+        index = position
+        while True:
+            candidate = position + bisect.bisect_right(sorted_deleted, index)
+            if candidate == index:
+                return index
+            index = candidate
+
+    def get_records(self, indexes):
+        """
+        Reads records by their record index (`_index`). The catalog of each
+        index is found from the catalog start indexes and the record is read
+        with a single seek. Reads are grouped by catalog. Indexes which are
+        marked as deleted or out of range are skipped.
+
+        :param indexes: iterable of record indexes
+        :return:        list of records, in the order of indexes
+        """
+        if not self.read_only:
+            self.flush()
+        indexes = list(indexes)
+        starts = self._catalog_start_indexes()
+        by_catalog = dict()
+        for index in indexes:
+            if index in self.deleted_indexes \
+                    or not 0 <= index < self.current_index:
+                continue
+            position = bisect.bisect_right(starts, index) - 1
+            by_catalog.setdefault(position, set()).add(index)
+
+        records = dict()
+        for position, catalog_indexes in by_catalog.items():
+            seekable = self._catalog_at(position).seekable
+            current_offset = seekable.file.tell()
+            for index in sorted(catalog_indexes):
+                seekable.seek_line_start(index - starts[position] + 1)
+                contents = seekable.readline()
+                try:
+                    records[index] = json.loads(contents)
+                except Exception:
+                    print(f'Ignoring record at index {index}')
+            seekable.file.seek(current_offset)
+        return [records[index] for index in indexes if index in records]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            positions = range(*key.indices(len(self)))
+            return self.get_records(self.index_of(position)
+                                    for position in positions)
+        records = self.get_records([self.index_of(key)])
+        if not records:
+            raise IndexError(f'Record at position {key} could not be read')
+        return records[0]
 
     def __iter__(self):
+        # Make buffered records visible to the iterator
+        if not self.read_only:
+            self.flush()
         return ManifestIterator(self)
 
     def __len__(self):
@@ -434,6 +994,7 @@ class ManifestIterator(object):
                         print(f'Ignoring record at index {current_index}')
                         continue
             else:
+                self.current_catalog.close()
                 self.current_catalog = None
                 self.current_catalog_index += 1
 
@@ -0,0 +1,36 @@
+"""
+Encodes image arrays into files of the supported tub image formats.
+"""
+import numpy as np
+from PIL import Image
+
+
+# Supported image formats and their file extensions. 'raw' stores the
+# uncompressed array with np.save().
+IMAGE_FORMATS = {'jpg': '.jpg', 'png': '.png', 'raw': '.npy'}
+
+
+def image_extension(image_format):
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f'Unknown image format {image_format}, expected one '
+                         f'of {list(IMAGE_FORMATS)}')
+    return IMAGE_FORMATS[image_format]
+
+
+def write_image(image_array, path, quality=None):
+    """
+    Writes an image array to path. The format is derived from the file
+    extension, quality only applies to jpg files. 16 bit arrays (depth
+    images) keep their depth, everything else is stored as uint8.
+    """
+    if path.endswith(IMAGE_FORMATS['raw']):
+        np.save(path, image_array)
+        return path
+    if image_array.dtype != np.uint16:
+        image_array = np.uint8(image_array)
+    image = Image.fromarray(image_array)
+    if quality is not None and path.endswith(IMAGE_FORMATS['jpg']):
+        image.save(path, quality=quality)
+    else:
+        image.save(path)
+    return path
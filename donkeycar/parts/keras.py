@@ -9,30 +9,31 @@ include one or more models to help direct the vehicles motion.
 """
 
 from abc import ABC, abstractmethod
+import itertools
 import numpy as np
-from typing import Dict, Any, Tuple, Optional, Union
+from typing import Dict, Any, Callable, Iterable, List, Tuple, Optional, \
+    Union
 import donkeycar as dk
 
-from donkeycar.utils import normalize_image, linear_bin
+from donkeycar.utils import normalize_image, linear_bin, LazyModule
 from donkeycar.pipeline.types import TubRecord
 
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.layers import Input, Dense
-from tensorflow.keras.layers import Convolution2D, MaxPooling2D, \
-    BatchNormalization
-from tensorflow.keras.layers import Activation, Dropout, Flatten
-from tensorflow.keras.layers import LSTM
-from tensorflow.keras.layers import TimeDistributed as TD
-from tensorflow.keras.layers import Conv3D, MaxPooling3D, Conv2DTranspose
-from tensorflow.keras.backend import concatenate
-from tensorflow.keras.models import Model, Sequential
-from tensorflow.python.keras.callbacks import EarlyStopping, ModelCheckpoint
+# tensorflow is imported when a model gets built or loaded, the layers are
+# imported in the functions building the models
+tf = LazyModule('tensorflow')
 
 ONE_BYTE_SCALE = 1.0 / 255.0
 
 # type of x
 XY = Union[float, np.ndarray, Tuple[float, ...], Tuple[np.ndarray, ...]]
+# inputs of predict_batch(), records or image arrays with optional other_arr
+BatchInput = Union[TubRecord, np.ndarray, Tuple[np.ndarray, np.ndarray]]
+
+
+def unbin_batch(arr: np.ndarray, N: int = 15, offset: float = -1,
+                R: float = 2.0) -> np.ndarray:
+    """ Batched version of dk.utils.linear_unbin() over the rows of arr """
+    return np.argmax(arr, axis=1) * (R / (N + offset)) + offset
 
 
 class KerasPilot(ABC):
@@ -41,13 +42,62 @@ class KerasPilot(ABC):
     guide a car.
     """
     def __init__(self) -> None:
-        self.model: Optional[Model] = None
+        self.model: Optional['tf.keras.Model'] = None
+        self.infer_fn: Optional[Callable] = None
+        # float32 buffer reused by run() for the normalised image
+        self.norm_arr: Optional[np.ndarray] = None
         self.optimizer = "adam"
         print(f'Created {self}')
 
     def load(self, model_path: str) -> None:
         print(f'Loading model {model_path}')
-        self.model = keras.models.load_model(model_path, compile=False)
+        self.model = tf.keras.models.load_model(model_path, compile=False)
+        self.compile_inference()
+
+    def compile_inference(self) -> None:
+        """
+        Creates the inference function used by call_model(). The model call
+        is traced once into a tf.function with a fixed input signature and
+        a variable batch size, and warmed up, so the first frame in the
+        drive loop does not pay for tracing.
+        """
+        assert self.model, 'Model not set'
+        model = self.model
+        signature = [tf.TensorSpec(shape=(None, *model_in.shape[1:]),
+                                   dtype=model_in.dtype)
+                     for model_in in model.inputs]
+
+        @tf.function(input_signature=[signature])
+        def infer(inputs):
+            return model(inputs if len(inputs) > 1 else inputs[0],
+                         training=False)
+
+        self.infer_fn = infer
+        self.call_model([np.zeros((1, *spec.shape[1:]),
+                                  dtype=spec.dtype.as_numpy_dtype)
+                         for spec in signature])
+
+    def call_model(self, inputs: Union[np.ndarray, List[np.ndarray]]) \
+            -> Union[np.ndarray, List[np.ndarray]]:
+        """
+        Runs the model on a batch of inputs. Replaces model.predict() which
+        sets up a data pipeline and callbacks on every call and is slow for
+        single frames in the drive loop.
+
+        :param inputs:  numpy array or list of numpy arrays for models with
+                        multiple inputs, like model.predict()
+        :return:        numpy array or list of numpy arrays for models with
+                        multiple outputs, like model.predict()
+        """
+        if self.infer_fn is None:
+            self.compile_inference()
+        arrays = inputs if isinstance(inputs, (list, tuple)) else [inputs]
+        tensors = [tf.convert_to_tensor(x, dtype=model_in.dtype)
+                   for x, model_in in zip(arrays, self.model.inputs)]
+        outputs = self.infer_fn(tensors)
+        if isinstance(outputs, (list, tuple)):
+            return [output.numpy() for output in outputs]
+        return outputs.numpy()
 
     def load_weights(self, model_path: str, by_name: bool = True) -> None:
         assert self.model, 'Model not set'
@@ -63,18 +113,23 @@ class KerasPilot(ABC):
                       rate: float, decay: float) -> None:
         assert self.model, 'Model not set'
         if optimizer_type == "adam":
-            self.model.optimizer = keras.optimizers.Adam(lr=rate, decay=decay)
+            self.model.optimizer = tf.keras.optimizers.Adam(lr=rate, decay=decay)
         elif optimizer_type == "sgd":
-            self.model.optimizer = keras.optimizers.SGD(lr=rate, decay=decay)
+            self.model.optimizer = tf.keras.optimizers.SGD(lr=rate, decay=decay)
         elif optimizer_type == "rmsprop":
-            self.model.optimizer = keras.optimizers.RMSprop(lr=rate, decay=decay)
+            self.model.optimizer = tf.keras.optimizers.RMSprop(lr=rate, decay=decay)
         else:
             raise Exception("unknown optimizer type: %s" % optimizer_type)
 
-    def get_input_shape(self) -> tf.TensorShape:
+    def get_input_shape(self) -> 'tf.TensorShape':
         assert self.model, 'Model not set'
         return self.model.inputs[0].shape
 
+    def seq_size(self) -> int:
+        """ Number of consecutive records in one training sample, 0 if the
+            model is trained from single records """
+        return 0
+
     def run(self, img_arr: np.ndarray, other_arr: np.ndarray = None) \
             -> Tuple[Union[float, np.ndarray], ...]:
         """
@@ -86,7 +141,9 @@ class KerasPilot(ABC):
                             state vector in the Behavioural model
         :return:            tuple of (angle, throttle)
         """
-        norm_arr = normalize_image(img_arr)
+        if self.norm_arr is None or self.norm_arr.shape != img_arr.shape:
+            self.norm_arr = np.empty(img_arr.shape, dtype=np.float32)
+        norm_arr = normalize_image(img_arr, out=self.norm_arr)
         return self.inference(norm_arr, other_arr)
 
     @abstractmethod
@@ -103,14 +160,80 @@ class KerasPilot(ABC):
         """
         pass
 
+    def inference_batch(self, img_arrs: np.ndarray,
+                        other_arrs: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Batched version of inference(). Child classes override it to run
+        the model once per batch, this default calls inference() per image.
+
+        :param img_arrs:    float [0,1] numpy array of images (N, H, W, C)
+        :param other_arrs:  numpy array of additional data, one row per
+                            image, or None
+        :return:            numpy array with one row of outputs per image
+        """
+        if other_arrs is None:
+            other_arrs = [None] * len(img_arrs)
+        return np.array([[float(np.squeeze(value)) for value in
+                          self.inference(img_arr, other_arr)]
+                         for img_arr, other_arr in zip(img_arrs, other_arrs)])
+
+    def _batch_inputs(self, inputs: List[BatchInput]) \
+            -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        img_arrs = list()
+        other_arrs = list()
+        for x0 in inputs:
+            x1 = self.x_transform(x0) if isinstance(x0, TubRecord) else x0
+            if isinstance(x1, tuple):
+                img_arrs.append(x1[0])
+                other_arrs.append(x1[1])
+            else:
+                img_arrs.append(x1)
+        return np.stack(img_arrs), \
+            np.array(other_arrs) if other_arrs else None
+
+    def predict_batch(self, inputs: Iterable[BatchInput],
+                      batch_size: int = 64,
+                      augmentation: 'ImageAugmentation' = None) -> np.ndarray:
+        """
+        Offline inference over many inputs, which runs the model once per
+        batch instead of once per image. Inputs are consumed lazily, so
+        records can be streamed from a tub.
+
+        :param inputs:          iterable of TubRecords, uint8 image arrays
+                                or tuples of (image array, other_arr)
+        :param batch_size:      number of inputs per model call
+        :param augmentation:    optional augmentation applied to the images
+        :return:                numpy array with one row per input holding
+                                the outputs of run(), like (angle, throttle)
+        """
+        iterator = iter(inputs)
+        outputs = list()
+        while True:
+            chunk = list(itertools.islice(iterator, batch_size))
+            if not chunk:
+                break
+            img_arrs, other_arrs = self._batch_inputs(chunk)
+            if augmentation:
+                # pass angles, so flips are applied too
+                img_arrs, _ = augmentation.augment_batch(
+                    img_arrs, np.zeros(len(img_arrs)))
+            norm_arrs = normalize_image(img_arrs)
+            outputs.append(np.asarray(self.inference_batch(norm_arrs,
+                                                           other_arrs),
+                                      dtype=np.float64))
+        if not outputs:
+            return np.zeros((0, 2))
+        return np.concatenate(outputs)
+
     def evaluate(self, record: TubRecord,
                  augmentation: 'ImageAugmentation' = None) \
             -> Tuple[Union[float, np.ndarray], ...]:
         # extract model input from record
         x0 = self.x_transform(record)
         x1 = x0[0] if isinstance(x0, tuple) else x0
-        # apply augmentation to training data only
-        x2 = augmentation.augment(x1) if augmentation else x1
+        # apply augmentation, including flips, as the angle is not used here
+        x2 = augmentation.augment_batch(x1[np.newaxis], np.zeros(1))[0][0] \
+            if augmentation else x1
         # normalise image, assume other input data comes already normalised
         x3 = normalize_image(x2)
         if isinstance(x0, tuple):
@@ -129,10 +252,16 @@ class KerasPilot(ABC):
               verbose: int = 1,
               min_delta: float = .0005,
               patience: int = 5,
-              show_plot: bool = False) -> tf.keras.callbacks.History:
+              show_plot: bool = False,
+              callbacks: Optional[List['tf.keras.callbacks.Callback']] = None) \
+            -> 'tf.keras.callbacks.History':
         """
-        trains the model
+        trains the model, callbacks are added to the early stopping and
+        checkpoint callbacks
         """
+        from tensorflow.python.keras.callbacks import EarlyStopping, \
+            ModelCheckpoint
+
         model = self._get_train_model()
         self.compile()
 
@@ -143,9 +272,9 @@ class KerasPilot(ABC):
             ModelCheckpoint(monitor='val_loss',
                             filepath=model_path,
                             save_best_only=True,
-                            verbose=verbose)]
+                            verbose=verbose)] + (callbacks or [])
 
-        history: tf.keras.callbacks.History = model.fit(
+        history: 'tf.keras.callbacks.History' = model.fit(
             x=train_data,
             steps_per_epoch=train_steps,
             batch_size=batch_size,
@@ -194,7 +323,7 @@ class KerasPilot(ABC):
             
         return history
 
-    def _get_train_model(self) -> Model:
+    def _get_train_model(self) -> 'tf.keras.Model':
         """ Model used for training, could be just a sub part of the model"""
         return self.model
 
@@ -214,12 +343,16 @@ class KerasPilot(ABC):
                                   f'pipeline')
 
     def output_types(self) -> Tuple[Dict[str, np.typename], ...]:
-        """ Used in tf.data, assume all types are doubles"""
+        """ Used in tf.data, assume all types are doubles except for the
+            float32 normalised image """
         shapes = self.output_shapes()
-        types = tuple({k: tf.float64 for k in d} for d in shapes)
+        # the image is the first input
+        img_key = next(iter(shapes[0]), None) if shapes else None
+        types = tuple({k: tf.float32 if k == img_key else tf.float64
+                       for k in d} for d in shapes)
         return types
 
-    def output_shapes(self) -> Dict[str, tf.TensorShape]:
+    def output_shapes(self) -> Dict[str, 'tf.TensorShape']:
         return {}
 
     def __str__(self) -> str:
@@ -258,13 +391,21 @@ class KerasCategorical(KerasPilot):
             return 0.0, 0.0
 
         img_arr = img_arr.reshape((1,) + img_arr.shape)
-        angle_binned, throttle_binned = self.model.predict(img_arr)
+        angle_binned, throttle_binned = self.call_model(img_arr)
         N = len(throttle_binned[0])
         throttle = dk.utils.linear_unbin(throttle_binned, N=N,
                                          offset=0.0, R=self.throttle_range)
         angle = dk.utils.linear_unbin(angle_binned)
         return angle, throttle
 
+    def inference_batch(self, img_arrs, other_arrs):
+        angle_binned, throttle_binned = self.call_model(img_arrs)
+        N = throttle_binned.shape[1]
+        throttle = unbin_batch(throttle_binned, N=N, offset=0.0,
+                               R=self.throttle_range)
+        angle = unbin_batch(angle_binned)
+        return np.column_stack([angle, throttle])
+
     def y_transform(self, record: TubRecord):
         angle: float = record.underlying['user/angle']
         throttle: float = record.underlying['user/throttle']
@@ -303,11 +444,15 @@ class KerasLinear(KerasPilot):
 
     def inference(self, img_arr, other_arr):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
-        outputs = self.model.predict(img_arr)
+        outputs = self.call_model(img_arr)
         steering = outputs[0]
         throttle = outputs[1]
         return steering[0][0], throttle[0][0]
 
+    def inference_batch(self, img_arrs, other_arrs):
+        outputs = self.call_model(img_arrs)
+        return np.column_stack([outputs[0][:, 0], outputs[1][:, 0]])
+
     def y_transform(self, record: TubRecord):
         angle: float = record.underlying['user/angle']
         throttle: float = record.underlying['user/throttle']
@@ -339,10 +484,16 @@ class KerasInferred(KerasPilot):
 
     def inference(self, img_arr, other_arr):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
-        outputs = self.model.predict(img_arr)
+        outputs = self.call_model(img_arr)
         steering = outputs[0]
         return steering[0], dk.utils.throttle(steering[0])
 
+    def inference_batch(self, img_arrs, other_arrs):
+        outputs = self.call_model(img_arrs)
+        steering = np.asarray(outputs).reshape(len(img_arrs), -1)[:, 0]
+        throttle = [dk.utils.throttle(value) for value in steering]
+        return np.column_stack([steering, throttle])
+
     def y_transform(self, record: TubRecord):
         angle: float = record.underlying['user/angle']
         return angle
@@ -398,11 +549,22 @@ class KerasIMU(KerasPilot):
     def inference(self, img_arr, other_arr):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
         imu_arr = np.array(other_arr).reshape(1, self.num_imu_inputs)
-        outputs = self.model.predict([img_arr, imu_arr])
+        outputs = self.call_model([img_arr, imu_arr])
         steering = outputs[0]
         throttle = outputs[1]
         return steering[0][0], throttle[0][0]
 
+    def inference_batch(self, img_arrs, other_arrs):
+        imu_arrs = np.asarray(other_arrs).reshape(-1, self.num_imu_inputs)
+        outputs = self.call_model([img_arrs, imu_arrs])
+        return np.column_stack([outputs[0][:, 0], outputs[1][:, 0]])
+
+    def x_transform(self, record: TubRecord) -> XY:
+        imu_keys = ['imu/acl_x', 'imu/acl_y', 'imu/acl_z',
+                    'imu/gyr_x', 'imu/gyr_y', 'imu/gyr_z']
+        imu_arr = np.array([record.underlying[key] for key in imu_keys])
+        return record.image(cached=True), imu_arr
+
     def y_transform(self, record: TubRecord):
         angle: float = record.underlying['user/angle']
         throttle: float = record.underlying['user/throttle']
@@ -425,7 +587,7 @@ class KerasBehavioral(KerasPilot):
     def inference(self, img_arr, state_array):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
         bhv_arr = np.array(state_array).reshape(1, len(state_array))
-        angle_binned, throttle = self.model.predict([img_arr, bhv_arr])
+        angle_binned, throttle = self.call_model([img_arr, bhv_arr])
         # In order to support older models with linear throttle,we will test for
         # shape of throttle to see if it's the newer binned version.
         N = len(throttle[0])
@@ -437,6 +599,21 @@ class KerasBehavioral(KerasPilot):
         angle_unbinned = dk.utils.linear_unbin(angle_binned)
         return angle_unbinned, throttle
 
+    def inference_batch(self, img_arrs, other_arrs):
+        bhv_arrs = np.asarray(other_arrs).reshape(len(img_arrs), -1)
+        angle_binned, throttle = self.call_model([img_arrs,
+                                                  bhv_arrs])
+        N = throttle.shape[1]
+        if N > 0:
+            throttle = unbin_batch(throttle, N=N, offset=0.0, R=0.5)
+        else:
+            throttle = throttle[:, 0]
+        return np.column_stack([unbin_batch(angle_binned), throttle])
+
+    def x_transform(self, record: TubRecord) -> XY:
+        bhv_arr = np.array(record.underlying['behavior/one_hot_state_array'])
+        return record.image(cached=True), bhv_arr
+
     def y_transform(self, record: TubRecord):
         angle: float = record.underlying['user/angle']
         throttle: float = record.underlying['user/throttle']
@@ -461,10 +638,15 @@ class KerasLocalizer(KerasPilot):
         
     def inference(self, img_arr, other_arr):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
-        angle, throttle, track_loc = self.model.predict([img_arr])
+        angle, throttle, track_loc = self.call_model([img_arr])
         loc = np.argmax(track_loc[0])
         return angle, throttle, loc
 
+    def inference_batch(self, img_arrs, other_arrs):
+        angle, throttle, track_loc = self.call_model([img_arrs])
+        return np.column_stack([angle[:, 0], throttle[:, 0],
+                                np.argmax(track_loc, axis=1)])
+
 
 
 def conv2d(filters, kernel, strides, layer_num, activation='relu'):
@@ -479,6 +661,8 @@ def conv2d(filters, kernel, strides, layer_num, activation='relu'):
     :param activation:  activation, defaults to relu
     :return:            tf.keras Convolution2D layer
     """
+    from tensorflow.keras.layers import Convolution2D
+
     return Convolution2D(filters=filters,
                          kernel_size=(kernel, kernel),
                          strides=(strides, strides),
@@ -496,6 +680,8 @@ def core_cnn_layers(img_in, drop, l4_stride=1):
     :param l4_stride:       4-th layer stride, default 1
     :return:                stack of CNN layers
     """
+    from tensorflow.keras.layers import Dropout, Flatten
+
     x = img_in
     x = conv2d(24, 5, 2, 1)(x)
     x = Dropout(drop)(x)
@@ -512,6 +698,9 @@ def core_cnn_layers(img_in, drop, l4_stride=1):
 
 
 def default_n_linear(num_outputs, input_shape=(120, 160, 3)):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop)
@@ -530,6 +719,9 @@ def default_n_linear(num_outputs, input_shape=(120, 160, 3)):
 
 
 def default_categorical(input_shape=(120, 160, 3)):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop, l4_stride=2)
@@ -547,6 +739,10 @@ def default_categorical(input_shape=(120, 160, 3)):
 
 
 def default_imu(num_outputs, num_imu_inputs, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.backend import concatenate
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     imu_in = Input(shape=(num_imu_inputs,), name="imu_in")
@@ -575,6 +771,10 @@ def default_imu(num_outputs, num_imu_inputs, input_shape):
 
 
 def default_bhv(num_bvh_inputs, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.backend import concatenate
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     bvh_in = Input(shape=(num_bvh_inputs,), name="behavior_in")
@@ -604,6 +804,9 @@ def default_bhv(num_bvh_inputs, input_shape):
 
 
 def default_loc(num_locations, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
 
@@ -625,41 +828,142 @@ def default_loc(num_locations, input_shape):
     return model
 
 
-class KerasRNN_LSTM(KerasPilot):
-    def __init__(self, input_shape=(120, 160, 3), seq_length=3, num_outputs=2):
+class FrameHistory(object):
+    """
+    Preallocated circular buffer of the last `length` frames of a sequence
+    pilot. Every frame is written to two slots, i and i + length, of a buffer
+    with 2 * length slots. The history in time order is then always one
+    contiguous slice of the buffer, so it can be passed to the model without
+    rebuilding an array of all frames. Until `length` frames have been
+    seen, the history is padded with the first frame.
+    """
+    def __init__(self, length: int) -> None:
+        self.length = length
+        self.buffer: Optional[np.ndarray] = None
+        self.pos = 0
+        self.count = 0
+
+    def reset(self) -> None:
+        self.pos = 0
+        self.count = 0
+
+    def append(self, frame: np.ndarray) -> None:
+        if self.buffer is None or self.buffer.shape[1:] != frame.shape:
+            self.buffer = np.empty((2 * self.length, *frame.shape),
+                                   dtype=np.float32)
+            self.reset()
+        if self.count == 0:
+            self.buffer[:] = frame
+        else:
+            self.buffer[self.pos] = frame
+            self.buffer[self.pos + self.length] = frame
+        self.pos = (self.pos + 1) % self.length
+        self.count = min(self.count + 1, self.length)
+
+    def window(self) -> np.ndarray:
+        """ View of the history of shape (length, *frame.shape), oldest
+            frame first """
+        return self.buffer[self.pos:self.pos + self.length]
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class KerasSequencePilot(KerasPilot):
+    """
+    Base class of pilots which see the last seq_length images. In the drive
+    loop the images are kept in a FrameHistory, in training each x is a
+    sequence of consecutive records.
+    """
+    def __init__(self, input_shape=(120, 160, 3), seq_length=3) -> None:
         super().__init__()
         self.input_shape = input_shape
-        self.model = rnn_lstm(seq_length=seq_length,
-                              num_outputs=num_outputs,
-                              input_shape=input_shape)
         self.seq_length = seq_length
-        self.img_seq = []
-        self.optimizer = "rmsprop"
+        self.img_seq = FrameHistory(seq_length)
 
-    def compile(self):
-        self.model.compile(optimizer=self.optimizer, loss='mse')
+    def seq_size(self) -> int:
+        return self.seq_length
 
-    def inference(self, img_arr, other_arr):
+    def _frame(self, img_arr: np.ndarray) -> np.ndarray:
         if img_arr.shape[2] == 3 and self.input_shape[2] == 1:
             img_arr = dk.utils.rgb2gray(img_arr)
+        return img_arr.reshape(self.input_shape)
 
-        while len(self.img_seq) < self.seq_length:
-            self.img_seq.append(img_arr)
-
-        self.img_seq = self.img_seq[1:]
-        self.img_seq.append(img_arr)
-        
-        img_arr = np.array(self.img_seq).reshape((1, self.seq_length,
-                                                  *self.input_shape))
-        outputs = self.model.predict([img_arr])
+    def inference(self, img_arr, other_arr):
+        # the history copies the frame, so the run() buffer can be reused
+        self.img_seq.append(self._frame(img_arr))
+        img_seq = self.img_seq.window()[np.newaxis]
+        outputs = self.call_model([img_seq])
         steering = outputs[0][0]
         throttle = outputs[0][1]
         return steering, throttle
 
+    def inference_batch(self, img_arrs, other_arrs):
+        """ Runs the sliding windows of seq_length images ending at each
+            image of the batch, continuing the history like inference() """
+        img_seqs = np.empty((len(img_arrs), self.seq_length,
+                             *self.input_shape), dtype=np.float32)
+        for img_seq, img_arr in zip(img_seqs, img_arrs):
+            self.img_seq.append(self._frame(img_arr))
+            img_seq[:] = self.img_seq.window()
+        outputs = self.call_model([img_seqs])
+        return np.column_stack([outputs[:, 0], outputs[:, 1]])
+
+    def predict_batch(self, inputs, batch_size=64, augmentation=None):
+        # The inputs form one sequence, starting with an empty history
+        self.img_seq.reset()
+        return super().predict_batch(inputs, batch_size, augmentation)
+
+    def x_transform(self, record: Union[TubRecord, List[TubRecord]]) -> XY:
+        """ Stacks the images of a sequence of records, single records
+            return their image like in other pilots """
+        if isinstance(record, TubRecord):
+            return super().x_transform(record)
+        return np.stack([r.image(cached=True) for r in record])
+
+    def y_transform(self, record: Union[TubRecord, List[TubRecord]]) -> XY:
+        """ The labels of a sequence are the ones of its last record """
+        last = record if isinstance(record, TubRecord) else record[-1]
+        angle: float = last.underlying['user/angle']
+        throttle: float = last.underlying['user/throttle']
+        return angle, throttle
+
+    def x_translate(self, x: XY) -> Dict[str, Union[float, np.ndarray]]:
+        return {self.model.input_names[0]: x}
+
+    def y_translate(self, y: XY) -> Dict[str, Union[float, np.ndarray]]:
+        if isinstance(y, tuple):
+            return {self.model.output_names[0]: list(y)}
+        else:
+            raise TypeError('Expected tuple')
+
+    def output_shapes(self):
+        img_seq_shape = (self.seq_length, *self.input_shape)
+        shapes = ({self.model.input_names[0]: tf.TensorShape(img_seq_shape)},
+                  {self.model.output_names[0]: tf.TensorShape(
+                      self.model.outputs[0].shape[1:])})
+        return shapes
+
+
+class KerasRNN_LSTM(KerasSequencePilot):
+    def __init__(self, input_shape=(120, 160, 3), seq_length=3, num_outputs=2):
+        super().__init__(input_shape=input_shape, seq_length=seq_length)
+        self.model = rnn_lstm(seq_length=seq_length,
+                              num_outputs=num_outputs,
+                              input_shape=input_shape)
+        self.optimizer = "rmsprop"
+
+    def compile(self):
+        self.model.compile(optimizer=self.optimizer, loss='mse')
+
 
 def rnn_lstm(seq_length=3, num_outputs=2, input_shape=(120, 160, 3)):
     # add sequence length dimensions as keras time-distributed expects shape
     # of (num_samples, seq_length, input_shape)
+    from tensorflow.keras.layers import Input, Dense, Convolution2D, \
+        MaxPooling2D, Dropout, Flatten, LSTM, TimeDistributed as TD
+    from tensorflow.keras.models import Sequential
+
     img_seq_shape = (seq_length,) + input_shape   
     img_in = Input(batch_shape=img_seq_shape, name='img_in')
     drop_out = 0.3
@@ -691,38 +995,17 @@ def rnn_lstm(seq_length=3, num_outputs=2, input_shape=(120, 160, 3)):
     return x
 
 
-class Keras3D_CNN(KerasPilot):
+class Keras3D_CNN(KerasSequencePilot):
     def __init__(self, input_shape=(120, 160, 3), seq_length=20, num_outputs=2):
-        super().__init__()
-        self.input_shape = input_shape
+        super().__init__(input_shape=input_shape, seq_length=seq_length)
         self.model = build_3d_cnn(input_shape, s=seq_length,
                                   num_outputs=num_outputs)
-        self.seq_length = seq_length
-        self.img_seq = []
 
     def compile(self):
         self.model.compile(loss='mean_squared_error',
                            optimizer=self.optimizer,
                            metrics=['accuracy'])
 
-    def inference(self, img_arr, other_arr):
-
-        if img_arr.shape[2] == 3 and self.input_shape[2] == 1:
-            img_arr = dk.utils.rgb2gray(img_arr)
-
-        while len(self.img_seq) < self.seq_length:
-            self.img_seq.append(img_arr)
-
-        self.img_seq = self.img_seq[1:]
-        self.img_seq.append(img_arr)
-        
-        img_arr = np.array(self.img_seq).reshape((1, self.seq_length,
-                                                  *self.input_shape))
-        outputs = self.model.predict([img_arr])
-        steering = outputs[0][0]
-        throttle = outputs[0][1]
-        return steering, throttle
-
 
 def build_3d_cnn(input_shape, s, num_outputs):
     """
@@ -733,6 +1016,10 @@ def build_3d_cnn(input_shape, s, num_outputs):
     :param num_outputs:     output dimension
     :return:
     """
+    from tensorflow.keras.layers import Dense, BatchNormalization, Activation, \
+        Dropout, Flatten, Conv3D, MaxPooling3D
+    from tensorflow.keras.models import Sequential
+
     input_shape = (s, ) + input_shape
     model = Sequential()
 
@@ -806,16 +1093,24 @@ class KerasLatent(KerasPilot):
 
     def inference(self, img_arr, other_arr):
         img_arr = img_arr.reshape((1,) + img_arr.shape)
-        outputs = self.model.predict(img_arr)
+        outputs = self.call_model(img_arr)
         steering = outputs[1]
         throttle = outputs[2]
         return steering[0][0], throttle[0][0]
 
+    def inference_batch(self, img_arrs, other_arrs):
+        outputs = self.call_model(img_arrs)
+        return np.column_stack([outputs[1][:, 0], outputs[2][:, 0]])
+
 
 def default_latent(num_outputs, input_shape):
     # TODO: this auto-encoder should run the standard cnn in encoding and
     #  have corresponding decoder. Also outputs should be reversed with
     #  images at end.
+    from tensorflow.keras.layers import Input, Dense, Convolution2D, Dropout, \
+        Flatten, Conv2DTranspose
+    from tensorflow.keras.models import Model
+
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = img_in
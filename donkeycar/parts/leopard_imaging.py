@@ -8,6 +8,8 @@ class LICamera(BaseCamera):
     '''
     The Leopard Imaging Camera with Fast-Stretch built in.
     '''
+    publishes_frames = True
+
     def __init__(self, width=224, height=224, capture_width=1280, capture_height=720, fps=60):
         super(LICamera, self).__init__()
         self.width = width
@@ -16,7 +18,6 @@ class LICamera(BaseCamera):
         self.capture_height = capture_height
         self.fps = fps
         self.camera_id = LICamera.camera_id(self.capture_width, self.capture_height, self.width, self.height, self.fps)
-        self.frame = None
         print('Connecting to Leopard Imaging Camera')
         self.capture = cv2.VideoCapture(self.camera_id)
         time.sleep(2)
@@ -32,11 +33,11 @@ class LICamera(BaseCamera):
         if success:
             # returns an RGB frame.
             frame = fast_stretch(frame)
-            self.frame = frame
+            self.buffer.write(frame)
 
     def run(self):
         self.read_frame()
-        return self.frame
+        return self.run_threaded()
 
     def update(self):
         # keep looping infinitely until the thread is stopped
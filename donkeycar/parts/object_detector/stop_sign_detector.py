@@ -109,6 +109,8 @@ class StopSignDetector(object):
 
         if traffic_light_obj:
             if self.show_bounding_box:
+                # camera frames are read-only, draw on a copy
+                img_arr = img_arr.copy()
                 self.draw_bounding_box(traffic_light_obj, img_arr)
             return 0, img_arr
         else:
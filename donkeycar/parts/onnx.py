@@ -0,0 +1,141 @@
+import os
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+from donkeycar.parts.keras import KerasPilot
+
+
+GRAPH_OPTIMIZATIONS = ('none', 'basic', 'extended', 'all')
+
+
+def keras_model_to_onnx(in_filename, out_filename, opset=13):
+    """
+    Converts a keras model file into an onnx model file. The onnx model has
+    the same inputs and outputs as the keras model, with a variable batch
+    size.
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    print(f'Convert model {in_filename} to ONNX {out_filename}')
+    model = tf.keras.models.load_model(in_filename, compile=False)
+    signature = [tf.TensorSpec((None, *model_in.shape[1:]), model_in.dtype,
+                               name=model_in.name.split(':')[0])
+                 for model_in in model.inputs]
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset,
+                               output_path=out_filename)
+
+
+def torch_model_to_onnx(model, out_filename, image_shape: Tuple[int, ...],
+                        input_size: Tuple[int, int] = (224, 224),
+                        mean: Sequence[float] = (0.485, 0.456, 0.406),
+                        std: Sequence[float] = (0.229, 0.224, 0.225),
+                        opset=13):
+    """
+    Exports a torch pilot, like ResNet18, into an onnx model file. The
+    torchvision preprocessing and the output scaling of the pilot become
+    part of the graph, so the onnx model takes normalised (N, H, W, C)
+    camera images and returns angle and throttle in [-1, 1], like keras
+    pilots do.
+
+    :param model:           torch module mapping (N, C, H, W) images to
+                            angle and throttle in [0, 1]
+    :param out_filename:    onnx model file
+    :param image_shape:     camera image shape (H, W, C)
+    :param input_size:      image size the model expects
+    :param mean:            mean of the input normalisation of the model
+    :param std:             standard deviation of the input normalisation
+    :param opset:           onnx opset version
+    """
+    import torch
+    import torch.nn.functional as F
+
+    class DonkeyInput(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+            self.register_buffer('mean', torch.tensor(mean).view(1, -1, 1, 1))
+            self.register_buffer('std', torch.tensor(std).view(1, -1, 1, 1))
+
+        def forward(self, x):
+            x = x.permute(0, 3, 1, 2)
+            x = F.interpolate(x, size=input_size, mode='bilinear',
+                              align_corners=False)
+            x = (x - self.mean) / self.std
+            return self.model(x) * 2 - 1
+
+    print(f'Export torch model to ONNX {out_filename}')
+    wrapper = DonkeyInput().eval()
+    dummy_input = torch.rand(1, *image_shape)
+    torch.onnx.export(wrapper, dummy_input, out_filename,
+                      input_names=['img_in'], output_names=['outputs'],
+                      dynamic_axes={'img_in': {0: 'batch'},
+                                    'outputs': {0: 'batch'}},
+                      opset_version=opset)
+
+
+class OnnxPilot(KerasPilot):
+    """
+    Runs onnx models with ONNX Runtime on the CPU. The model takes
+    normalised (N, H, W, C) images and returns angle and throttle, either
+    as two outputs, like keras linear models, or as one output with two
+    columns, like exported torch models.
+
+    :param num_threads:     number of intra op threads, None for the ONNX
+                            Runtime default
+    :param optimization:    graph optimization level, one of 'none',
+                            'basic', 'extended' or 'all'
+    """
+    def __init__(self, num_threads: Optional[int] = None,
+                 optimization: str = 'all'):
+        super().__init__()
+        if optimization not in GRAPH_OPTIMIZATIONS:
+            raise ValueError(f'Unknown graph optimization {optimization}, '
+                             f'expected one of {GRAPH_OPTIMIZATIONS}')
+        self.num_threads = num_threads
+        self.optimization = optimization
+        self.session = None
+        self.input_name = None
+        self.input_shape = None
+
+    def load(self, model_path):
+        assert os.path.splitext(model_path)[1] == '.onnx', \
+            'OnnxPilot should load only .onnx files'
+        import onnxruntime as ort
+
+        print(f'Loading model {model_path}')
+        options = ort.SessionOptions()
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        levels = {
+            'none': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+            'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+            'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+            'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        }
+        options.graph_optimization_level = levels[self.optimization]
+        self.session = ort.InferenceSession(
+            model_path, sess_options=options,
+            providers=['CPUExecutionProvider'])
+        model_in = self.session.get_inputs()[0]
+        self.input_name = model_in.name
+        # the batch dimension is symbolic
+        self.input_shape = (1, *model_in.shape[1:])
+
+    def get_input_shape(self):
+        assert self.input_shape is not None, "Need to load model first"
+        return self.input_shape
+
+    def inference(self, img_arr, other_arr):
+        outputs = self.inference_batch(img_arr[np.newaxis], None)
+        return float(outputs[0, 0]), float(outputs[0, 1])
+
+    def inference_batch(self, img_arrs, other_arrs):
+        input_data = img_arrs.reshape((len(img_arrs), *self.input_shape[1:])) \
+            .astype(np.float32, copy=False)
+        outputs = self.session.run(None, {self.input_name: input_data})
+        outputs = np.concatenate([output.reshape(len(img_arrs), -1)
+                                  for output in outputs], axis=1)
+        if outputs.shape[1] == 1:
+            outputs = np.column_stack([outputs, np.zeros(len(img_arrs))])
+        return outputs[:, :2]
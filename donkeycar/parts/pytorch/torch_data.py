@@ -6,6 +6,7 @@ from donkeycar.parts.tub_v2 import Tub
 from torchvision import transforms
 from typing import List, Any
 from donkeycar.pipeline.types import TubRecord, TubDataset
+from donkeycar.pipeline.image_cache import ImageCache
 from donkeycar.pipeline.sequence import TubSequence
 import pytorch_lightning as pl
 
@@ -119,6 +120,7 @@ class TorchTubDataModule(pl.LightningDataModule):
         self.tubs: List[Tub] = [Tub(tub_path, read_only=True)
                                 for tub_path in self.tub_paths]
         self.records: List[TubRecord] = []
+        self.image_cache = ImageCache.from_config(config)
 
     def setup(self, stage=None):
         """Load all the tub data and set up the datasets.
@@ -132,7 +134,8 @@ class TorchTubDataModule(pl.LightningDataModule):
         for tub in self.tubs:
             for underlying in tub:
                 record = TubRecord(self.config, tub.base_path,
-                                   underlying=underlying)
+                                   underlying=underlying,
+                                   image_cache=self.image_cache)
                 self.records.append(record)
 
         train_records, val_records = train_test_split(
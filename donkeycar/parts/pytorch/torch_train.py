@@ -22,6 +22,8 @@ def train(cfg, tub_paths, model_output_path, model_type, checkpoint_path=None):
 
     if not model_type:
         model_type = cfg.DEFAULT_MODEL_TYPE
+    is_onnx = 'onnx_' in model_type
+    model_type = model_type.replace('onnx_', '')
 
     tubs = tub_paths.split(',')
     tub_paths = [os.path.expanduser(tub) for tub in tubs]
@@ -58,4 +60,9 @@ def train(cfg, tub_paths, model_output_path, model_type, checkpoint_path=None):
         trainer.save_checkpoint(checkpoint_model_path)
         print("Saved final model to {}".format(checkpoint_model_path))
 
+    if is_onnx:
+        from donkeycar.parts.onnx import torch_model_to_onnx
+        image_shape = (cfg.IMAGE_H, cfg.IMAGE_W, cfg.IMAGE_DEPTH)
+        torch_model_to_onnx(model.model, f'{model_name}.onnx', image_shape)
+
     return model.loss_history
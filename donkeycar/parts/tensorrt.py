@@ -66,13 +66,12 @@ class TensorRTLinear(KerasPilot):
             print('Ready')
 
     def inference(self, image, other_arr=None):
-        # Channel first image format
-        image = image.transpose((2,0,1))
-        # Flatten it to a 1D array.
-        image = image.ravel()
-        # The first input is the image. Copy to host memory.
-        image_input = self.inputs[0] 
-        np.copyto(image_input.host_memory, image)
+        # The first input is the image. Copy it in channel first image
+        # format straight into the float32 host memory.
+        image_input = self.inputs[0]
+        height, width, depth = image.shape
+        np.copyto(image_input.host_memory.reshape((depth, height, width)),
+                  image.transpose((2, 0, 1)))
         with self.engine.create_execution_context() as context:
             inference_output = TensorRTLinear.infer(context=context,
                                                     bindings=self.bindings,
@@ -1,20 +1,67 @@
 import os
-import tensorflow as tf
 import numpy as np
-from typing import Dict, Union
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 from donkeycar.parts.keras import KerasPilot, KerasLinear, XY
+from donkeycar.utils import normalize_image
 
 
-def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
-    print('Convert model {:} to TFLite {:}'.format(in_filename, out_filename))
+QUANTIZE_MODES = ('int8', 'fp16', 'dynamic')
+
+
+def interpreter_api() -> Tuple[Any, Callable, Any]:
+    """
+    Returns the Interpreter class, the load_delegate function and the
+    OpResolverType enum. The small tflite_runtime package is used if it is
+    installed, as it loads much faster than tensorflow on the car.
+    """
+    try:
+        from tflite_runtime import interpreter as tflite
+        return tflite.Interpreter, tflite.load_delegate, \
+            getattr(tflite, 'OpResolverType', None)
+    except ImportError:
+        import tensorflow as tf
+        return tf.lite.Interpreter, tf.lite.experimental.load_delegate, \
+            getattr(tf.lite.experimental, 'OpResolverType', None)
+
+
+def keras_model_to_tflite(in_filename, out_filename, data_gen=None,
+                          quantize=None):
+    """
+    Converts a keras model file into a tflite model file.
+
+    :param in_filename:     keras model file
+    :param out_filename:    tflite model file
+    :param data_gen:        representative dataset, a callable returning an
+                            iterator of lists of float32 input batches. It is
+                            required for 'int8' quantization.
+    :param quantize:        None for a float32 model, 'int8' for a fully
+                            integer model with uint8 input and output,
+                            'fp16' for float16 weights or 'dynamic' for int8
+                            weights with float activations. If only data_gen
+                            is given, 'int8' is used.
+    """
+    if quantize is None and data_gen is not None:
+        quantize = 'int8'
+    if quantize is not None and quantize not in QUANTIZE_MODES:
+        raise ValueError(f'Unknown quantization {quantize}, expected one of '
+                         f'{QUANTIZE_MODES}')
+    print(f'Convert model {in_filename} to TFLite {out_filename}' +
+          (f' with {quantize} quantization' if quantize else ''))
+    import tensorflow as tf
     new_model = tf.keras.models.load_model(in_filename)
     converter = tf.lite.TFLiteConverter.from_keras_model(new_model)
-    if data_gen is not None:
-        # when we have a data_gen that is the trigger to use it to create
-        # integer weights and calibrate them. Warning: this model will no
-        # longer run with the standard tflite engine. That uses only float.
+    if quantize:
         converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == 'fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == 'int8':
+        if data_gen is None:
+            raise ValueError('int8 quantization needs a representative '
+                             'dataset')
+        # The data_gen is used to calibrate integer weights and activations.
+        # Warning: this model will no longer run with the standard tflite
+        # engine. That uses only float.
         converter.representative_dataset = data_gen
         try:
             converter.target_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
@@ -31,50 +78,160 @@ def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
     open(out_filename, "wb").write(tflite_model)
 
 
+def output_position(output_detail: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Sort key of the output tensors in the order of the keras model outputs.
+    The converter does not keep that order in get_output_details(), but the
+    tensor names end in the index of the keras output, like
+    StatefulPartitionedCall:1. Tensors with other names keep their order.
+    """
+    _, _, suffix = output_detail['name'].rpartition(':')
+    if suffix.isdigit():
+        return 0, int(suffix)
+    return 1, output_detail['index']
+
+
 class TFLitePilot(KerasPilot):
     """
-    This class wraps around the TensorFlow Lite interpreter.
+    This class wraps around the TensorFlow Lite interpreter. In run() the
+    camera image is written straight into the input tensor of the
+    interpreter.
+
+    :param num_threads: number of interpreter threads, None for the default
+    :param delegate:    'xnnpack' or None for the default XNNPACK delegate,
+                        'none' for the plain builtin kernels or the path of
+                        a delegate library, like 'libedgetpu.so.1'
     """
-    def __init__(self):
+    def __init__(self, num_threads: Optional[int] = None,
+                 delegate: Optional[str] = None):
         super().__init__()
+        self.num_threads = num_threads
+        self.delegate = delegate
         self.interpreter = None
         self.input_shape = None
         self.input_details = None
         self.output_details = None
+        self.batch_size = 1
+        self.input_quantization = None
+        self.raw_input = False
     
     def load(self, model_path):
         assert os.path.splitext(model_path)[1] == '.tflite', \
             'TFlitePilot should load only .tflite files'
         print(f'Loading model {model_path}')
         # Load TFLite model and allocate tensors.
-        self.interpreter = tf.lite.Interpreter(model_path=model_path)
+        self.interpreter = self._create_interpreter(model_path)
         self.interpreter.allocate_tensors()
 
         # Get input and output tensors.
         self.input_details = self.interpreter.get_input_details()
-        self.output_details = self.interpreter.get_output_details()
+        self.output_details = sorted(self.interpreter.get_output_details(),
+                                     key=output_position)
 
         # Get Input shape
         self.input_shape = self.input_details[0]['shape']
-    
-    def inference(self, img_arr, other_arr):
-        input_data = np.float32(img_arr.reshape(self.input_shape))
+        self.batch_size = 1
+
+        # Quantized models have integer input with a scale and zero point
+        scale, zero_point = self.input_details[0]['quantization']
+        self.input_quantization = (scale, zero_point) if scale else None
+        # If the model maps [0, 1] to [0, 255] the uint8 camera image is the
+        # input tensor as it is
+        self.raw_input = self.input_details[0]['dtype'] == np.uint8 \
+            and zero_point == 0 and np.isclose(scale * 255.0, 1.0)
+
+    def _create_interpreter(self, model_path):
+        interpreter, load_delegate, op_resolver_type = interpreter_api()
+        kwargs = dict(model_path=model_path, num_threads=self.num_threads)
+        if self.delegate == 'none':
+            if op_resolver_type is None:
+                print('This tflite version always uses its default '
+                      'delegates')
+            else:
+                kwargs['experimental_op_resolver_type'] \
+                    = op_resolver_type.BUILTIN_WITHOUT_DEFAULT_DELEGATES
+        elif self.delegate not in (None, 'xnnpack'):
+            print(f'Loading tflite delegate {self.delegate}')
+            kwargs['experimental_delegates'] = [load_delegate(self.delegate)]
+        return interpreter(**kwargs)
+
+    def _resize(self, batch_size):
+        """ Resizes the input tensor if the batch size changes """
+        if batch_size != self.batch_size:
+            self.interpreter.resize_tensor_input(
+                self.input_details[0]['index'],
+                [batch_size, *self.input_shape[1:]])
+            self.interpreter.allocate_tensors()
+            self.batch_size = batch_size
+
+    def _quantize_input(self, norm_arrs):
+        """ Converts normalised images into the input tensor type """
+        if self.input_quantization is None:
+            return norm_arrs.astype(np.float32, copy=False)
+        scale, zero_point = self.input_quantization
+        dtype = self.input_details[0]['dtype']
+        info = np.iinfo(dtype)
+        quantized = np.round(norm_arrs / scale + zero_point)
+        return np.clip(quantized, info.min, info.max).astype(dtype)
+
+    def _invoke(self, input_data):
+        """ Runs the interpreter, returns the first column of each output
+            tensor, dequantized for quantized models """
+        self._resize(len(input_data))
         self.interpreter.set_tensor(self.input_details[0]['index'], input_data)
         self.interpreter.invoke()
+        return self._outputs()
 
-        throttle = 0.0
+    def _outputs(self):
         outputs = []
-
         for tensor in self.output_details:
-            output_data = self.interpreter.get_tensor(tensor['index'])
-            outputs.append(output_data[0][0])
+            # copy out of the tensor buffer, so no view outlives invoke()
+            output_data = np.array(
+                self.interpreter.tensor(tensor['index'])()[:, 0])
+            scale, zero_point = tensor['quantization']
+            if scale:
+                output_data = (output_data.astype(np.float32) - zero_point) \
+                    * scale
+            outputs.append(output_data)
+        return outputs
 
-        steering = float(outputs[0])
-        if len(outputs) > 1:
-            throttle = float(outputs[1])
+    def run(self, img_arr, other_arr=None):
+        if img_arr.dtype != np.uint8 or other_arr is not None:
+            return super().run(img_arr, other_arr)
+        self._resize(1)
+        # view of the input tensor buffer, which must be released before
+        # invoke()
+        input_view = self.interpreter.tensor(self.input_details[0]['index'])()
+        img_arr = img_arr.reshape(input_view.shape)
+        if self.raw_input:
+            # the model quantizes the uint8 image itself
+            np.copyto(input_view, img_arr)
+        elif self.input_quantization is None:
+            normalize_image(img_arr, out=input_view)
+        else:
+            input_view[...] = self._quantize_input(normalize_image(img_arr))
+        del input_view
+        self.interpreter.invoke()
+        return self._steering_throttle(self._outputs())
 
+    @staticmethod
+    def _steering_throttle(outputs):
+        steering = float(outputs[0][0])
+        throttle = float(outputs[1][0]) if len(outputs) > 1 else 0.0
         return steering, throttle
 
+    def inference(self, img_arr, other_arr):
+        input_data = self._quantize_input(img_arr.reshape(self.input_shape))
+        return self._steering_throttle(self._invoke(input_data))
+
+    def inference_batch(self, img_arrs, other_arrs):
+        input_data = self._quantize_input(
+            img_arrs.reshape((len(img_arrs), *self.input_shape[1:])))
+        outputs = self._invoke(input_data)
+        if len(outputs) == 1:
+            outputs.append(np.zeros(len(img_arrs)))
+        return np.column_stack(outputs[:2])
+
     def get_input_shape(self):
         assert self.input_shape is not None, "Need to load model first"
         return self.input_shape
@@ -1,23 +1,41 @@
 import atexit
+import logging
 import os
+import queue
+import re
+import shutil
 import time
 from datetime import datetime
+from pathlib import Path
+from threading import Lock, current_thread
 import json
 
 import numpy as np
-from PIL import Image
 
-from donkeycar.parts.datastore_v2 import Manifest, ManifestIterator
+from donkeycar.memory import copy_if_read_only
+from donkeycar.parts.datastore_columnar import COLUMNS_DIR, \
+    ColumnarCatalog, ColumnarIterator
+from donkeycar.parts.datastore_v2 import Catalog, Manifest
+from donkeycar.parts.image_encoder import image_extension, write_image
+
+logger = logging.getLogger(__name__)
 
 
 class Tub(object):
     """
     A datastore to store sensor data in a key, value format. \n
-    Accepts str, int, float, image_array, image, and array data types.
+    Accepts str, int, float, image_array, image, and array data types. \n
+    Records can be committed in batches of `batch_size` records or every
+    `batch_ms` milliseconds, see `Manifest` for the `fsync` policies. \n
+    Image arrays are stored as `image_format` ('jpg', 'png' or 'raw') files. \n
+    A read only tub reads its records from the columnar catalog, when one
+    has been created with `convert_to_columnar()` and it is up to date.
     """
 
     def __init__(self, base_path, inputs=[], types=[], metadata=[],
-                 max_catalog_len=1000, read_only=False):
+                 max_catalog_len=1000, read_only=False, batch_size=1,
+                 batch_ms=0, fsync='never', image_format='jpg',
+                 image_quality=None):
         self.base_path = base_path
         self.images_base_path = os.path.join(self.base_path, Tub.images())
         self.inputs = inputs
@@ -25,8 +43,17 @@ class Tub(object):
         self.metadata = metadata
         self.manifest = Manifest(base_path, inputs=inputs, types=types,
                                  metadata=metadata, max_len=max_catalog_len,
-                                 read_only=read_only)
+                                 read_only=read_only, batch_size=batch_size,
+                                 batch_ms=batch_ms, fsync=fsync)
         self.input_types = dict(zip(self.inputs, self.types))
+        self.columnar = None
+        if read_only and ColumnarCatalog.exists(base_path):
+            self._open_columnar()
+        self.image_extension = image_extension(image_format)
+        self.image_quality = image_quality
+        # Serialises writes and deletes when records are written from a
+        # background thread, see TubWriter.update()
+        self.lock = Lock()
         # Create images folder if necessary
         if not os.path.exists(self.images_base_path):
             os.makedirs(self.images_base_path, exist_ok=True)
@@ -35,7 +62,21 @@ class Tub(object):
         """
         Can handle various data types including images.
         """
+        with self.lock:
+            self._write_record(record)
+
+    def _open_columnar(self):
+        columnar = ColumnarCatalog(os.path.join(self.base_path, COLUMNS_DIR),
+                                   read_only=True)
+        if columnar.current_index == self.manifest.current_index:
+            self.columnar = columnar
+        else:
+            print(f'Ignoring outdated columnar catalog in {self.base_path}')
+            columnar.close()
+
+    def _write_record(self, record):
         contents = dict()
+        images = list()
         for key, value in record.items():
             if value is None:
                 continue
@@ -58,11 +99,22 @@ class Tub(object):
                     contents[key] = list(value)
                 elif input_type == 'image_array':
                     # Handle image array
-                    image = Image.fromarray(np.uint8(value))
-                    name = Tub._image_file_name(self.manifest.current_index, key)
+                    name = Tub._image_file_name(self.manifest.current_index,
+                                                key, self.image_extension)
                     image_path = os.path.join(self.images_base_path, name)
-                    image.save(image_path)
+                    images.append((value, image_path))
                     contents[key] = name
+                elif input_type == 'gray16_array':
+                    # Depth images need a lossless 16 bit format
+                    name = Tub._image_file_name(self.manifest.current_index,
+                                                key, '.png')
+                    image_path = os.path.join(self.images_base_path, name)
+                    images.append((np.uint16(value), image_path))
+                    contents[key] = name
+
+        # All images of the record are written before the record itself
+        for image_array, image_path in images:
+            write_image(image_array, image_path, self.image_quality)
 
         # Private properties
         contents['_timestamp_ms'] = int(round(time.time() * 1000))
@@ -72,21 +124,81 @@ class Tub(object):
         self.manifest.write_record(contents)
 
     def delete_records(self, record_indexes):
-        self.manifest.delete_records(record_indexes)
+        with self.lock:
+            self.manifest.delete_records(record_indexes)
 
     def delete_last_n_records(self, n):
-        last_index = self.manifest.current_index
-        first_index = max(last_index - n, 0)
-        self.manifest.delete_records(range(first_index, last_index))
+        with self.lock:
+            last_index = self.manifest.current_index
+            first_index = max(last_index - n, 0)
+            self.manifest.delete_records(range(first_index, last_index))
 
     def restore_records(self, record_indexes):
-        self.manifest.restore_records(record_indexes)
+        with self.lock:
+            self.manifest.restore_records(record_indexes)
+
+    def flush(self):
+        with self.lock:
+            self.manifest.flush()
 
     def close(self):
-        self.manifest.close()
+        with self.lock:
+            self.manifest.close()
+            if self.columnar:
+                self.columnar.close()
+                self.columnar = None
+
+    def column(self, key, include_deleted=False):
+        """
+        Returns all values of an input as a NumPy array. Numeric inputs of a
+        columnar catalog are returned as a read-only memory mapped array
+        without copying, unless deleted records need to be filtered out.
+
+        :param key:             the input, e.g. 'user/angle'
+        :param include_deleted: whether to include records marked deleted
+        :return:                np.ndarray with one entry per record
+        """
+        if self.columnar:
+            values = self.columnar.column(key)
+            deleted = self.manifest.deleted_indexes
+            if include_deleted or not deleted:
+                return values
+            indexes = self.columnar.column('_index')
+            keep = ~np.isin(indexes, list(deleted))
+            return values[keep]
+        values = [record.get(key) for record in self]
+        return np.array(values)
+
+    def get_records(self, indexes):
+        """
+        Reads records by their record index (`_index`), records marked as
+        deleted are skipped. See Manifest.get_records().
+        """
+        if self.columnar:
+            deleted = self.manifest.deleted_indexes
+            return self.columnar.get_records([index for index in indexes
+                                              if index not in deleted])
+        return self.manifest.get_records(indexes)
+
+    def __getitem__(self, key):
+        """
+        Random access by position, tub[i] and tub[a:b] return the same
+        records as list(tub)[i] and list(tub)[a:b].
+        """
+        if isinstance(key, slice):
+            positions = range(*key.indices(len(self)))
+            return self.get_records([self.manifest.index_of(position)
+                                     for position in positions])
+        records = self.get_records([self.manifest.index_of(key)])
+        if not records:
+            raise IndexError(f'Record at position {key} could not be read')
+        return records[0]
 
     def __iter__(self):
-        return ManifestIterator(self.manifest)
+        if self.columnar:
+            return ColumnarIterator(self.columnar,
+                                    self.manifest.deleted_indexes)
+        return self.manifest.__iter__()
 
     def __len__(self):
         return self.manifest.__len__()
@@ -105,31 +217,121 @@ class Tub(object):
 
 class TubWriter(object):
     """
-    A Donkey part, which can write records to the datastore.
+    A Donkey part, which can write records to the datastore. \n
+    When added as a threaded part, run_threaded() only hands the record to a
+    bounded queue and update() writes it from a background thread, so image
+    encoding and disk stalls stay out of the vehicle loop. When the queue is
+    full the record is either dropped ('drop') or the vehicle loop waits
+    ('block'), depending on `queue_policy`. close() waits up to
+    `close_timeout` seconds for the writer thread to drain the queue.
     """
+    QUEUE_POLICIES = ('block', 'drop')
+
     def __init__(self, base_path, inputs=[], types=[], metadata=[],
-                 max_catalog_len=1000):
-        self.tub = Tub(base_path, inputs, types, metadata, max_catalog_len)
+                 max_catalog_len=1000, batch_size=1, batch_ms=0,
+                 fsync='never', queue_size=100, queue_policy='block',
+                 image_format='jpg', image_quality=None, close_timeout=10.0):
+        if queue_policy not in TubWriter.QUEUE_POLICIES:
+            raise ValueError(f'Unknown queue policy {queue_policy}, expected '
+                             f'one of {TubWriter.QUEUE_POLICIES}')
+        self.tub = Tub(base_path, inputs, types, metadata, max_catalog_len,
+                       batch_size=batch_size, batch_ms=batch_ms, fsync=fsync,
+                       image_format=image_format, image_quality=image_quality)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_policy = queue_policy
+        self.dropped = 0
+        self.on = True
+        self.closed = False
+        self.close_timeout = close_timeout
+        # the thread running update(), set when it starts
+        self.thread = None
 
-    def run(self, *args):
+    def _make_record(self, args):
         assert len(self.tub.inputs) == len(args), \
             f'Expected {len(self.tub.inputs)} inputs but received {len(args)}'
-        record = dict(zip(self.tub.inputs, args))
+        return dict(zip(self.tub.inputs, args))
+
+    def run(self, *args):
+        record = self._make_record(args)
         self.tub.write_record(record)
         return self.tub.manifest.current_index
 
+    def update(self):
+        self.thread = current_thread()
+        while self.on or not self.queue.empty():
+            try:
+                record = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                # Recording paused, commit whatever is still buffered
+                try:
+                    self.tub.flush()
+                except Exception as e:
+                    logger.error(f'Failed to commit records: {e}')
+                continue
+            try:
+                self.tub.write_record(record)
+            except Exception as e:
+                logger.error(f'Failed to write record: {e}')
+            finally:
+                self.queue.task_done()
+
+    def run_threaded(self, *args):
+        """
+        Queues the record and returns the number of records written so far
+        and the current queue depth. Read-only arrays are views into a
+        FrameBuffer, which gets overwritten before the queue is written,
+        so the queue keeps copies of them.
+        """
+        self._check_writer()
+        record = self._make_record(args)
+        for key, value in record.items():
+            record[key] = copy_if_read_only(value)
+        if self.queue_policy == 'block':
+            while True:
+                try:
+                    self.queue.put(record, timeout=0.1)
+                    break
+                except queue.Full:
+                    self._check_writer()
+        else:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                logger.warning(f'TubWriter queue full, dropped '
+                               f'{self.dropped} records so far')
+        return self.tub.manifest.current_index, self.queue.qsize()
+
+    def _check_writer(self):
+        if self.thread is not None and not self.thread.is_alive():
+            raise RuntimeError('TubWriter thread stopped, records can not be '
+                               'written')
+
     def __iter__(self):
         return self.tub.__iter__()
 
     def close(self):
+        if self.closed:
+            return
+        # Let the writer thread drain the queue before closing the tub
+        self.on = False
+        deadline = time.monotonic() + self.close_timeout
+        # a writer thread which is just starting still drains the queue
+        while self.thread is None and not self.queue.empty() \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if self.thread is not None:
+            self.thread.join(max(0.0, deadline - time.monotonic()))
+        if not self.queue.empty():
+            logger.error(f'TubWriter closed with {self.queue.qsize()} '
+                         f'records not written')
+        self.closed = True
         self.tub.close()
 
     def shutdown(self):
         self.close()
 
 
-
-
 class TubWiper:
     """
     Donkey part which deletes a bunch of records from the end of tub.
@@ -162,4 +364,184 @@ class TubWiper:
                 self._active_loop = True
         else:
             # trigger released, reset active loop
-            self._active_loop = False
\ No newline at end of file
+            self._active_loop = False
+
+
+COMPACTION_PROGRESS = 'compaction.json'
+IMAGE_TYPES = ('image', 'image_array', 'gray16_array')
+CATALOG_FILE = re.compile(r'^catalog_(\d+)\.(catalog|catalog_manifest|'
+                          r'catalog_index)$')
+
+
+def compact_tub(base_path, keep_index_map=True):
+    """
+    Physically removes the records marked as deleted from a tub and deletes
+    images which are no longer referenced. \n
+    Catalogs are rewritten one at a time into new catalogs, with records
+    renumbered to consecutive indexes. Images of the remaining records are
+    hard linked to new names, so the tub stays valid until the manifest is
+    switched to the new catalogs in one atomic replace. Progress is kept in
+    `compaction.json`, an interrupted compaction resumes where it stopped.
+    The tub must not be open for writing while it gets compacted.
+
+    :param base_path:       path of the tub
+    :param keep_index_map:  keep the index a record had before its first
+                            compaction as `_original_index`
+    :return:                tuple of (removed records, removed images)
+    """
+    base_path = Path(os.path.expanduser(base_path)).absolute()
+    progress_path = base_path / COMPACTION_PROGRESS
+    manifest = Manifest(base_path, read_only=True)
+    # Opening a manifest starts a new session, reload the stored metadata
+    manifest._read_contents()
+    source = {'paths': manifest.catalog_paths,
+              'current_index': manifest.current_index,
+              'deleted': len(manifest.deleted_indexes)}
+    progress = None
+    if progress_path.exists():
+        with open(progress_path, 'r') as f:
+            progress = json.load(f)
+    if progress and not progress['swapped'] and progress['source'] != source:
+        print(f'Tub {base_path} changed since the last compaction started, '
+              f'starting over')
+        progress['generation'] += 1
+        progress.update(source=source, done=0, catalogs=list(), next_index=0)
+    if progress is None:
+        if not manifest.deleted_indexes:
+            manifest.close()
+            return 0, _collect_images(base_path)
+        generation = manifest.manifest_metadata.get('compactions', 0) + 1
+        progress = {'source': source, 'generation': generation, 'done': 0,
+                    'catalogs': list(), 'next_index': 0, 'swapped': False}
+
+    if not progress['swapped']:
+        _compact_catalogs(base_path, manifest, progress, progress_path,
+                          keep_index_map)
+        manifest.manifest_metadata['compactions'] = progress['generation']
+        manifest.replace_catalogs(progress['catalogs'],
+                                  progress['next_index'])
+        progress['swapped'] = True
+        _write_progress(progress_path, progress)
+    manifest.close()
+
+    # Remove the old catalogs, and catalogs of an interrupted run
+    keep = set(progress['catalogs'])
+    for name in os.listdir(base_path):
+        match = CATALOG_FILE.match(name)
+        if match and f'catalog_{match.group(1)}.catalog' not in keep:
+            os.remove(base_path / name)
+    # Record indexes changed, so the columnar catalog is outdated
+    shutil.rmtree(base_path / COLUMNS_DIR, ignore_errors=True)
+    removed_images = _collect_images(base_path)
+    os.remove(progress_path)
+    removed_records = progress['source']['current_index'] \
+        - progress['next_index']
+    return removed_records, removed_images
+
+
+def _write_progress(progress_path, progress):
+    temp_path = progress_path.with_suffix('.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(progress, f)
+    os.replace(temp_path, progress_path)
+
+
+def _compact_catalogs(base_path, manifest, progress, progress_path,
+                      keep_index_map):
+    input_types = dict(zip(manifest.inputs, manifest.types))
+    images_path = base_path / Tub.images()
+    generation = progress['generation']
+    target = None
+    if progress['catalogs']:
+        # Drop records appended after the last recorded progress
+        target = Catalog(base_path / progress['catalogs'][-1])
+        lines = progress['next_index'] - target.manifest.start_index()
+        if target.seekable.lines() > lines:
+            target.seekable.truncate_until_end(lines)
+
+    for position in range(progress['done'], len(manifest.catalog_paths)):
+        catalog = Catalog(base_path / manifest.catalog_paths[position],
+                          read_only=True)
+        index = catalog.manifest.start_index()
+        catalog.seekable.seek_line_start(1)
+        contents = catalog.seekable.readline()
+        records = list()
+        while contents:
+            if index not in manifest.deleted_indexes:
+                try:
+                    records.append((index, json.loads(contents)))
+                except Exception:
+                    print(f'Ignoring record at index {index}')
+            index += 1
+            contents = catalog.seekable.readline()
+        catalog.close()
+
+        for index, record in records:
+            new_index = progress['next_index']
+            if target is None or new_index % manifest.max_len == 0:
+                if target is not None:
+                    target.close()
+                name = _new_catalog_name(base_path)
+                target = Catalog(base_path / name, start_index=new_index)
+                progress['catalogs'].append(name)
+            for key, value in record.items():
+                if input_types.get(key) in IMAGE_TYPES:
+                    record[key] = _link_image(images_path, value, new_index,
+                                              key, generation)
+            if keep_index_map:
+                record.setdefault('_original_index', index)
+            record['_index'] = new_index
+            target.write_record(record)
+            progress['next_index'] += 1
+
+        if target is not None:
+            target.sync()
+        progress['done'] = position + 1
+        _write_progress(progress_path, progress)
+
+    if target is not None:
+        target.close()
+
+
+def _new_catalog_name(base_path):
+    numbers = [int(match.group(1)) for match in
+               map(CATALOG_FILE.match, os.listdir(base_path)) if match]
+    return f'catalog_{max(numbers, default=-1) + 1}.catalog'
+
+
+def _link_image(images_path, name, index, key, generation):
+    # The generation suffix keeps new names apart from the names of the
+    # current catalogs and from the names of newly recorded images.
+    extension = os.path.splitext(name)[1]
+    new_name = f'{index}_{key.replace("/", "_")}_c{generation}{extension}'
+    source_path = images_path / name
+    target_path = images_path / new_name
+    if not source_path.exists():
+        return name
+    if not target_path.exists():
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            # File systems without hard links, e.g. FAT formatted drives
+            shutil.copyfile(source_path, target_path)
+    return new_name
+
+
+def _collect_images(base_path):
+    """ Deletes images which are not referenced by any record. """
+    tub = Tub(base_path.as_posix(), read_only=True)
+    input_types = zip(tub.manifest.inputs, tub.manifest.types)
+    image_keys = [key for key, input_type in input_types
+                  if input_type in IMAGE_TYPES]
+    referenced = set()
+    for record in tub.manifest:
+        for key in image_keys:
+            if key in record:
+                referenced.add(record[key])
+    tub.close()
+    removed = 0
+    for name in os.listdir(tub.images_base_path):
+        if name not in referenced:
+            os.remove(os.path.join(tub.images_base_path, name))
+            removed += 1
+    return removed
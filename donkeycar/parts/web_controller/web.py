@@ -23,6 +23,7 @@ import tornado.websocket
 from socket import gethostname
 
 from ... import utils
+from ...memory import FrameBuffer
 
 
 class RemoteWebServer():
@@ -116,6 +117,9 @@ class LocalWebController(tornado.web.Application):
         self.num_records = 0
         self.wsclients = []
         self.loop = None
+        # frames for the video handler, which encodes them on the tornado
+        # thread
+        self.buffer = FrameBuffer()
 
 
         handlers = [
@@ -156,7 +160,8 @@ class LocalWebController(tornado.web.Application):
                 pass
 
     def run_threaded(self, img_arr=None, num_records=0):
-        self.img_arr = img_arr
+        if img_arr is not None:
+            self.buffer.write(img_arr)
         self.num_records = num_records
 
         # Send record count to websocket clients
@@ -168,7 +173,8 @@ class LocalWebController(tornado.web.Application):
         return self.angle, self.throttle, self.mode, self.recording
 
     def run(self, img_arr=None):
-        self.img_arr = img_arr
+        if img_arr is not None:
+            self.buffer.write(img_arr)
         return self.angle, self.throttle, self.mode, self.recording
 
     def shutdown(self):
@@ -289,10 +295,12 @@ class VideoAPI(RequestHandler):
         while True:
 
             interval = .01
-            if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr'):
+            # the frame stays valid until the next read, the handlers of all
+            # clients run on the tornado thread
+            img_arr, seq = self.application.buffer.read()
+            if served_image_timestamp + interval < time.time() and seq:
 
-                img = utils.arr_to_binary(self.application.img_arr)
+                img = utils.arr_to_binary(img_arr)
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))
@@ -326,6 +334,9 @@ class WebFpv(Application):
         self.port = port
         this_dir = os.path.dirname(os.path.realpath(__file__))
         self.static_file_path = os.path.join(this_dir, 'templates', 'static')
+        # frames for the video handler, which encodes them on the tornado
+        # thread
+        self.buffer = FrameBuffer()
 
         """Construct and serve the tornado application."""
         handlers = [
@@ -347,10 +358,12 @@ class WebFpv(Application):
         IOLoop.instance().start()
 
     def run_threaded(self, img_arr=None):
-        self.img_arr = img_arr
+        if img_arr is not None:
+            self.buffer.write(img_arr)
 
     def run(self, img_arr=None):
-        self.img_arr = img_arr
+        if img_arr is not None:
+            self.buffer.write(img_arr)
 
     def shutdown(self):
         pass
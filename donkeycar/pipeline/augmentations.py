@@ -1,89 +1,219 @@
 import cv2
 import numpy as np
 import logging
-import imgaug.augmenters as iaa
+from typing import Dict, List, Optional, Tuple
 from donkeycar.config import Config
 
 
 logger = logging.getLogger()
 
 
-class Augmentations(object):
+class Augmentation(object):
     """
-    Some ready to use image augumentations.
+    Base class of the batch augmentations. An augmentation works on a whole
+    uint8 batch of shape (N, H, W, C) and draws its random parameters per
+    image from the given numpy random generator. Masks and kernels which
+    only depend on the image shape are computed once and cached.
     """
+    # Set by augmentations which need the steering angle to be mirrored
+    changes_angle = False
 
-    @classmethod
-    def crop(cls, left, right, top, bottom, keep_size=False):
-        """
-        The image augumentation sequence.
-        Crops based on a region of interest among other things.
-        left, right, top & bottom are the number of pixels to crop.
-        """
-        augmentation = iaa.Crop(px=(top, right, bottom, left),
-                                keep_size=keep_size)
-        return augmentation
+    def __call__(self, images: np.ndarray, rng: np.random.Generator,
+                 angles: Optional[np.ndarray] = None) \
+            -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        return self.apply(images, rng), angles
+
+    def apply(self, images: np.ndarray, rng: np.random.Generator) \
+            -> np.ndarray:
+        raise NotImplementedError
+
+    def output_shape(self, shape: Tuple[Optional[int], ...]) \
+            -> Tuple[Optional[int], ...]:
+        """ Returns the (H, W, C) shape of augmented images of shape """
+        return tuple(shape)
+
+
+class Crop(Augmentation):
+    """
+    Crops left, right, top & bottom pixels, the image gets smaller.
+    """
+    def __init__(self, left: int, right: int, top: int, bottom: int) -> None:
+        self.left, self.right, self.top, self.bottom = left, right, top, bottom
+
+    def apply(self, images, rng):
+        height, width = images.shape[1:3]
+        return images[:, self.top:height - self.bottom,
+                      self.left:width - self.right]
+
+    def output_shape(self, shape):
+        height, width, depth = shape
+        return (None if height is None else height - self.top - self.bottom,
+                None if width is None else width - self.left - self.right,
+                depth)
+
+
+class TrapezoidalMask(Augmentation):
+    """
+    Uses a binary mask to generate a trapezoidal region of interest.
+    Especially useful in filtering out uninteresting features from an
+    input image.
+    """
+    def __init__(self, lower_left: int, lower_right: int, upper_left: int,
+                 upper_right: int, min_y: int, max_y: int) -> None:
+        # # # # # # # # # # # # #
+        #       ul     ur          min_y
+        #
+        #
+        #
+        #    ll             lr     max_y
+        self.points = np.array([[upper_left, min_y], [upper_right, min_y],
+                                [lower_right, max_y], [lower_left, max_y]],
+                               dtype=np.int32)
+        self.masks: Dict[Tuple[int, ...], np.ndarray] = dict()
+
+    def mask(self, shape: Tuple[int, ...]) -> np.ndarray:
+        mask = self.masks.get(shape)
+        if mask is None:
+            mask = np.zeros(shape[:2], dtype=np.uint8)
+            cv2.fillConvexPoly(mask, self.points, 1)
+            mask = mask[..., np.newaxis]
+            self.masks[shape] = mask
+        return mask
+
+    def apply(self, images, rng):
+        return images * self.mask(images.shape[1:])
+
+
+class Multiply(Augmentation):
+    """
+    Multiplies each image with a factor drawn from interval.
+    """
+    def __init__(self, interval: Tuple[float, float]) -> None:
+        self.interval = interval
+
+    def apply(self, images, rng):
+        factors = rng.uniform(*self.interval, size=len(images))
+        result = images * factors.astype(np.float32)[:, None, None, None]
+        return np.clip(result, 0, 255).astype(np.uint8)
+
+
+class Brightness(Augmentation):
+    """
+    Adds a brightness offset drawn from interval to each image, the
+    interval is given as a fraction of the full range of 255.
+    """
+    def __init__(self, interval: Tuple[float, float]) -> None:
+        self.interval = interval
+
+    def apply(self, images, rng):
+        offsets = rng.uniform(*self.interval, size=len(images)) * 255
+        result = images + offsets.astype(np.float32)[:, None, None, None]
+        return np.clip(result, 0, 255).astype(np.uint8)
 
-    @classmethod
-    def trapezoidal_mask(cls, lower_left, lower_right, upper_left, upper_right,
-                         min_y, max_y):
-        """
-        Uses a binary mask to generate a trapezoidal region of interest.
-        Especially useful in filtering out uninteresting features from an
-        input image.
-        """
-        def _transform_images(images, random_state, parents, hooks):
-            # Transform a batch of images
-            transformed = []
-            mask = None
-            for image in images:
-                if mask is None:
-                    mask = np.zeros(image.shape, dtype=np.int32)
-                    # # # # # # # # # # # # #
-                    #       ul     ur          min_y
-                    #
-                    #
-                    #
-                    #    ll             lr     max_y
-                    points = [
-                        [upper_left, min_y],
-                        [upper_right, min_y],
-                        [lower_right, max_y],
-                        [lower_left, max_y]
-                    ]
-                    cv2.fillConvexPoly(mask, np.array(points, dtype=np.int32),
-                                       [255, 255, 255])
-                    mask = np.asarray(mask, dtype='bool')
-
-                masked = np.multiply(image, mask)
-                transformed.append(masked)
-
-            return transformed
-
-        def _transform_keypoints(keypoints_on_images, random_state, parents, hooks):
-            # No-op
-            return keypoints_on_images
-
-        augmentation = iaa.Lambda(func_images=_transform_images,
-                                  func_keypoints=_transform_keypoints)
-        return augmentation
+
+class GaussianBlur(Augmentation):
+    """
+    Blurs each image with a sigma drawn from interval. Sigmas are rounded
+    to 0.1 so kernels can be cached.
+    """
+    def __init__(self, interval: Tuple[float, float]) -> None:
+        self.interval = interval
+        self.kernels: Dict[float, np.ndarray] = dict()
+
+    def kernel(self, sigma: float) -> np.ndarray:
+        kernel = self.kernels.get(sigma)
+        if kernel is None:
+            # Same kernel size as imgaug uses
+            size = int(max(3, 2 * round(4 * sigma) + 1))
+            kernel = cv2.getGaussianKernel(size, sigma)
+            self.kernels[sigma] = kernel
+        return kernel
+
+    def apply(self, images, rng):
+        sigmas = np.round(rng.uniform(*self.interval, size=len(images)), 1)
+        result = np.empty_like(images)
+        for i, (image, sigma) in enumerate(zip(images, sigmas)):
+            if sigma < 0.1:
+                result[i] = image
+                continue
+            kernel = self.kernel(float(sigma))
+            blurred = cv2.sepFilter2D(image, -1, kernel, kernel)
+            result[i] = blurred.reshape(image.shape)
+        return result
+
+
+class Shadow(Augmentation):
+    """
+    Darkens the part of each image left or right of a random line from the
+    top to the bottom edge, with a factor drawn from interval.
+    """
+    def __init__(self, interval: Tuple[float, float]) -> None:
+        self.interval = interval
+        self.grids: Dict[Tuple[int, int], Tuple[np.ndarray, np.ndarray]] \
+            = dict()
+
+    def grid(self, height: int, width: int) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        grid = self.grids.get((height, width))
+        if grid is None:
+            rows = (np.arange(height, dtype=np.float32) / height)[:, None]
+            columns = np.arange(width, dtype=np.float32)[None, :]
+            grid = rows, columns
+            self.grids[(height, width)] = grid
+        return grid
+
+    def apply(self, images, rng):
+        n, height, width = images.shape[:3]
+        rows, columns = self.grid(height, width)
+        top = rng.uniform(0, width, size=n).astype(np.float32)
+        bottom = rng.uniform(0, width, size=n).astype(np.float32)
+        left = rng.random(size=n) < 0.5
+        factors = rng.uniform(*self.interval, size=n).astype(np.float32)
+        # x position of the line in each row, shape (N, H, 1)
+        line = top[:, None, None] \
+            + (bottom - top)[:, None, None] * rows[None, :, :]
+        shadow = (columns[None, :, :] < line) == left[:, None, None]
+        scale = np.where(shadow, factors[:, None, None], np.float32(1))
+        result = images * scale[..., None]
+        return result.astype(np.uint8)
+
+
+class Flip(Augmentation):
+    """
+    Mirrors images horizontally with the given probability. The steering
+    angle of mirrored images changes its sign.
+    """
+    changes_angle = True
+
+    def __init__(self, probability: float = 0.5) -> None:
+        self.probability = probability
+
+    def __call__(self, images, rng, angles=None):
+        flipped = rng.random(size=len(images)) < self.probability
+        if not flipped.any():
+            return images, angles
+        images = images.copy()
+        images[flipped] = images[flipped, :, ::-1]
+        if angles is not None:
+            angles = np.where(flipped, -angles, angles)
+        return images, angles
 
 
 class ImageAugmentation:
     def __init__(self, cfg):
         aug_list = getattr(cfg, 'AUGMENTATIONS', [])
-        augmentations = [ImageAugmentation.create(a, cfg) for a in aug_list]
-        self.augmentations = iaa.Sequential(augmentations)
+        self.augmentations: List[Augmentation] \
+            = [ImageAugmentation.create(a, cfg) for a in aug_list]
 
     @classmethod
-    def create(cls, aug_type: str, config: Config) -> iaa.meta.Augmenter:
+    def create(cls, aug_type: str, config: Config) -> Augmentation:
         if aug_type == 'CROP':
-            return Augmentations.crop(left=config.ROI_CROP_TOP,
-                                      right=config.ROI_CROP_TOP,
-                                      bottom=config.ROI_CROP_BOTTOM,
-                                      top=config.ROI_CROP_TOP)
+            return Crop(left=getattr(config, 'ROI_CROP_LEFT', 0),
+                        right=getattr(config, 'ROI_CROP_RIGHT', 0),
+                        bottom=config.ROI_CROP_BOTTOM,
+                        top=config.ROI_CROP_TOP)
         elif aug_type == 'TRAPEZE':
-            return Augmentations.trapezoidal_mask(
+            return TrapezoidalMask(
                         lower_left=config.ROI_TRAPEZE_LL,
                         lower_right=config.ROI_TRAPEZE_LR,
                         upper_left=config.ROI_TRAPEZE_UL,
@@ -94,13 +224,68 @@ class ImageAugmentation:
         elif aug_type == 'MULTIPLY':
             interval = getattr(config, 'AUG_MULTIPLY_RANGE', (0.5, 1.5))
             logger.info(f'Creating augmentation {aug_type} {interval}')
-            return iaa.Multiply(interval)
+            return Multiply(interval)
 
         elif aug_type == 'BLUR':
             interval = getattr(config, 'AUG_BLUR_RANGE', (0.0, 3.0))
             logger.info(f'Creating augmentation {aug_type} {interval}')
-            return iaa.GaussianBlur(sigma=interval)
+            return GaussianBlur(interval)
+
+        elif aug_type == 'BRIGHTNESS':
+            interval = getattr(config, 'AUG_BRIGHTNESS_RANGE', (-0.2, 0.2))
+            logger.info(f'Creating augmentation {aug_type} {interval}')
+            return Brightness(interval)
+
+        elif aug_type == 'SHADOW':
+            interval = getattr(config, 'AUG_SHADOW_RANGE', (0.5, 0.9))
+            logger.info(f'Creating augmentation {aug_type} {interval}')
+            return Shadow(interval)
+
+        elif aug_type == 'FLIP':
+            probability = getattr(config, 'AUG_FLIP_PROBABILITY', 0.5)
+            logger.info(f'Creating augmentation {aug_type} {probability}')
+            return Flip(probability)
+        raise ValueError(f'Unknown augmentation {aug_type}')
+
+    @property
+    def changes_angle(self) -> bool:
+        return any(aug.changes_angle for aug in self.augmentations)
+
+    def output_shape(self, shape: Tuple[Optional[int], ...]) \
+            -> Tuple[Optional[int], ...]:
+        """ Returns the (H, W, C) shape of augmented images of shape,
+            augmentations like CROP make images smaller. """
+        for augmentation in self.augmentations:
+            shape = augmentation.output_shape(shape)
+        return tuple(shape)
 
     def augment(self, img_arr):
-        aug_img_arr = self.augmentations.augment_image(img_arr)
-        return aug_img_arr
+        """
+        Augments a single image. Augmentations which change the steering
+        angle are skipped, as there is no angle to mirror.
+        """
+        images, _ = self.augment_batch(img_arr[np.newaxis])
+        return images[0]
+
+    def augment_batch(self, img_arrs: np.ndarray,
+                      angles: Optional[np.ndarray] = None,
+                      seed: Optional[int] = None) \
+            -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Augments a uint8 batch of shape (N, H, W, C). Augmentations which
+        change the steering angle, like FLIP, only run if angles are given.
+        Calls don't share random state, so batches can be augmented
+        concurrently and reproducibly with a seed.
+
+        :param img_arrs:    batch of images
+        :param angles:      optional steering angles of the images
+        :param seed:        seed of the random generator
+        :return:            tuple of augmented images and angles
+        """
+        rng = np.random.default_rng(seed)
+        images = np.asarray(img_arrs, dtype=np.uint8)
+        for augmentation in self.augmentations:
+            if augmentation.changes_angle and angles is None:
+                continue
+            images, angles = augmentation(images, rng, angles)
+        return images, angles
@@ -0,0 +1,171 @@
+import json
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from donkeycar.config import Config
+
+
+class DiskImageCache(object):
+    """
+    Stores decoded and resized uint8 image arrays in one memory mapped data
+    file, so later training runs can skip decoding jpgs. \n
+    `images.dat` holds the raw arrays back to back, `images.idx` has one
+    json line per array with its key, offset and shape. A line is only
+    appended once its array is written, an interrupted write leaves an
+    unreferenced tail which gets overwritten. Only the process which opened
+    the cache adds entries, forked data loader workers only read.
+    """
+    DATA_FILE = 'images.dat'
+    INDEX_FILE = 'images.idx'
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+        self.entries = dict()
+        self.size = 0
+        self.pid = os.getpid()
+        index_path = os.path.join(self.path, DiskImageCache.INDEX_FILE)
+        data_path = os.path.join(self.path, DiskImageCache.DATA_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Partially written last line
+                        continue
+                    offset, shape = entry['offset'], tuple(entry['shape'])
+                    self.entries[entry['key']] = (offset, shape)
+                    self.size = max(self.size, offset + int(np.prod(shape)))
+        self.index_file = open(index_path, 'a')
+        self.data_file = open(data_path, 'a+b')
+        self.data_file.truncate(self.size)
+        self.mmap = None
+
+    def _map(self, end: int) -> None:
+        if self.mmap is None or len(self.mmap) < end:
+            if self.mmap is not None:
+                self.mmap.close()
+            self.mmap = mmap.mmap(self.data_file.fileno(), length=self.size,
+                                  access=mmap.ACCESS_READ)
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, shape = entry
+        length = int(np.prod(shape))
+        self._map(offset + length)
+        return np.frombuffer(self.mmap, dtype=np.uint8, count=length,
+                             offset=offset).reshape(shape).copy()
+
+    def put(self, key: str, image: np.ndarray) -> None:
+        if key in self.entries or os.getpid() != self.pid \
+                or image.dtype != np.uint8 \
+                or self.size + image.nbytes > self.max_bytes:
+            return
+        self.data_file.write(np.ascontiguousarray(image).tobytes())
+        self.data_file.flush()
+        entry = {'key': key, 'offset': self.size, 'shape': image.shape}
+        self.index_file.write(json.dumps(entry) + '\n')
+        self.index_file.flush()
+        self.entries[key] = (self.size, image.shape)
+        self.size += image.nbytes
+
+    def close(self) -> None:
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        self.index_file.close()
+        self.data_file.close()
+
+
+class ImageCache(object):
+    """
+    A dataset level cache of decoded images, shared by all records and
+    epochs. Images are kept in memory up to a byte budget, least recently
+    used images are evicted first. An optional DiskImageCache keeps the
+    resized arrays across training runs. Keys combine the tub path, the
+    image name and the target shape, so changing the image size in the
+    config does not return stale images.
+    """
+
+    def __init__(self, max_bytes: int, disk_path: Optional[str] = None,
+                 disk_max_bytes: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.images = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.disk = DiskImageCache(disk_path, disk_max_bytes) \
+            if disk_path else None
+
+    @classmethod
+    def from_config(cls, config: Config) -> 'ImageCache':
+        max_bytes = getattr(config, 'CACHE_IMAGES_MAX_BYTES', 2 ** 31) \
+            if getattr(config, 'CACHE_IMAGES', True) else 0
+        return cls(max_bytes,
+                   disk_path=getattr(config, 'CACHE_IMAGES_DISK_PATH', None),
+                   disk_max_bytes=getattr(config, 'CACHE_IMAGES_DISK_MAX_BYTES',
+                                          0))
+
+    @staticmethod
+    def key(base_path: str, image_name: str, shape: Tuple[int, ...]) -> str:
+        shape_str = 'x'.join(str(dim) for dim in shape)
+        return f'{os.path.abspath(base_path)}/{image_name}@{shape_str}'
+
+    def get(self, key: str, load: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Returns the image for key, calls load() to decode it on a miss.
+        Cached images are read-only, as all records share them.
+        """
+        with self.lock:
+            image = self.images.get(key)
+            if image is not None:
+                self.images.move_to_end(key)
+                self.hits += 1
+                return image
+            image = self.disk.get(key) if self.disk else None
+            if image is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if image is None:
+            image = load()
+            if image is None:
+                return None
+            if self.disk:
+                with self.lock:
+                    self.disk.put(key, image)
+        self._put(key, image)
+        return image
+
+    def _put(self, key: str, image: np.ndarray) -> None:
+        if image.nbytes > self.max_bytes:
+            return
+        image.flags.writeable = False
+        with self.lock:
+            if key in self.images:
+                return
+            self.images[key] = image
+            self.size += image.nbytes
+            while self.size > self.max_bytes:
+                _, evicted = self.images.popitem(last=False)
+                self.size -= evicted.nbytes
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def close(self) -> None:
+        with self.lock:
+            self.images.clear()
+            self.size = 0
+            if self.disk:
+                self.disk.close()
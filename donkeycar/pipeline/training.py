@@ -1,16 +1,21 @@
 import math
 import os
+import random
+from copy import copy
 from time import time
-from typing import List, Dict, Union, Tuple
+from typing import Any, Callable, Iterator, List, Dict, Optional, Union, \
+    Tuple
 
 from donkeycar.config import Config
 from donkeycar.parts.keras import KerasPilot
-from donkeycar.parts.tflite import keras_model_to_tflite
+from donkeycar.parts.tflite import keras_model_to_tflite, TFLitePilot
+from donkeycar.parts.onnx import keras_model_to_onnx
 from donkeycar.pipeline.database import PilotDatabase
 from donkeycar.pipeline.sequence import TubRecord, TubSequence, TfmIterator
 from donkeycar.pipeline.types import TubDataset
 from donkeycar.pipeline.augmentations import ImageAugmentation
-from donkeycar.utils import get_model_by_type, normalize_image
+from donkeycar.utils import get_model_by_type, normalize_image, \
+    ONE_BYTE_SCALE
 import tensorflow as tf
 import numpy as np
 
@@ -20,7 +25,14 @@ class BatchSequence(object):
     The idea is to have a shallow sequence with types that can hydrate
     themselves to np.ndarray initially and later into the types required by
     tf.data (i.e. dictionaries or np.ndarrays).
+
+    With TRAIN_PIPELINE = 'parallel' the tf.data pipeline is built from
+    record indexes instead of a single generator. Records are loaded in a
+    parallel map, augmented per batch and normalised in the graph.
+    TRAIN_SEED makes shuffling and augmentation reproducible.
     """
+    PIPELINE_MODES = ('generator', 'parallel')
+
     def __init__(self,
                  model: KerasPilot,
                  config: Config,
@@ -32,6 +44,16 @@ class BatchSequence(object):
         self.batch_size = self.config.BATCH_SIZE
         self.is_train = is_train
         self.augmentation = ImageAugmentation(config)
+        self.pipeline_mode = getattr(config, 'TRAIN_PIPELINE', 'generator')
+        if self.pipeline_mode not in BatchSequence.PIPELINE_MODES:
+            raise ValueError(f'Unknown training pipeline '
+                             f'{self.pipeline_mode}, expected one of '
+                             f'{BatchSequence.PIPELINE_MODES}')
+        self.seed = getattr(config, 'TRAIN_SEED', None)
+        if self.pipeline_mode == 'generator' and is_train \
+                and self.augmentation.changes_angle:
+            print('Augmentations which mirror the steering angle only run '
+                  'with the parallel training pipeline')
         self.pipeline = self._create_pipeline()
 
     def __len__(self) -> int:
@@ -48,8 +70,14 @@ class BatchSequence(object):
             # for multiple input tensors the return value here is a tuple
             # where the image is in first slot otherwise x0 is the image
             x1 = x0[0] if isinstance(x0, tuple) else x0
-            # apply augmentation to training data only
-            x2 = self.augmentation.augment(x1) if self.is_train else x1
+            # apply augmentation to training data only, sequence models get
+            # all images of a sequence, which are augmented as a batch
+            if not self.is_train:
+                x2 = x1
+            elif x1.ndim == 4:
+                x2 = self.augmentation.augment_batch(x1)[0]
+            else:
+                x2 = self.augmentation.augment(x1)
             # normalise image, assume other input data comes already normalised
             x3 = normalize_image(x2)
             # fill normalised image back into tuple if necessary
@@ -71,52 +99,270 @@ class BatchSequence(object):
 
     def create_tf_data(self) -> tf.data.Dataset:
         """ Assembles the tf data pipeline """
+        if self.pipeline_mode == 'parallel':
+            return self._create_parallel_tf_data()
         dataset = tf.data.Dataset.from_generator(
             generator=lambda: self.pipeline,
             output_types=self.model.output_types(),
             output_shapes=self.model.output_shapes())
         return dataset.repeat().batch(self.batch_size)
 
+    def _labels(self, record: TubRecord) -> Tuple[np.ndarray, ...]:
+        y0 = self.model.y_translate(self.model.y_transform(record))
+        return tuple(np.asarray(y0[key], dtype=np.float64)
+                     for key in self.model.output_shapes()[1])
+
+    def _load_record(self, index: int) -> Tuple[np.ndarray, ...]:
+        """ Loads the record at index as a flat tuple of arrays, the uint8
+            image first, then other x values, the y values and the index.
+            Runs in the parallel map of tf.data. """
+        record = self.sequence.records[int(index)]
+        x0 = self.model.x_transform(record)
+        x1 = x0 if isinstance(x0, tuple) else (x0, )
+        x2 = (np.asarray(x1[0]), ) + tuple(np.asarray(x, dtype=np.float64)
+                                           for x in x1[1:])
+        return x2 + self._labels(record) + (np.asarray(index), )
+
+    def _augment_batch(self, batch_index: int, images: np.ndarray,
+                       indexes: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """ Augments a batch of images. If augmentations mirror the
+            steering angle, the y values of the batch are returned too. """
+        seed = None if self.seed is None else self.seed + int(batch_index)
+        if images.ndim == 5:
+            # Batches of sequences augment all frames as one batch. Mirroring
+            # is skipped, as the labels belong to the whole sequence.
+            frames, _ = self.augmentation.augment_batch(
+                images.reshape((-1, *images.shape[2:])), seed=seed)
+            return frames.reshape((*images.shape[:2], *frames.shape[1:]))
+        if not self.augmentation.changes_angle:
+            return self.augmentation.augment_batch(images, seed=seed)[0]
+        records = [self.sequence.records[int(i)] for i in indexes]
+        angles = np.array([record.underlying['user/angle']
+                           for record in records], dtype=np.float64)
+        images, new_angles = self.augmentation.augment_batch(images, angles,
+                                                             seed)
+        labels = list()
+        for record, angle, new_angle in zip(records, angles, new_angles):
+            if new_angle != angle:
+                record = copy(record)
+                record.underlying = dict(record.underlying)
+                record.underlying['user/angle'] = float(new_angle)
+            labels.append(self._labels(record))
+        return (images, ) + tuple(np.stack(y) for y in zip(*labels))
+
+    def _create_parallel_tf_data(self) -> tf.data.Dataset:
+        """ Assembles the tf data pipeline from record indexes. Loading
+            records and augmenting batches run in parallel maps, the image
+            is normalised in the graph. """
+        autotune = tf.data.experimental.AUTOTUNE
+        # Keep the order of elements fixed when seeded
+        deterministic = self.seed is not None
+        y_keys = list(self.model.output_shapes()[1])
+        # Load one record to get the structure of x
+        sample = self._load_record(0)
+        num_x = len(sample) - len(y_keys) - 1
+        types = [tf.as_dtype(value.dtype) for value in sample]
+        shapes = [value.shape for value in sample]
+
+        def load(index):
+            values = tf.numpy_function(self._load_record, [index], types)
+            for value, shape in zip(values, shapes):
+                value.set_shape(shape)
+            return tuple(values)
+
+        # Mirroring changes the labels, except for sequences where it is
+        # skipped
+        mirror = self.augmentation.changes_angle and len(shapes[0]) == 3
+
+        def augmented_shape(shape):
+            # Augmentations like CROP change the height and width
+            shape = shape.as_list()
+            return shape[:-3] + list(
+                self.augmentation.output_shape(tuple(shape[-3:])))
+
+        def augment(batch_index, values):
+            inputs = [batch_index, values[0], values[-1]]
+            if not mirror:
+                images = tf.numpy_function(self._augment_batch, inputs,
+                                           values[0].dtype)
+                images.set_shape(augmented_shape(values[0].shape))
+                return (images, ) + values[1:]
+            # The y values change with the mirrored angles
+            y_values = values[num_x:-1]
+            results = tf.numpy_function(
+                self._augment_batch, inputs,
+                [values[0].dtype] + [y.dtype for y in y_values])
+            results[0].set_shape(augmented_shape(values[0].shape))
+            for result, value in zip(results[1:], y_values):
+                result.set_shape(value.shape)
+            return (results[0], ) + values[1:num_x] + tuple(results[1:]) \
+                + values[-1:]
+
+        def translate(*values):
+            x0 = values[:num_x]
+            # same float32 scaling as normalize_image()
+            img = tf.cast(x0[0], tf.float32) * np.float32(ONE_BYTE_SCALE)
+            x1 = (img, ) + x0[1:] if num_x > 1 else img
+            return self.model.x_translate(x1), dict(zip(y_keys,
+                                                        values[num_x:-1]))
+
+        dataset = tf.data.Dataset.range(len(self.sequence))
+        if self.is_train:
+            dataset = dataset.shuffle(len(self.sequence), seed=self.seed,
+                                      reshuffle_each_iteration=True)
+        dataset = dataset.repeat()
+        dataset = dataset.map(load, num_parallel_calls=autotune,
+                              deterministic=deterministic)
+        dataset = dataset.batch(self.batch_size)
+        if self.is_train and self.augmentation.augmentations:
+            dataset = dataset.enumerate().map(augment,
+                                              num_parallel_calls=autotune,
+                                              deterministic=deterministic)
+        return dataset.map(translate, num_parallel_calls=autotune,
+                           deterministic=deterministic)
+
+
+class ThroughputCallback(tf.keras.callbacks.Callback):
+    """
+    Reports the training throughput of each epoch in samples per second,
+    which is also added to the history as 'samples_per_sec'.
+    """
+    def __init__(self, batch_size: int) -> None:
+        super().__init__()
+        self.batch_size = batch_size
+        self.start = None
+        self.end = None
+        self.batches = 0
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.start = time()
+        self.batches = 0
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.batches += 1
+        self.end = time()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self.batches:
+            return
+        samples_per_sec = self.batches * self.batch_size \
+            / max(self.end - self.start, 1e-9)
+        print(f'Epoch {epoch + 1}: {samples_per_sec:.1f} samples/sec')
+        if logs is not None:
+            logs['samples_per_sec'] = samples_per_sec
+
+
+def representative_dataset(model: KerasPilot, records: List[TubRecord],
+                           num_samples: int, seed: Optional[int] = None) \
+        -> Callable[[], Iterator[List[np.ndarray]]]:
+    """
+    Creates the representative dataset which calibrates int8 quantization.
+
+    :param model:       trained keras pilot
+    :param records:     training records to draw the samples from
+    :param num_samples: number of records drawn at random
+    :param seed:        random seed of the drawing
+    :return:            callable returning an iterator of lists with the
+                        float32 model inputs of one record
+    """
+    sample = random.Random(seed).sample(records,
+                                        min(num_samples, len(records)))
+
+    def data_gen():
+        for record in sample:
+            x0 = model.x_transform(record)
+            x1 = x0 if isinstance(x0, tuple) else (x0, )
+            yield [normalize_image(x1[0])[np.newaxis]] \
+                + [np.asarray(x, dtype=np.float32)[np.newaxis]
+                   for x in x1[1:]]
+    return data_gen
+
+
+def quantization_report(model: KerasPilot, tflite_path: str,
+                        records: List[TubRecord], batch_size: int) \
+        -> Dict[str, Any]:
+    """
+    Compares the converted tflite model with the keras model on the
+    validation records.
+
+    :param model:       keras pilot the tflite model was converted from
+    :param tflite_path: path of the tflite model
+    :param records:     validation records
+    :param batch_size:  batch size of the predictions
+    :return:            dictionary with the mean squared errors of both
+                        models against the user input and their differences
+    """
+    pilot = TFLitePilot()
+    pilot.load(tflite_path)
+    labels = np.array([[r.underlying['user/angle'],
+                        r.underlying['user/throttle']] for r in records])
+    float_outputs = model.predict_batch(records, batch_size)[:, :2]
+    tflite_outputs = pilot.predict_batch(records, batch_size)[:, :2]
+    diff = np.abs(float_outputs - tflite_outputs)
+    report = {
+        'Float MSE': float(np.mean((float_outputs - labels) ** 2)),
+        'TFLite MSE': float(np.mean((tflite_outputs - labels) ** 2)),
+        'Mean Abs Diff': float(diff.mean()),
+        'Max Abs Diff': float(diff.max())
+    }
+    print(f'TFLite vs float model on {len(records)} validation records: '
+          f'{report}')
+    return report
+
 
 def get_model_train_details(cfg: Config, database: PilotDatabase,
                             model: str = None, model_type: str = None) \
-        -> Tuple[str, int, str, bool]:
+        -> Tuple[str, int, str, bool, bool]:
     """
     Returns automatic model name if none is given
     :param cfg:         donkey config
     :param database:    model database with existing training data
     :param model:       model path
-    :param model_type:  type of model, like 'linear', 'tflite_linear', etc
-    :return:            tuple of model path, number, training type, and if
-                        tflite is requested
+    :param model_type:  type of model, like 'linear', 'tflite_linear',
+                        'onnx_linear', etc
+    :return:            tuple of the keras model path, number, training
+                        type, and if tflite or onnx is requested
     """
     if not model_type:
         model_type = cfg.DEFAULT_MODEL_TYPE
     train_type = model_type
     is_tflite = False
+    is_onnx = False
     if 'tflite_' in train_type:
         train_type = train_type.replace('tflite_', '')
         is_tflite = True
+    if 'onnx_' in train_type:
+        train_type = train_type.replace('onnx_', '')
+        is_onnx = True
     model_num = 0
     if not model:
         model_path, model_num = database.generate_model_name()
     else:
-        _, model_ext = os.path.splitext(model)
+        model_base, model_ext = os.path.splitext(model)
         model_path = model
         is_tflite = model_ext == '.tflite'
+        is_onnx = is_onnx or model_ext == '.onnx'
+        if is_tflite or model_ext == '.onnx':
+            # the keras model is trained first and converted afterwards
+            model_path = f'{model_base}.h5'
 
-    return model_path, model_num, train_type, is_tflite
+    return model_path, model_num, train_type, is_tflite, is_onnx
 
 
 def train(cfg: Config, tub_paths: str, model: str = None,
-          model_type: str = None, transfer: str = None, comment: str = None) \
+          model_type: str = None, transfer: str = None, comment: str = None,
+          quantize: str = None) \
         -> tf.keras.callbacks.History:
     """
-    Train the model
+    Train the model. With quantize, or TFLITE_QUANTIZE in the config, the
+    tflite model gets quantized, 'int8' calibrates on training records.
     """
     database = PilotDatabase(cfg)
-    model_path, model_num, train_type, is_tflite = \
+    model_path, model_num, train_type, is_tflite, is_onnx = \
         get_model_train_details(cfg, database, model, model_type)
+    quantize = quantize or getattr(cfg, 'TFLITE_QUANTIZE', None)
+    # quantization always creates a tflite model
+    is_tflite = is_tflite or quantize is not None
 
     kl = get_model_by_type(train_type, cfg)
     if transfer:
@@ -124,9 +370,13 @@ def train(cfg: Config, tub_paths: str, model: str = None,
     if cfg.PRINT_MODEL_SUMMARY:
         print(kl.model.summary())
 
+    seed = getattr(cfg, 'TRAIN_SEED', None)
+    if seed is not None:
+        tf.random.set_seed(seed)
+
     tubs = tub_paths.split(',')
     all_tub_paths = [os.path.expanduser(tub) for tub in tubs]
-    dataset = TubDataset(cfg, all_tub_paths)
+    dataset = TubDataset(cfg, all_tub_paths, seq_size=kl.seq_size())
     training_records, validation_records = dataset.train_test_split()
     print(f'Records # Training {len(training_records)}')
     print(f'Records # Validation {len(validation_records)}')
@@ -154,11 +404,27 @@ def train(cfg: Config, tub_paths: str, model: str = None,
                        verbose=cfg.VERBOSE_TRAIN,
                        min_delta=cfg.MIN_DELTA,
                        patience=cfg.EARLY_STOP_PATIENCE,
-                       show_plot=cfg.SHOW_PLOT)
+                       show_plot=cfg.SHOW_PLOT,
+                       callbacks=[ThroughputCallback(cfg.BATCH_SIZE)])
     base_path = os.path.splitext(model_path)[0]
+    report = None
     if is_tflite:
         tf_lite_model_path = f'{base_path}.tflite'
-        keras_model_to_tflite(model_path, tf_lite_model_path)
+        # compare with the best model, which the checkpoint saved
+        kl.load(model_path)
+        data_gen = None
+        if quantize == 'int8':
+            data_gen = representative_dataset(
+                kl, training_records,
+                getattr(cfg, 'TFLITE_CALIBRATION_SAMPLES', 200), seed)
+        keras_model_to_tflite(model_path, tf_lite_model_path, data_gen,
+                              quantize)
+        if quantize:
+            report = quantization_report(kl, tf_lite_model_path,
+                                         validation_records, cfg.BATCH_SIZE)
+            report['Quantize'] = quantize
+    if is_onnx:
+        keras_model_to_onnx(model_path, f'{base_path}.onnx')
 
     database_entry = {
         'Number': model_num,
@@ -169,7 +435,8 @@ def train(cfg: Config, tub_paths: str, model: str = None,
         'History': history.history,
         'Transfer': os.path.basename(transfer) if transfer else None,
         'Comment': comment,
-        'Config': str(cfg)
+        'Config': str(cfg),
+        'Quantization': report
     }
     database.add_entry(database_entry)
     database.write()
@@ -1,10 +1,12 @@
 import os
-from typing import Any, List, Optional, TypeVar, Tuple
+from typing import Any, List, Optional, TypeVar, Tuple, Union
 
 import numpy as np
 from donkeycar.config import Config
 from donkeycar.parts.tub_v2 import Tub
+from donkeycar.pipeline.image_cache import ImageCache
 from donkeycar.utils import load_image, load_pil_image, train_test_split
+from PIL import Image
 from typing_extensions import TypedDict
 
 X = TypeVar('X', covariant=True)
@@ -28,10 +30,12 @@ TubRecordDict = TypedDict(
 
 class TubRecord(object):
     def __init__(self, config: Config, base_path: str,
-                 underlying: TubRecordDict) -> None:
+                 underlying: TubRecordDict,
+                 image_cache: Optional[ImageCache] = None) -> None:
         self.config = config
         self.base_path = base_path
         self.underlying = underlying
+        self.image_cache = image_cache
         self._image: Optional[Any] = None
 
     def image(self, cached=True, as_nparray=True) -> np.ndarray:
@@ -39,12 +43,17 @@ class TubRecord(object):
 
         Args:
             cached (bool, optional): whether to cache the image. Defaults to True.
+                                     Uses the image cache of the dataset if the
+                                     record has one, otherwise the record keeps
+                                     the image itself.
             as_nparray (bool, optional): whether to convert the image to a np array of uint8.
                                          Defaults to True. If false, returns result of Image.open()
 
         Returns:
             np.ndarray: [description]
         """
+        if cached and self.image_cache is not None:
+            return self._cached_image(as_nparray)
         if self._image is None:
             image_path = self.underlying['cam/image_array']
             full_path = os.path.join(self.base_path, 'images', image_path)
@@ -61,37 +70,79 @@ class TubRecord(object):
             _image = self._image
         return _image
 
+    def _cached_image(self, as_nparray: bool) -> Any:
+        image_path = self.underlying['cam/image_array']
+        full_path = os.path.join(self.base_path, 'images', image_path)
+        shape = (self.config.IMAGE_H, self.config.IMAGE_W,
+                 self.config.IMAGE_DEPTH)
+        key = ImageCache.key(self.base_path, image_path, shape)
+        img_arr = self.image_cache.get(
+            key, lambda: load_image(full_path, cfg=self.config))
+        if as_nparray or img_arr is None:
+            return img_arr
+        # Single channel images are stored as (H, W, 1)
+        if img_arr.shape[-1] == 1:
+            return Image.fromarray(img_arr[..., 0])
+        return Image.fromarray(img_arr)
+
     def __repr__(self) -> str:
         return repr(self.underlying)
 
 
 class TubDataset(object):
     """
-    Loads the dataset, and creates a train/test split.
+    Loads the dataset, and creates a train/test split. With seq_size > 0 the
+    split is done over sequences of seq_size consecutive records, which
+    sequence models like rnn and 3d are trained from.
     """
 
     def __init__(self, config: Config, tub_paths: List[str],
-                 shuffle: bool = True) -> None:
+                 shuffle: bool = True, seq_size: int = 0) -> None:
         self.config = config
         self.tub_paths = tub_paths
         self.shuffle = shuffle
+        self.seq_size = seq_size
         self.tubs: List[Tub] = [Tub(tub_path, read_only=True)
                                 for tub_path in self.tub_paths]
         self.records: List[TubRecord] = list()
+        self.image_cache = ImageCache.from_config(config)
         self.train_filter = getattr(config, 'TRAIN_FILTER', None)
 
-    def train_test_split(self) -> Tuple[List[TubRecord], List[TubRecord]]:
+    def sequences(self) -> List[List[TubRecord]]:
+        """
+        Returns the sliding windows of seq_size consecutive records. Windows
+        don't span different tubs or gaps from deleted or filtered records.
+        """
+        sequences = list()
+        window = list()
+        for record in self.records:
+            if window and (record.base_path != window[-1].base_path
+                           or record.underlying['_index']
+                           != window[-1].underlying['_index'] + 1):
+                window = list()
+            window.append(record)
+            if len(window) > self.seq_size:
+                del window[0]
+            if len(window) == self.seq_size:
+                sequences.append(list(window))
+        return sequences
+
+    def train_test_split(self) \
+            -> Tuple[List[Union[TubRecord, List[TubRecord]]],
+                     List[Union[TubRecord, List[TubRecord]]]]:
         msg = f'Loading tubs from paths {self.tub_paths}' + f' with filter ' \
               f'{self.train_filter}' if self.train_filter else ''
         print(msg)
         self.records.clear()
         for tub in self.tubs:
             for underlying in tub:
-                record = TubRecord(self.config, tub.base_path, underlying)
+                record = TubRecord(self.config, tub.base_path, underlying,
+                                   self.image_cache)
                 if not self.train_filter or self.train_filter(record):
                     self.records.append(record)
 
-        return train_test_split(self.records, shuffle=self.shuffle,
+        samples = self.sequences() if self.seq_size else self.records
+        return train_test_split(samples, shuffle=self.shuffle,
                                 test_size=(1. - self.config.TRAIN_TEST_SPLIT))
 
 
@@ -22,6 +22,7 @@ MODELS_PATH = os.path.join(CAR_PATH, 'models')
 
 #VEHICLE
 DRIVE_LOOP_HZ = 20      # the vehicle loop will pause if faster than this speed.
+DRIVE_LOOP_WORKERS = 0  # run parts which do not depend on each other concurrently on this many threads, 0 runs the parts one after the other. See the graph with: donkey dag
 MAX_LOOPS = None        # the vehicle loop can abort after this many iterations, when given a positive integer.
 
 #CAMERA
@@ -30,6 +31,7 @@ IMAGE_W = 160
 IMAGE_H = 120
 IMAGE_DEPTH = 3         # default RGB=3, make 1 for mono
 CAMERA_FRAMERATE = DRIVE_LOOP_HZ
+CAMERA_TRIGGERED_LOOP = False   # wait for the next camera frame within the drive loop period and record its capture time as cam/timestamp. The loop still runs at most at DRIVE_LOOP_HZ and does not wait longer when no frame arrives. PICAM, WEBCAM, CSIC, V4L and LEOPARD cameras only
 CAMERA_VFLIP = False
 CAMERA_HFLIP = False
 # For CSIC camera - If the camera is mounted in a rotated position, changing the below parameter will correct the output frame orientation
@@ -145,6 +147,23 @@ LEARNING_RATE = 0.001           #only used when OPTIMIZER specified
 LEARNING_RATE_DECAY = 0.0       #only used when OPTIMIZER specified
 SEND_BEST_MODEL_TO_PI = False   #change to true to automatically send best model during training
 CACHE_IMAGES = True             #keep images in memory. will speed succesive epochs, but crater if not enough mem.
+CACHE_IMAGES_MAX_BYTES = 2 * 1024 ** 3   #memory budget of the image cache, least recently used images get evicted first.
+CACHE_IMAGES_DISK_PATH = None   #folder to keep decoded and resized images across training runs, ie '~/mycar/image_cache'. None disables it.
+CACHE_IMAGES_DISK_MAX_BYTES = 8 * 1024 ** 3  #size limit of the on disk image cache.
+TRAIN_PIPELINE = 'generator'    #'generator' feeds tf.data from one python generator, 'parallel' loads records in parallel and augments per batch.
+TRAIN_SEED = None               #set to an int to make shuffling and augmentation reproducible.
+AUGMENTATIONS = []              #training augmentations, any of 'CROP', 'TRAPEZE', 'MULTIPLY', 'BLUR', 'BRIGHTNESS', 'SHADOW', 'FLIP'
+AUG_MULTIPLY_RANGE = (0.5, 1.5) #range of the factor 'MULTIPLY' multiplies images with
+AUG_BLUR_RANGE = (0.0, 3.0)     #range of the gaussian blur sigma of 'BLUR'
+AUG_BRIGHTNESS_RANGE = (-0.2, 0.2)  #range of the brightness offset of 'BRIGHTNESS', as a fraction of 255
+AUG_SHADOW_RANGE = (0.5, 0.9)   #range of the darkening factor of 'SHADOW'
+AUG_FLIP_PROBABILITY = 0.5      #probability of 'FLIP' mirroring an image and its user/angle, needs TRAIN_PIPELINE = 'parallel'
+TFLITE_QUANTIZE = None          #quantize tflite models with 'int8', 'fp16' or 'dynamic'. None keeps float32. 'int8' needs no float conversion on the car.
+TFLITE_CALIBRATION_SAMPLES = 200  #number of training records which calibrate 'int8' quantization
+TFLITE_NUM_THREADS = None       #number of threads of the tflite interpreter, ie 4 on a Raspberry Pi 4. None uses the tflite default.
+TFLITE_DELEGATE = None          #None or 'xnnpack' for the default XNNPACK delegate, 'none' for plain kernels, or a delegate library like 'libedgetpu.so.1'
+ONNX_NUM_THREADS = None         #number of intra op threads of ONNX Runtime for 'onnx_linear' pilots. None uses the ONNX Runtime default.
+ONNX_GRAPH_OPTIMIZATION = 'all' #ONNX Runtime graph optimization level, one of 'none', 'basic', 'extended', 'all'
 
 PRUNE_CNN = False               #This will remove weights from your model. The primary goal is to increase performance.
 PRUNE_PERCENT_TARGET = 75       # The desired percentage of pruning.
@@ -236,9 +255,28 @@ TELEMETRY_DEFAULT_TYPES = 'float,float'
 # PERF MONITOR
 HAVE_PERFMON = False
 
+#LOOP TIMING
+RECORD_LOOP_TIMING = False  # record the drive loop timing in the tub and send it with the telemetry: perf/loop_ms, perf/jitter_ms (deviation of the loop start from the loop rate), perf/memory_ms (time in Memory get/put), perf/overruns (loops slower than DRIVE_LOOP_HZ), perf/latency_ms (capture of the frame to the end of the loop, with CAMERA_TRIGGERED_LOOP) and perf/<part>_ms per part, perf/<part>_misses for parts with a deadline
+
+#SCHEDULING
+# parts which do not need to run in every drive loop run at their own rate; low priority parts, like the display, telemetry and camera publishing, are deferred while the drive loop is late, actuators always run
+OLED_RATE_HZ = 2                # update rate of the SSD_1306 OLED display
+MODEL_WATCH_RATE_HZ = 1         # rate to check the model file for changes
+PILOT_DEADLINE_MS = None        # count loops in which the pilot finished later than this after the loop start, None to not track a deadline
+
 #RECORD OPTIONS
 RECORD_DURING_AI = False        #normally we do not record during ai mode. Set this to true to get image and steering records for your Ai. Be careful not to use them to train.
 AUTO_CREATE_NEW_TUB = False     #create a new tub (tub_YY_MM_DD) directory when recording or append records to data directory directly
+TUB_BATCH_SIZE = 1              #commit records to the tub catalog in batches of this many records. 1 writes every record immediately
+TUB_BATCH_MS = 0                #also commit a batch once its oldest record is older than this many milliseconds. 0 disables the time limit
+TUB_WRITER_THREADED = False     #write records from a background thread, so image encoding and disk stalls do not slow down the drive loop
+TUB_QUEUE_SIZE = 100            #max number of records waiting for the background writer
+TUB_QUEUE_POLICY = 'block'      #what to do when the writer queue is full: 'block' the drive loop or 'drop' the record
+TUB_QUEUE_ALERT = 50            #queue depth at which the record tracker reports back pressure
+TUB_QUEUE_ALERT_COLOR = (100, 0, 0)  #LED color used while the writer queue is above TUB_QUEUE_ALERT
+TUB_IMAGE_FORMAT = 'jpg'        #format of recorded images: 'jpg', 'png' (lossless) or 'raw' (uncompressed numpy arrays)
+TUB_IMAGE_QUALITY = None        #jpg quality from 1 to 95, None uses the PIL default
+TUB_FSYNC = 'never'             #durability of committed records: 'never' (leave it to the OS), 'batch' (fsync every batch) or 'close' (fsync when the tub is closed)
 
 #LED
 HAVE_RGB_LED = False            #do you have an RGB LED like https://www.amazon.com/dp/B07BNRZWNF
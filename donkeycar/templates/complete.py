@@ -4,7 +4,7 @@ Scripts to drive a donkey 2 car
 
 Usage:
     manage.py (drive) [--model=<model>] [--js] [--type=(linear|categorical)] [--camera=(single|stereo)] [--meta=<key:value> ...] [--myconfig=<filename>]
-    manage.py (train) [--tubs=tubs] (--model=<model>) [--type=(linear|inferred|tensorrt_linear|tflite_linear)]
+    manage.py (train) [--tubs=tubs] (--model=<model>) [--type=(linear|inferred|tensorrt_linear|tflite_linear|onnx_linear)]
 
 Options:
     -h --help               Show this screen.
@@ -60,7 +60,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             model_type = cfg.DEFAULT_MODEL_TYPE
 
     #Initialize car
-    V = dk.vehicle.Vehicle()
+    V = dk.vehicle.Vehicle(workers=cfg.DRIVE_LOOP_WORKERS)
 
     #Initialize logging before anything else to allow console logging
     if cfg.HAVE_CONSOLE_LOGGING:
@@ -86,6 +86,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             print("No supported encoder found")
 
     logger.info("cfg.CAMERA_TYPE %s"%cfg.CAMERA_TYPE)
+    trigger = None
     if camera_type == "stereo":
 
         if cfg.CAMERA_TYPE == "WEBCAM":
@@ -183,6 +184,16 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             
         V.add(cam, inputs=inputs, outputs=outputs, threaded=threaded)
 
+        if cfg.CAMERA_TRIGGERED_LOOP:
+            from donkeycar.parts.camera import BaseCamera, CameraTrigger
+            if isinstance(cam, BaseCamera) and cam.publishes_frames:
+                trigger = CameraTrigger(cam)
+                V.add(trigger, outputs=['cam/timestamp'])
+            else:
+                logger.warning(f'{cam.__class__.__name__} does not signal '
+                               f'new frames, the drive loop keeps running '
+                               f'at DRIVE_LOOP_HZ')
+
     #This web controller will create a web server that is capable
     #of managing steering, throttle, and modes, and more.
     ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE)
@@ -301,10 +312,14 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             self.dur_alert = 0
             self.force_alert = 0
 
-        def run(self, num_records):
+        def run(self, num_records, queue_depth=None):
             if num_records is None:
                 return 0
 
+            if queue_depth is not None and queue_depth >= cfg.TUB_QUEUE_ALERT:
+                # the background tub writer falls behind
+                return cfg.TUB_QUEUE_ALERT_COLOR
+
             if self.last_num_rec_print != num_records or self.force_alert:
                 self.last_num_rec_print = num_records
 
@@ -324,7 +339,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             return 0
 
     rec_tracker_part = RecordTracker()
-    V.add(rec_tracker_part, inputs=["tub/num_records"], outputs=['records/alert'])
+    V.add(rec_tracker_part, inputs=["tub/num_records", "tub/queue_depth"], outputs=['records/alert'])
 
     if cfg.AUTO_RECORD_ON_THROTTLE and isinstance(ctr, JoystickController):
         #then we are not using the circle button. hijack that to force a record count indication
@@ -412,7 +427,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
 
         model_reload_cb = None
 
-        if '.h5' in model_path or '.uff' in model_path or 'tflite' in model_path or '.pkl' in model_path:
+        if '.h5' in model_path or '.uff' in model_path or 'tflite' in model_path or '.pkl' in model_path or '.onnx' in model_path:
             #when we have a .h5 extension
             #load everything from the model file
             load_model(kl, model_path)
@@ -441,7 +456,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
             return
 
         #this part will signal visual LED, if connected
-        V.add(FileWatcher(model_path, verbose=True), outputs=['modelfile/modified'])
+        V.add(FileWatcher(model_path, verbose=True), outputs=['modelfile/modified'],
+              rate_hz=cfg.MODEL_WATCH_RATE_HZ)
 
         #these parts will reload the model file, but only when ai is running so we don't interrupt user driving
         V.add(FileWatcher(model_path), outputs=['modelfile/dirty'], run_condition="ai_running")
@@ -455,7 +471,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
 
         V.add(kl, inputs=inputs,
               outputs=outputs,
-              run_condition='run_pilot')
+              run_condition='run_pilot',
+              deadline_ms=cfg.PILOT_DEADLINE_MS)
     
     if cfg.STOP_SIGN_DETECTOR:
         from donkeycar.parts.object_detector.stop_sign_detector import StopSignDetector
@@ -617,7 +634,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         from donkeycar.parts.oled import OLEDPart
         auto_record_on_throttle = cfg.USE_JOYSTICK_AS_DEFAULT and cfg.AUTO_RECORD_ON_THROTTLE
         oled_part = OLEDPart(cfg.SSD1306_128_32_I2C_BUSNUM, auto_record_on_throttle=auto_record_on_throttle)
-        V.add(oled_part, inputs=['recording', 'tub/num_records', 'user/mode'], outputs=[], threaded=True)
+        V.add(oled_part, inputs=['recording', 'tub/num_records', 'user/mode'], outputs=[], threaded=True,
+              rate_hz=cfg.OLED_RATE_HZ, priority='low')
 
     #add tub to save data
 
@@ -675,23 +693,48 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         types += ['float', 'float', 'float']
         V.add(mon, inputs=[], outputs=perfmon_outputs, threaded=True)
 
+    if cfg.RECORD_LOOP_TIMING:
+        # latest loop, jitter, memory and part times of the drive loop, see
+        # PartProfiler, parts added below the tub writer are not included
+        perf_channels = list(V.profiler.channel_names)
+        inputs += perf_channels
+        types += ['int' if name == 'perf/overruns'
+                  or name.endswith('_misses') else 'float'
+                  for name in perf_channels]
+
+    if trigger is not None:
+        inputs += ['cam/timestamp']
+        types += ['float']
+
     # do we want to store new records into own dir or append to existing
     tub_path = TubHandler(path=cfg.DATA_PATH).create_tub_path() if \
         cfg.AUTO_CREATE_NEW_TUB else cfg.DATA_PATH
-    tub_writer = TubWriter(tub_path, inputs=inputs, types=types, metadata=meta)
-    V.add(tub_writer, inputs=inputs, outputs=["tub/num_records"], run_condition='recording')
+    tub_writer = TubWriter(tub_path, inputs=inputs, types=types, metadata=meta,
+                           batch_size=cfg.TUB_BATCH_SIZE,
+                           batch_ms=cfg.TUB_BATCH_MS, fsync=cfg.TUB_FSYNC,
+                           queue_size=cfg.TUB_QUEUE_SIZE,
+                           queue_policy=cfg.TUB_QUEUE_POLICY,
+                           image_format=cfg.TUB_IMAGE_FORMAT,
+                           image_quality=cfg.TUB_IMAGE_QUALITY)
+    if cfg.TUB_WRITER_THREADED:
+        V.add(tub_writer, inputs=inputs, outputs=["tub/num_records", "tub/queue_depth"],
+              threaded=True, run_condition='recording')
+    else:
+        V.add(tub_writer, inputs=inputs, outputs=["tub/num_records"], run_condition='recording')
 
     # Telemetry (we add the same metrics added to the TubHandler
     if cfg.HAVE_MQTT_TELEMETRY:
         telem_inputs, _ = tel.add_step_inputs(inputs, types)
-        V.add(tel, inputs=telem_inputs, outputs=["tub/queue_size"], threaded=True)
+        V.add(tel, inputs=telem_inputs, outputs=["tub/queue_size"], threaded=True,
+              priority='low')
 
     if cfg.PUB_CAMERA_IMAGES:
         from donkeycar.parts.network import TCPServeValue
         from donkeycar.parts.image import ImgArrToJpg
         pub = TCPServeValue("camera")
-        V.add(ImgArrToJpg(), inputs=['cam/image_array'], outputs=['jpg/bin'])
-        V.add(pub, inputs=['jpg/bin'])
+        V.add(ImgArrToJpg(), inputs=['cam/image_array'], outputs=['jpg/bin'],
+              priority='low')
+        V.add(pub, inputs=['jpg/bin'], priority='low')
 
     if type(ctr) is LocalWebController:
         if cfg.DONKEY_GYM:
@@ -704,7 +747,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         ctr.print_controls()
 
     #run the vehicle for 20 seconds
-    V.start(rate_hz=cfg.DRIVE_LOOP_HZ, max_loop_count=cfg.MAX_LOOPS)
+    V.start(rate_hz=cfg.DRIVE_LOOP_HZ, max_loop_count=cfg.MAX_LOOPS,
+            trigger=trigger)
 
 
 if __name__ == '__main__':
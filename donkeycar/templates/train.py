@@ -7,6 +7,7 @@ Usage:
     train.py [--tubs=tubs] (--model=<model>)
     [--type=(linear|inferred|tensorrt_linear|tflite_linear)]
     [--comment=<comment>]
+    [--quantize=(int8|fp16|dynamic)]
 
 Options:
     -h --help              Show this screen.
@@ -24,7 +25,8 @@ def main():
     model = args['--model']
     model_type = args['--type']
     comment = args['--comment']
-    train(cfg, tubs, model, model_type, comment)
+    quantize = args['--quantize']
+    train(cfg, tubs, model, model_type, comment=comment, quantize=quantize)
 
 
 if __name__ == "__main__":
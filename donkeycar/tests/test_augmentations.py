@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+
+from donkeycar.config import Config
+from donkeycar.pipeline.augmentations import ImageAugmentation
+
+
+class TestImageAugmentation(unittest.TestCase):
+
+    def setUp(self):
+        self.config = Config()
+        self.config.ROI_CROP_TOP = 10
+        self.config.ROI_CROP_BOTTOM = 5
+        self.config.ROI_TRAPEZE_LL = 0
+        self.config.ROI_TRAPEZE_LR = 160
+        self.config.ROI_TRAPEZE_UL = 20
+        self.config.ROI_TRAPEZE_UR = 140
+        self.config.ROI_TRAPEZE_MIN_Y = 60
+        self.config.ROI_TRAPEZE_MAX_Y = 120
+        rng = np.random.default_rng(0)
+        self.images = rng.integers(0, 256, (8, 120, 160, 3), dtype=np.uint8)
+
+    def _augmentation(self, *augmentations):
+        self.config.AUGMENTATIONS = list(augmentations)
+        return ImageAugmentation(self.config)
+
+    def test_all_augmentations(self):
+        augmentation = self._augmentation('MULTIPLY', 'BLUR', 'BRIGHTNESS',
+                                          'SHADOW', 'TRAPEZE', 'FLIP')
+        images, angles = augmentation.augment_batch(self.images,
+                                                    np.zeros(8), seed=1)
+        self.assertEqual(images.shape, self.images.shape)
+        self.assertEqual(images.dtype, np.uint8)
+        # Outside of the trapezoid all pixels are masked
+        self.assertFalse(images[:, :60].any())
+        image = augmentation.augment(self.images[0])
+        self.assertEqual(image.shape, self.images[0].shape)
+
+    def test_crop(self):
+        augmentation = self._augmentation('CROP')
+        images, _ = augmentation.augment_batch(self.images)
+        self.assertEqual(images.shape, (8, 105, 160, 3))
+        np.testing.assert_array_equal(images, self.images[:, 10:115])
+        self.assertEqual(augmentation.output_shape((120, 160, 3)),
+                         (105, 160, 3))
+        self.assertEqual(augmentation.output_shape((None, None, 3)),
+                         (None, None, 3))
+
+    def test_seeded(self):
+        augmentation = self._augmentation('MULTIPLY', 'SHADOW', 'BLUR')
+        first, _ = augmentation.augment_batch(self.images, seed=3)
+        second, _ = augmentation.augment_batch(self.images, seed=3)
+        third, _ = augmentation.augment_batch(self.images, seed=4)
+        np.testing.assert_array_equal(first, second)
+        self.assertFalse(np.array_equal(first, third))
+
+    def test_flip_mirrors_angles(self):
+        self.config.AUG_FLIP_PROBABILITY = 0.5
+        augmentation = self._augmentation('FLIP')
+        self.assertTrue(augmentation.changes_angle)
+        angles = np.linspace(0.1, 0.8, 8)
+        images, new_angles = augmentation.augment_batch(self.images, angles,
+                                                        seed=2)
+        flipped = new_angles < 0
+        self.assertTrue(flipped.any() and not flipped.all())
+        np.testing.assert_allclose(np.abs(new_angles), angles)
+        np.testing.assert_array_equal(images[flipped],
+                                      self.images[flipped, :, ::-1])
+        np.testing.assert_array_equal(images[~flipped], self.images[~flipped])
+        # Without angles images are not flipped
+        images, _ = augmentation.augment_batch(self.images, seed=2)
+        np.testing.assert_array_equal(images, self.images)
+
+    def test_unknown_augmentation(self):
+        with self.assertRaises(ValueError):
+            self._augmentation('ROTATE')
+
+
+if __name__ == '__main__':
+    unittest.main()
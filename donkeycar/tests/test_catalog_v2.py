@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tempfile
@@ -33,6 +34,42 @@ class TestCatalog(unittest.TestCase):
 
         self.assertEqual(count, 10)
 
+    def test_offset_index(self):
+        catalog = Catalog(self._catalog_path)
+        for i in range(0, 10):
+            catalog.write_record(self._newRecord())
+        catalog.close()
+        self.assertEqual(catalog.manifest.line_lengths(), [])
+
+        catalog_2 = Catalog(self._catalog_path, read_only=True)
+        self.assertEqual(len(catalog_2.index), 10)
+        self.assertEqual(catalog_2.seekable.total_length,
+                         os.path.getsize(self._catalog_path))
+        catalog_2.seekable.seek_line_start(10)
+        self.assertIn('at', json.loads(catalog_2.seekable.readline()))
+        catalog_2.close()
+
+    def test_migrate_line_lengths(self):
+        catalog = Catalog(self._catalog_path)
+        for i in range(0, 5):
+            catalog.write_record(self._newRecord())
+        line_lengths = catalog.seekable.line_lengths
+        catalog.close()
+        # Catalog written by an older version, without an index
+        os.remove(catalog.index.path)
+        metadata = CatalogMetadata(self._catalog_path)
+        metadata.update_line_lengths(line_lengths)
+        metadata.close()
+
+        catalog_2 = Catalog(self._catalog_path)
+        self.assertEqual(catalog_2.seekable.line_lengths, line_lengths)
+        self.assertEqual(catalog_2.manifest.line_lengths(), [])
+        catalog_2.write_record(self._newRecord())
+        catalog_2.close()
+        catalog_3 = Catalog(self._catalog_path, read_only=True)
+        self.assertEqual(catalog_3.seekable.lines(), 6)
+        catalog_3.close()
+
     def tearDown(self):
         shutil.rmtree(self._path)
 
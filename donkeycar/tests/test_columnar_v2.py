@@ -0,0 +1,114 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from donkeycar.parts.datastore_columnar import ColumnarCatalog, \
+    convert_to_columnar
+from donkeycar.parts.tub_v2 import Tub
+
+
+class TestColumnarCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        inputs = ['user/angle', 'user/mode', 'behavior/state',
+                  'location/one_hot_state_array', 'lidar/dist_array']
+        types = ['float', 'str', 'int', 'vector', 'nparray']
+        tub = Tub(self._path, inputs, types)
+        for i in range(25):
+            record = {'user/angle': i / 10., 'user/mode': 'user',
+                      'behavior/state': i % 3,
+                      'location/one_hot_state_array': [0., 1., float(i)],
+                      'lidar/dist_array': np.arange(i % 4)}
+            if i == 7:
+                del record['user/mode']
+            tub.write_record(record)
+        tub.delete_records([3, 11])
+        tub.close()
+
+    def test_convert_and_iterate(self):
+        json_records = list(Tub(self._path, read_only=True))
+        count = convert_to_columnar(self._path, batch_size=10)
+        self.assertEqual(count, 25)
+        tub = Tub(self._path, read_only=True)
+        self.assertIsNotNone(tub.columnar)
+        self.assertEqual(list(tub), json_records)
+        tub.close()
+
+    def test_random_access(self):
+        convert_to_columnar(self._path)
+        tub = Tub(self._path, read_only=True)
+        expected = list(tub)
+        self.assertEqual(tub[4:9], expected[4:9])
+        self.assertEqual(tub[-1], expected[-1])
+        records = tub.get_records([11, 12, 3, 0])
+        self.assertEqual([r['_index'] for r in records], [12, 0])
+        tub.close()
+
+    def test_column_access(self):
+        convert_to_columnar(self._path)
+        tub = Tub(self._path, read_only=True)
+        angles = tub.column('user/angle', include_deleted=True)
+        self.assertIsInstance(angles, np.memmap)
+        np.testing.assert_allclose(angles, np.arange(25) / 10.)
+        angles = tub.column('user/angle')
+        self.assertEqual(len(angles), 23)
+        self.assertNotIn(0.3, angles)
+        states = tub.column('location/one_hot_state_array')
+        self.assertEqual(states.shape, (23, 3))
+        tub.close()
+
+    def test_vector_layouts(self):
+        path = os.path.join(self._path, 'vectors')
+        inputs = ['ragged', 'ints', 'mixed', 'floats']
+        tub = Tub(path, inputs, ['list', 'list', 'vector', 'vector'])
+        for i in range(6):
+            tub.write_record({'ragged': list(range(i)), 'ints': [i, 2 * i],
+                              'mixed': [i, 0.5], 'floats': [i / 2, 1.5]})
+        tub.close()
+        json_records = list(Tub(path, read_only=True))
+        convert_to_columnar(path, batch_size=4)
+        tub = Tub(path, read_only=True)
+        self.assertEqual(list(tub), json_records)
+        self.assertEqual(tub[5]['ints'], [5, 10])
+        self.assertIsInstance(tub[5]['ints'][0], int)
+        # only vectors of numbers of one length and type are fixed width
+        self.assertEqual(tub.column('ints').dtype, np.int64)
+        self.assertEqual(tub.column('floats').shape, (6, 2))
+        self.assertEqual(tub.column('ragged')[3], [0, 1, 2])
+        self.assertEqual(tub.column('mixed')[3], [3, 0.5])
+        tub.close()
+
+    def test_outdated_columns_are_ignored(self):
+        convert_to_columnar(self._path)
+        tub = Tub(self._path, ['user/angle'], ['float'])
+        tub.write_record({'user/angle': 1.0})
+        tub.close()
+        tub = Tub(self._path, read_only=True)
+        self.assertIsNone(tub.columnar)
+        self.assertEqual(len(list(tub)), 24)
+        tub.close()
+
+    def test_truncate_interrupted_append(self):
+        columns_path = os.path.join(self._path, 'test_columns')
+        catalog = ColumnarCatalog(columns_path, ['user/mode'], ['str'])
+        catalog.write_records([{'user/mode': 'user', '_index': 0}])
+        # Append a batch without updating the row count
+        record = {'user/mode': 'local', '_index': 1}
+        for key, column in catalog.columns.items():
+            column.append([record.get(key)])
+        catalog = ColumnarCatalog(columns_path)
+        catalog.write_records([{'user/mode': 'local_angle', '_index': 1}])
+        catalog = ColumnarCatalog(columns_path, read_only=True)
+        self.assertEqual(len(catalog), 2)
+        self.assertEqual(catalog.record(1)['user/mode'], 'local_angle')
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+
+if __name__ == '__main__':
+    unittest.main()
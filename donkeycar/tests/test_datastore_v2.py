@@ -1,3 +1,4 @@
+import json
 import os
 import shutil
 import tempfile
@@ -27,6 +28,17 @@ class TestDatastore(unittest.TestCase):
 
         self.assertEqual(count, read_records)
 
+    def test_read_only_sync_without_index(self):
+        manifest = Manifest(self._path)
+        manifest.write_record(self._newRecord())
+        manifest.close()
+        # catalogs of older versions have no index file
+        for index_path in Path(self._path).glob('*.catalog_index'):
+            index_path.unlink()
+        manifest = Manifest(self._path, read_only=True, fsync='close')
+        self.assertEqual(len(manifest), 1)
+        manifest.close()
+
     def test_deletion(self):
         manifest = Manifest(self._path, max_len=2)
         count = 10
@@ -82,6 +94,70 @@ class TestDatastore(unittest.TestCase):
 
         self.assertEqual(10, read_records)
 
+    def test_deleted_bitmap(self):
+        manifest = Manifest(self._path, max_len=4)
+        for i in range(20):
+            manifest.write_record(self._newRecord())
+        manifest.delete_records({1, 9, 10, 17})
+        manifest.restore_records(9)
+        manifest.close()
+        with open(os.path.join(self._path, 'manifest.json'), 'r') as f:
+            catalog_metadata = json.loads(f.readlines()[4])
+        # Older versions only read the list of deleted indexes
+        self.assertEqual(catalog_metadata['deleted_indexes'], [1, 10, 17])
+
+        manifest = Manifest(self._path, read_only=True)
+        self.assertEqual(list(manifest.deleted_indexes), [1, 10, 17])
+        self.assertIn(17, manifest.deleted_indexes)
+        self.assertNotIn(9, manifest.deleted_indexes)
+        self.assertNotIn(1000, manifest.deleted_indexes)
+        self.assertNotIn(-1, manifest.deleted_indexes)
+        self.assertEqual(len(manifest), 17)
+        self.assertEqual(len(list(manifest)), 17)
+        manifest.close()
+
+    def test_migrate_deleted_indexes(self):
+        manifest = Manifest(self._path, max_len=4)
+        for i in range(10):
+            manifest.write_record(self._newRecord())
+        manifest.close()
+        # Manifest as written by older versions, without a bitmap
+        manifest_path = os.path.join(self._path, 'manifest.json')
+        with open(manifest_path, 'r') as f:
+            lines = f.readlines()
+        catalog_metadata = json.loads(lines[4])
+        del catalog_metadata['deleted_file']
+        catalog_metadata['deleted_indexes'] = [2, 5]
+        lines[4] = json.dumps(catalog_metadata) + '\n'
+        with open(manifest_path, 'w') as f:
+            f.writelines(lines)
+
+        manifest = Manifest(self._path, read_only=True)
+        self.assertEqual(len(manifest), 8)
+        manifest.close()
+        manifest = Manifest(self._path)
+        manifest.restore_records(2)
+        manifest.close()
+        manifest = Manifest(self._path, read_only=True)
+        self.assertEqual(list(manifest.deleted_indexes), [5])
+        manifest.close()
+
+        # An older version restores the record, next to the bitmap
+        with open(manifest_path, 'r') as f:
+            lines = f.readlines()
+        catalog_metadata = json.loads(lines[4])
+        self.assertEqual(catalog_metadata['deleted_indexes'], [5])
+        catalog_metadata['deleted_indexes'] = []
+        lines[4] = json.dumps(catalog_metadata) + '\n'
+        with open(manifest_path, 'w') as f:
+            f.writelines(lines)
+        manifest = Manifest(self._path, read_only=True)
+        self.assertEqual(len(manifest), 10)
+        manifest.close()
+        manifest = Manifest(self._path)
+        self.assertEqual(list(manifest.deleted_indexes), [])
+        manifest.close()
+
     def tearDown(self):
         shutil.rmtree(self._path)
 
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from donkeycar.config import Config
+from donkeycar.parts.tub_v2 import Tub
+from donkeycar.pipeline.image_cache import ImageCache
+from donkeycar.pipeline.types import TubRecord
+
+
+class TestImageCache(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+
+    def test_lru_eviction(self):
+        image = np.zeros((10, 10, 3), dtype=np.uint8)
+        cache = ImageCache(max_bytes=2 * image.nbytes)
+        loads = list()
+
+        def load(i):
+            loads.append(i)
+            return np.full_like(image, i)
+
+        cache.get('a', lambda: load(0))
+        cache.get('b', lambda: load(1))
+        # 'a' becomes the most recently used image, so 'b' gets evicted
+        self.assertEqual(cache.get('a', lambda: load(2))[0, 0, 0], 0)
+        cache.get('c', lambda: load(3))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.size, 2 * image.nbytes)
+        cache.get('b', lambda: load(4))
+        self.assertEqual(loads, [0, 1, 3, 4])
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 4)
+
+    def test_read_only(self):
+        cache = ImageCache(max_bytes=1000)
+        image = cache.get('a', lambda: np.zeros((2, 3), dtype=np.uint8))
+        self.assertFalse(image.flags.writeable)
+        with self.assertRaises(ValueError):
+            image[0, 0] = 1
+        # images which are not cached stay writeable
+        image = cache.get('b', lambda: np.zeros(2000, dtype=np.uint8))
+        self.assertTrue(image.flags.writeable)
+
+    def test_disk_tier(self):
+        disk_path = os.path.join(self._path, 'cache')
+        cache = ImageCache(max_bytes=0, disk_path=disk_path,
+                           disk_max_bytes=400)
+        images = [np.random.randint(0, 255, (8, 8, 3), dtype=np.uint8)
+                  for _ in range(3)]
+        for i, image in enumerate(images):
+            cache.get(f'{i}', lambda: image)
+        cache.close()
+        # Only two images fit into the disk budget
+        cache = ImageCache(max_bytes=0, disk_path=disk_path,
+                           disk_max_bytes=400)
+        for i, image in enumerate(images[:2]):
+            cached = cache.get(f'{i}', lambda: None)
+            np.testing.assert_array_equal(cached, image)
+        self.assertIsNone(cache.get('2', lambda: None))
+        cache.close()
+
+    def test_tub_record(self):
+        tub_path = os.path.join(self._path, 'tub')
+        tub = Tub(tub_path, ['cam/image_array'], ['image_array'])
+        frame = np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+        tub.write_record({'cam/image_array': frame})
+        record = next(iter(tub))
+        tub.close()
+        config = Config()
+        config.IMAGE_W, config.IMAGE_H, config.IMAGE_DEPTH = 80, 60, 1
+        cache = ImageCache(max_bytes=10 ** 6)
+        tub_record = TubRecord(config, tub_path, record, cache)
+        image = tub_record.image()
+        self.assertEqual(image.shape, (60, 80, 1))
+        self.assertIs(tub_record.image(), image)
+        self.assertEqual(tub_record.image(as_nparray=False).size, (80, 60))
+        self.assertEqual(cache.misses, 1)
+        self.assertIsNone(tub_record._image)
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import subprocess
+import sys
+
+import pytest
+
+# frameworks which only pilots and trainers should load
+HEAVY_MODULES = ('tensorflow', 'torch', 'pandas', 'imgaug', 'matplotlib',
+                 'keras')
+# cumulative import time budget in seconds, generous for slow CI machines
+IMPORT_BUDGET = 3.0
+
+MODULES = ['donkeycar', 'donkeycar.vehicle', 'donkeycar.management.base',
+           'donkeycar.parts.tflite'] \
+    + [f'donkeycar.templates.{name}' for name in
+       ('basic', 'complete', 'cv_control', 'path_follow', 'simulator',
+        'square', 'just_drive', 'arduino_drive', 'calibrate')]
+
+
+def import_time(module):
+    """
+    Imports module in a fresh interpreter with -X importtime and returns
+    the cumulative import time in seconds and the names of all imported
+    modules.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import {module}'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    if result.returncode != 0:
+        if 'ModuleNotFoundError' in result.stderr:
+            pytest.skip(f'{module} needs a package which is not installed: '
+                        f'{result.stderr.strip().splitlines()[-1]}')
+        raise AssertionError(result.stderr)
+    imported = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line.split('|')
+        if cumulative.strip().isdigit():
+            imported[name.strip()] = int(cumulative) / 1e6
+    return imported[module], set(imported)
+
+
+@pytest.mark.parametrize('module', MODULES)
+def test_import_time(module):
+    seconds, imported = import_time(module)
+    heavy = [m for m in HEAVY_MODULES if m in imported]
+    assert not heavy, f'{module} imports {heavy}'
+    assert seconds < IMPORT_BUDGET, \
+        f'{module} took {seconds:.2f}s to import'
@@ -50,3 +50,62 @@ def test_localizer():
 
 
 
+
+
+def check_predict_batch(km, img_arrs, other_arrs=None, batch_size=3):
+    inputs = img_arrs if other_arrs is None \
+        else list(zip(img_arrs, other_arrs))
+    predictions = km.predict_batch(inputs, batch_size=batch_size)
+    assert predictions.shape[0] == len(img_arrs)
+    if other_arrs is None:
+        other_arrs = [None] * len(img_arrs)
+    for img, other, prediction in zip(img_arrs, other_arrs, predictions):
+        expected = [float(np.squeeze(v)) for v in km.run(img, other)]
+        np.testing.assert_allclose(prediction, expected, atol=1e-4)
+
+
+def random_images(km, n=5):
+    shape = tuple(km.get_input_shape()[1:])
+    return [np.random.randint(0, 255, shape, dtype=np.uint8)
+            for _ in range(n)]
+
+
+def test_predict_batch_linear():
+    km = KerasLinear()
+    check_predict_batch(km, random_images(km))
+
+
+def test_predict_batch_categorical():
+    km = KerasCategorical()
+    check_predict_batch(km, random_images(km))
+
+
+def test_predict_batch_imu():
+    km = KerasIMU()
+    imgs = random_images(km)
+    check_predict_batch(km, imgs, np.random.rand(len(imgs), 6))
+
+
+def test_predict_batch_rnn():
+    km = KerasRNN_LSTM(input_shape=(60, 80, 3))
+    imgs = [np.random.randint(0, 255, (60, 80, 3), dtype=np.uint8)
+            for _ in range(5)]
+    # the sequence history is carried across batches like in run()
+    predictions = km.predict_batch(imgs, batch_size=2)
+    km.img_seq.reset()
+    for img, prediction in zip(imgs, predictions):
+        expected = [float(np.squeeze(v)) for v in km.run(img)]
+        np.testing.assert_allclose(prediction, expected, atol=1e-4)
+
+
+def test_frame_history():
+    history = FrameHistory(3)
+    frames = [np.full((2, 2, 1), i, dtype=np.float32) for i in range(5)]
+    history.append(frames[0])
+    assert [w[0, 0, 0] for w in history.window()] == [0, 0, 0]
+    for frame in frames[1:]:
+        history.append(frame)
+    window = history.window()
+    assert [w[0, 0, 0] for w in window] == [2, 3, 4]
+    # the window is a view into the buffer, not a copy
+    assert window.base is history.buffer
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import threading
 import unittest
+import numpy as np
 import pytest
-from donkeycar.memory import Memory
+from donkeycar.memory import Memory, FrameBuffer
 
 class TestMemory(unittest.TestCase):
 
@@ -66,3 +68,66 @@ class TestMemory(unittest.TestCase):
         mem.put(['myitem'], 888)
         
         assert dict(mem.items()) == {'myitem': 888}
+
+
+class TestFrameBuffer(unittest.TestCase):
+
+    def test_read_write(self):
+        buffer = FrameBuffer()
+        self.assertEqual(buffer.read(), (None, 0))
+        buffer.write(np.full((2, 3), 1, dtype=np.uint8))
+        frame, seq = buffer.read()
+        self.assertEqual((frame[0, 0], seq), (1, 1))
+        with pytest.raises(ValueError):
+            frame[0, 0] = 2
+        # without a new frame the same frame is returned
+        self.assertIs(buffer.read()[0], frame)
+        buffer.write(np.full((2, 3), 2, dtype=np.uint8))
+        buffer.write(np.full((2, 3), 3, dtype=np.uint8))
+        frame, seq = buffer.read()
+        self.assertEqual((frame[0, 0], seq), (3, 3))
+
+    def test_no_allocations(self):
+        buffer = FrameBuffer()
+        frames = set()
+        for i in range(10):
+            buffer.write_buffer((2, 3))[:] = i
+            buffer.publish()
+            frame, _ = buffer.read()
+            frames.add(frame.ctypes.data)
+        self.assertEqual(len(frames), 3)
+
+    def test_no_torn_frames(self):
+        buffer = FrameBuffer()
+        num_frames = 2000
+
+        def produce():
+            for i in range(1, num_frames + 1):
+                out = buffer.write_buffer((64, 64))
+                out[:32] = i % 256
+                out[32:] = i % 256
+                buffer.publish()
+
+        producer = threading.Thread(target=produce)
+        producer.start()
+        last_seq = 0
+        while producer.is_alive() or last_seq < num_frames:
+            frame, seq = buffer.read()
+            if frame is None:
+                continue
+            self.assertGreaterEqual(seq, last_seq)
+            self.assertTrue((frame == seq % 256).all())
+            last_seq = seq
+        producer.join()
+
+    def test_wait(self):
+        buffer = FrameBuffer()
+        # times out without a new frame
+        self.assertEqual(buffer.wait(0, timeout=0.01), 0)
+        timer = threading.Timer(
+            0.01, lambda: buffer.write(np.zeros((2, 3)), timestamp=12.5))
+        timer.start()
+        self.assertEqual(buffer.wait(0, timeout=5), 1)
+        timer.join()
+        buffer.read()
+        self.assertEqual(buffer.timestamp(), 12.5)
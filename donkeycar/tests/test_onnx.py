@@ -0,0 +1,48 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.keras import KerasLinear
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('tf2onnx')
+
+
+class TestOnnxPilot(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+
+    def test_keras_export(self):
+        from donkeycar.parts.onnx import keras_model_to_onnx, OnnxPilot
+        keras_pilot = KerasLinear()
+        keras_path = os.path.join(self._path, 'pilot.h5')
+        onnx_path = os.path.join(self._path, 'pilot.onnx')
+        keras_pilot.model.save(keras_path)
+        keras_model_to_onnx(keras_path, onnx_path)
+        images = [np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+                  for _ in range(4)]
+        expected = keras_pilot.predict_batch(images)
+        for optimization in ('none', 'all'):
+            pilot = OnnxPilot(num_threads=1, optimization=optimization)
+            pilot.load(onnx_path)
+            outputs = np.array([pilot.run(image) for image in images])
+            np.testing.assert_allclose(outputs, expected, atol=1e-4)
+            np.testing.assert_allclose(pilot.predict_batch(images), expected,
+                                       atol=1e-4)
+
+    def test_unknown_optimization(self):
+        from donkeycar.parts.onnx import OnnxPilot
+        with self.assertRaises(ValueError):
+            OnnxPilot(optimization='fast')
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,3 +1,6 @@
+import os
+import shutil
+import tempfile
 import time
 import unittest
 from typing import List
@@ -6,6 +9,7 @@ import numpy as np
 
 from donkeycar.config import Config
 from donkeycar.parts.keras import KerasLinear
+from donkeycar.parts.tub_v2 import Tub
 from donkeycar.pipeline.sequence import SizedIterator, TubSequence
 from donkeycar.pipeline.training import BatchSequence
 from donkeycar.pipeline.types import TubRecord, TubRecordDict
@@ -166,5 +170,54 @@ class TestPipeline(unittest.TestCase):
             self.assertAlmostEqual(3 * ey, ty)
 
 
+class TestParallelPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        tub = Tub(self._path, ['cam/image_array', 'user/angle',
+                               'user/throttle'],
+                  ['image_array', 'float', 'float'])
+        for i in range(size):
+            tub.write_record({'cam/image_array': np.full((120, 160, 3), i),
+                              'user/angle': i / size,
+                              'user/throttle': -i / size})
+        self.config = Config()
+        self.config.BATCH_SIZE = 4
+        self.config.IMAGE_W, self.config.IMAGE_H = 160, 120
+        self.config.IMAGE_DEPTH = 3
+        self.records = [TubRecord(self.config, tub.base_path, underlying)
+                        for underlying in tub]
+        tub.close()
+        self.model = KerasLinear()
+
+    def _batches(self, pipeline, is_train, count=3):
+        self.config.TRAIN_PIPELINE = pipeline
+        sequence = BatchSequence(self.model, self.config, self.records,
+                                 is_train=is_train)
+        return [(x['img_in'].numpy(), y['n_outputs0'].numpy())
+                for x, y in sequence.create_tf_data().take(count)]
+
+    def test_same_batches_as_generator(self):
+        generator = self._batches('generator', is_train=False)
+        parallel = self._batches('parallel', is_train=False)
+        for (x1, y1), (x2, y2) in zip(generator, parallel):
+            np.testing.assert_allclose(x1, x2)
+            np.testing.assert_allclose(y1, y2)
+
+    def test_seeded_shuffle(self):
+        self.config.TRAIN_SEED = 42
+        first = self._batches('parallel', is_train=True)
+        second = self._batches('parallel', is_train=True)
+        for (x1, y1), (x2, y2) in zip(first, second):
+            np.testing.assert_array_equal(x1, x2)
+            np.testing.assert_array_equal(y1, y2)
+        angles = np.concatenate([y for _, y in first])
+        self.assertEqual(sorted(angles[:size].tolist()),
+                         [i / size for i in range(size)])
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -36,6 +36,20 @@ def test_drivesim(cardir):
         print('error: ', err)
         raise ValueError (err)
 
+def test_dag(cardir):
+    cmd = ['donkey', 'createcar', '--path', cardir]
+    utils.run_shell_command(cmd)
+    cmd = ['donkey', 'dag', '--mock']
+    out, err, proc_id = utils.run_shell_command(cmd, cwd=cardir, timeout=60)
+    assert any(line.startswith('Critical path: MockCamera')
+               and line.rstrip().endswith('parts)') for line in out)
+    assert any(line.rstrip().endswith('levels') for line in out)
+    # running the parts off the mock would drive the car
+    cmd = ['donkey', 'dag', '--loops', '2']
+    out, err, proc_id = utils.run_shell_command(cmd, cwd=cardir, timeout=60)
+    assert any(b'--loops needs --mock' in line for line in err)
+
+
 def test_bad_command_fails():
     cmd = ['donkey', 'not a comand']
     out, err, proc_id = utils.run_shell_command(cmd)
@@ -1,8 +1,11 @@
 # -*- coding: utf-8 -*-
 
 from tempfile import gettempdir
+from donkeycar.parts.tub_v2 import TubWriter
+from donkeycar.vehicle import build_vehicle
 from donkeycar.templates import complete
 import donkeycar as dk
+import numpy as np
 import os
 
 from .setup import default_template, d2_path, custom_template
@@ -26,6 +29,32 @@ def test_drive():
     complete.drive(cfg=cfg)
 
 
+def test_drive_dataflow():
+    path = default_template(d2_path(gettempdir()))
+    myconfig = open(os.path.join(path, 'myconfig.py'), "wt")
+    myconfig.write("CAMERA_TYPE = 'MOCK'\n")
+    myconfig.write("USE_SSD1306_128_32 = False \n")
+    myconfig.write("DRIVE_TRAIN_TYPE = 'None'")
+    myconfig.close()
+    cfg = dk.load_config(os.path.join(path, 'config.py'))
+    sequential = build_vehicle(complete.drive, cfg=cfg)
+    cfg.DRIVE_LOOP_WORKERS = 2
+    dataflow = build_vehicle(complete.drive, cfg=cfg)
+    try:
+        for _ in range(5):
+            sequential.update_parts()
+            dataflow.update_parts()
+        # the channels recorded by the tub writer are the same
+        tub_inputs = next(entry['inputs'] for entry in dataflow.parts
+                          if isinstance(entry['part'], TubWriter))
+        for key in tub_inputs + ['angle', 'throttle']:
+            np.testing.assert_equal(dataflow.mem[key], sequential.mem[key],
+                                    err_msg=key)
+    finally:
+        sequential.stop()
+        dataflow.stop()
+
+
 def test_custom_templates():
     template_names = ["complete", "basic", "square"]
     for template in template_names:
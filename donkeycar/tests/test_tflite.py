@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from donkeycar.parts.keras import KerasLinear
+from donkeycar.parts.tflite import keras_model_to_tflite, output_position, \
+    TFLitePilot
+
+
+class TestTFLiteQuantization(unittest.TestCase):
+
+    def setUp(self):
+        self._path = tempfile.mkdtemp()
+        self.keras_path = os.path.join(self._path, 'pilot.h5')
+        self.pilot = KerasLinear()
+        self.pilot.model.save(self.keras_path)
+        self.images = [np.random.randint(0, 255, (120, 160, 3),
+                                         dtype=np.uint8) for _ in range(8)]
+
+    def convert(self, quantize, data_gen=None):
+        tflite_path = os.path.join(self._path, f'pilot_{quantize}.tflite')
+        keras_model_to_tflite(self.keras_path, tflite_path, data_gen,
+                              quantize)
+        pilot = TFLitePilot()
+        pilot.load(tflite_path)
+        return pilot
+
+    def test_int8(self):
+        def data_gen():
+            for image in self.images:
+                yield [(image / 255.0).astype(np.float32)[np.newaxis]]
+
+        pilot = self.convert('int8', data_gen)
+        self.assertEqual(pilot.input_details[0]['dtype'], np.uint8)
+        expected = self.pilot.predict_batch(self.images)
+        outputs = np.array([pilot.run(image) for image in self.images])
+        np.testing.assert_allclose(outputs, expected, atol=0.1)
+        # batched inference quantizes the normalised images instead
+        np.testing.assert_allclose(pilot.predict_batch(self.images), outputs,
+                                   atol=0.02)
+
+    def test_float_modes(self):
+        expected = self.pilot.predict_batch(self.images)
+        for quantize in ('fp16', 'dynamic'):
+            pilot = self.convert(quantize)
+            self.assertFalse(pilot.raw_input)
+            np.testing.assert_allclose(pilot.predict_batch(self.images),
+                                       expected, atol=0.05)
+
+    def test_threads_and_delegates(self):
+        tflite_path = os.path.join(self._path, 'pilot.tflite')
+        keras_model_to_tflite(self.keras_path, tflite_path)
+        expected = self.pilot.predict_batch(self.images)
+        for delegate in (None, 'none'):
+            pilot = TFLitePilot(num_threads=2, delegate=delegate)
+            pilot.load(tflite_path)
+            # run() normalises into the input tensor, the batch goes
+            # through set_tensor()
+            outputs = np.array([pilot.run(image) for image in self.images])
+            np.testing.assert_allclose(outputs, expected, atol=1e-4)
+            np.testing.assert_allclose(pilot.predict_batch(self.images),
+                                       expected, atol=1e-4)
+
+    def constant_outputs(self, angle, throttle):
+        """ Makes the keras model return constant angle and throttle """
+        for name, bias in (('n_outputs0', angle), ('n_outputs1', throttle)):
+            layer = self.pilot.model.get_layer(name)
+            kernel, _ = layer.get_weights()
+            layer.set_weights([np.zeros_like(kernel), np.array([bias])])
+        self.pilot.model.save(self.keras_path)
+
+    def test_output_order(self):
+        self.constant_outputs(0.5, -0.25)
+        for quantize in (None, 'fp16', 'dynamic'):
+            pilot = self.convert(quantize)
+            np.testing.assert_allclose(pilot.predict_batch(self.images[:2]),
+                                       [[0.5, -0.25]] * 2, atol=1e-3)
+            # the order does not depend on the order of the output details
+            details = pilot.interpreter.get_output_details()[::-1]
+            self.assertEqual(
+                [d['index'] for d in sorted(details, key=output_position)],
+                [d['index'] for d in pilot.output_details])
+
+    def test_run_output_order(self):
+        self.constant_outputs(0.5, -0.25)
+        tflite_path = os.path.join(self._path, 'pilot.tflite')
+        keras_model_to_tflite(self.keras_path, tflite_path)
+        for delegate in (None, 'none'):
+            pilot = TFLitePilot(num_threads=2, delegate=delegate)
+            pilot.load(tflite_path)
+            # run() reads the outputs from the tensor views
+            np.testing.assert_allclose(pilot.run(self.images[0]),
+                                       (0.5, -0.25), atol=1e-3)
+
+    def test_int8_needs_data(self):
+        with self.assertRaises(ValueError):
+            self.convert('int8')
+
+    def tearDown(self):
+        shutil.rmtree(self._path)
+
+
+if __name__ == '__main__':
+    unittest.main()
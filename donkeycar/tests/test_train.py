@@ -5,7 +5,8 @@ import numpy as np
 from collections import defaultdict, namedtuple
 from typing import Callable
 
-from donkeycar.pipeline.training import train, BatchSequence
+from donkeycar.pipeline.training import train, BatchSequence, \
+    get_model_train_details
 from donkeycar.config import Config
 from donkeycar.pipeline.types import TubDataset, TubRecord
 from donkeycar.utils import get_model_by_type, normalize_image
@@ -31,6 +32,7 @@ def config(car_dir) -> Config:
     cfg.MODELS_PATH = os.path.join(car_dir, 'models')
     cfg.DATA_PATH = os.path.join(car_dir, 'tub')
     cfg.SHOW_PLOT = False
+    cfg.SEQUENCE_LENGTH = 3
     return cfg
 
 
@@ -84,7 +86,8 @@ filters = [lambda r: r.underlying['user/throttle'] > 0.5,
                      r.underlying['user/angle'] > -0.5]
 
 
-@pytest.mark.parametrize('model_type', ['linear', 'categorical', 'inferred'])
+@pytest.mark.parametrize('model_type', ['linear', 'categorical', 'inferred',
+                                        'rnn', '3d'])
 @pytest.mark.parametrize('train_filter', filters)
 def test_training_pipeline(config: Config, model_type: str,
                            train_filter: Callable[[TubRecord], bool]) -> None:
@@ -102,7 +105,8 @@ def test_training_pipeline(config: Config, model_type: str,
     tub_dir = config.DATA_PATH
     # don't shuffle so we can identify data for testing
     config.TRAIN_FILTER = train_filter
-    dataset = TubDataset(config, [tub_dir], shuffle=False)
+    dataset = TubDataset(config, [tub_dir], shuffle=False,
+                         seq_size=kl.seq_size())
     training_records, validation_records = dataset.train_test_split()
     seq = BatchSequence(kl, config, training_records, True)
     data_train = seq.create_tf_data()
@@ -137,3 +141,45 @@ def test_training_pipeline(config: Config, model_type: str,
             for k, v in batch.items():
                 assert np.isclose(v, np_dict[k]).all()
 
+
+def test_crop_pipeline(config: Config) -> None:
+    """ Cropped images keep their smaller shape in tf.data """
+    config.TRAIN_PIPELINE = 'parallel'
+    config.AUGMENTATIONS = ['CROP']
+    config.ROI_CROP_TOP = 10
+    config.ROI_CROP_BOTTOM = 5
+    kl = get_model_by_type('linear', config)
+    dataset = TubDataset(config, [config.DATA_PATH], shuffle=False)
+    training_records, _ = dataset.train_test_split()
+    seq = BatchSequence(kl, config, training_records, True)
+    data_train = seq.create_tf_data()
+    x_spec, _ = data_train.element_spec
+    assert x_spec['img_in'].shape[1:] == (105, 160, 3)
+    x, _ = next(iter(data_train))
+    assert x['img_in'].shape[1:] == (105, 160, 3)
+
+
+def test_sequence_records(config: Config) -> None:
+    """ Sequences are made of consecutive records of the same tub """
+    config.TRAIN_FILTER = lambda r: r.underlying['_index'] != 10
+    dataset = TubDataset(config, [config.DATA_PATH], shuffle=False,
+                         seq_size=3)
+    training, validation = dataset.train_test_split()
+    sequences = training + validation
+    assert len(sequences) == len(dataset.records) - 2 * (3 - 1)
+    for sequence in sequences:
+        indexes = [r.underlying['_index'] for r in sequence]
+        assert len(indexes) == 3
+        assert indexes == list(range(indexes[0], indexes[0] + 3))
+        assert 10 not in indexes
+
+
+@pytest.mark.parametrize('model', ['pilot.tflite', 'pilot.onnx'])
+def test_converted_model_path(config: Config, model: str) -> None:
+    """ The keras model of converted models is trained into a .h5 file """
+    model_path, _, train_type, is_tflite, is_onnx = \
+        get_model_train_details(config, None, model, 'linear')
+    assert model_path == 'pilot.h5'
+    assert train_type == 'linear'
+    assert is_tflite == model.endswith('.tflite')
+    assert is_onnx == model.endswith('.onnx')
@@ -1,8 +1,15 @@
+import os
 import shutil
 import tempfile
+import time
 import unittest
+from unittest import mock
 
-from donkeycar.parts.tub_v2 import Tub
+import numpy as np
+from PIL import Image
+
+from donkeycar.parts import tub_v2
+from donkeycar.parts.tub_v2 import Tub, compact_tub
 
 
 class TestTub(unittest.TestCase):
@@ -34,6 +41,176 @@ class TestTub(unittest.TestCase):
         self.assertEqual(count, (write_count - len(delete_indexes)))
         self.assertEqual(len(self.tub), (write_count - len(delete_indexes)))
 
+    def test_random_access(self):
+        tub = Tub(self._path, ['input'], ['int'], max_catalog_len=7,
+                  batch_size=5)
+        for i in range(30):
+            tub.write_record({'input': i})
+        tub.delete_records([0, 8, 9, 21])
+        expected = list(tub)
+        self.assertEqual(len(expected), 26)
+        self.assertEqual(tub[0], expected[0])
+        self.assertEqual(tub[7], expected[7])
+        self.assertEqual(tub[-1], expected[-1])
+        self.assertEqual(tub[5:20], expected[5:20])
+        self.assertEqual(tub[::3], expected[::3])
+        with self.assertRaises(IndexError):
+            tub[26]
+        records = tub.get_records([29, 8, 3, 14])
+        self.assertEqual([r['input'] for r in records], [29, 3, 14])
+        tub.close()
+
+        read_only = Tub(self._path, read_only=True)
+        self.assertEqual(read_only[3:12], expected[3:12])
+        read_only.close()
+
+    def test_batched_writes(self):
+        tub = Tub(self._path, ['input'], ['int'], batch_size=4)
+        for i in range(10):
+            tub.write_record({'input': i})
+        # Two full batches are committed, the last two records are buffered
+        catalog = tub.manifest.current_catalog
+        self.assertEqual(catalog.seekable.lines(), 8)
+        self.assertEqual(len(tub), 10)
+        records = list(tub)
+        self.assertEqual([r['input'] for r in records], list(range(10)))
+        tub.close()
+
+    def test_batch_time_limit(self):
+        tub = Tub(self._path, ['input'], ['int'], batch_size=100,
+                  batch_ms=50)
+        start = time.time()
+        for i in range(3):
+            tub.write_record({'input': i})
+        catalog = tub.manifest.current_catalog
+        self.assertEqual(catalog.seekable.lines(), 0)
+        # no further record is written, the timer commits the batch
+        while catalog.seekable.lines() == 0 and time.time() - start < 5:
+            time.sleep(0.01)
+        self.assertGreaterEqual(time.time() - start, 0.05)
+        self.assertEqual(catalog.seekable.lines(), 3)
+        read_only = Tub(self._path, read_only=True)
+        self.assertEqual(len(read_only), 3)
+        read_only.close()
+        tub.close()
+
+    def test_recover_interrupted_batch(self):
+        tub = Tub(self._path, ['input'], ['int'], batch_size=4)
+        for i in range(6):
+            tub.write_record({'input': i})
+        # Simulate a crash: a half written record and no close()
+        catalog_path = tub.manifest.current_catalog.path
+        with open(catalog_path, 'a') as f:
+            f.write('{"_index": 8, "inp')
+        tub.manifest.current_index = 8
+        tub.manifest._update_catalog_metadata(update=True)
+
+        recovered = Tub(self._path, ['input'], ['int'])
+        self.assertEqual(recovered.manifest.current_index, 4)
+        self.assertEqual([r['input'] for r in recovered], list(range(4)))
+        recovered.write_record({'input': 4})
+        self.assertEqual([r['input'] for r in recovered], list(range(5)))
+        recovered.close()
+
+    def test_png_images(self):
+        inputs = ['cam/image_array_a', 'cam/image_array_b']
+        types = ['image_array', 'image_array']
+        tub = Tub(os.path.join(self._path, 'stereo'), inputs, types,
+                  image_format='png')
+        frames = [np.full((12, 16, 3), i, dtype=np.uint8) for i in range(4)]
+        for frame in frames:
+            tub.write_record({'cam/image_array_a': frame,
+                              'cam/image_array_b': 255 - frame})
+        tub.close()
+        for i, record in enumerate(tub):
+            self.assertEqual(record['cam/image_array_a'],
+                             f'{i}_cam_image_array_a_.png')
+            for key, expected in zip(inputs, [frames[i], 255 - frames[i]]):
+                path = os.path.join(tub.images_base_path, record[key])
+                np.testing.assert_array_equal(np.asarray(Image.open(path)),
+                                              expected)
+
+    def test_raw_images(self):
+        tub = Tub(os.path.join(self._path, 'raw'), ['cam/image_array'],
+                  ['image_array'], image_format='raw')
+        frame = np.arange(12 * 16 * 3, dtype=np.uint8).reshape(12, 16, 3)
+        tub.write_record({'cam/image_array': frame})
+        record = next(iter(tub))
+        path = os.path.join(tub.images_base_path, record['cam/image_array'])
+        np.testing.assert_array_equal(np.load(path), frame)
+        tub.close()
+
+    def _image_tub(self, path, count=20):
+        tub = Tub(path, ['cam/image_array', 'input'], ['image_array', 'int'],
+                  max_catalog_len=6)
+        for i in range(count):
+            frame = np.full((8, 8, 3), i, dtype=np.uint8)
+            tub.write_record({'cam/image_array': frame, 'input': i})
+        return tub
+
+    def _check_compacted(self, path, expected_inputs):
+        tub = Tub(path, read_only=True)
+        records = list(tub)
+        self.assertEqual([r['input'] for r in records], expected_inputs)
+        self.assertEqual([r['_index'] for r in records],
+                         list(range(len(expected_inputs))))
+        self.assertEqual([r['_original_index'] for r in records],
+                         expected_inputs)
+        self.assertEqual(tub[3]['input'], expected_inputs[3])
+        images = sorted(os.listdir(tub.images_base_path))
+        self.assertEqual(images, sorted(r['cam/image_array']
+                                        for r in records))
+        for record in records:
+            path = os.path.join(tub.images_base_path,
+                                record['cam/image_array'])
+            self.assertEqual(np.asarray(Image.open(path))[0, 0, 0],
+                             record['input'])
+        tub.close()
+
+    def test_compact(self):
+        path = os.path.join(self._path, 'compact')
+        tub = self._image_tub(path)
+        deleted = [0, 3, 4, 5, 6, 7, 13, 19]
+        tub.delete_records(deleted)
+        tub.close()
+        removed_records, removed_images = compact_tub(path)
+        self.assertEqual(removed_records, len(deleted))
+        self.assertEqual(removed_images, 20)
+        expected = [i for i in range(20) if i not in deleted]
+        self._check_compacted(path, expected)
+        # Recording continues after the compacted records
+        tub = Tub(path, ['cam/image_array', 'input'], ['image_array', 'int'])
+        self.assertEqual(len(tub), len(expected))
+        tub.write_record({'cam/image_array': np.zeros((8, 8, 3)),
+                          'input': 20})
+        self.assertEqual(tub[-1]['_index'], len(expected))
+        tub.close()
+
+    def test_compact_resumes(self):
+        path = os.path.join(self._path, 'resume')
+        tub = self._image_tub(path)
+        tub.delete_records([1, 2, 8, 15])
+        tub.close()
+        write_progress = tub_v2._write_progress
+        calls = []
+
+        def interrupt(progress_path, progress):
+            write_progress(progress_path, progress)
+            calls.append(progress['done'])
+            if len(calls) == 2:
+                raise KeyboardInterrupt()
+
+        with mock.patch.object(tub_v2, '_write_progress', interrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                compact_tub(path)
+        # The tub is still valid after the interruption
+        tub = Tub(path, read_only=True)
+        self.assertEqual(len(list(tub)), 16)
+        tub.close()
+        compact_tub(path)
+        expected = [i for i in range(20) if i not in [1, 2, 8, 15]]
+        self._check_compacted(path, expected)
+
     def tearDown(self):
         shutil.rmtree(self._path)
 
@@ -1,7 +1,15 @@
+import os
 import shutil
 import tempfile
+import time
 import unittest
 from random import randint
+from threading import Thread
+from unittest import mock
+
+import numpy as np
+import pytest
+from PIL import Image
 
 from donkeycar.parts.tub_v2 import Tub, TubWriter
 
@@ -35,6 +43,85 @@ class TestTub(unittest.TestCase):
                 id += 1
                 write_counts.pop(0)
 
+    def test_tubwriter_threaded(self):
+        tub_writer = TubWriter(self._path, inputs=['input'], types=['int'],
+                               queue_size=10)
+        t = Thread(target=tub_writer.update, daemon=True)
+        t.start()
+        for i in range(50):
+            num_records, queue_depth = tub_writer.run_threaded(i)
+            self.assertLessEqual(queue_depth, 10)
+        tub_writer.close()
+        t.join(timeout=1.0)
+        self.assertFalse(t.is_alive())
+        records = [record['input'] for record in tub_writer.tub]
+        self.assertEqual(records, list(range(50)))
+
+    def test_tubwriter_drop_policy(self):
+        tub_writer = TubWriter(self._path, inputs=['input'], types=['int'],
+                               queue_size=2, queue_policy='drop')
+        # writer thread not started yet, so the queue fills up
+        for i in range(5):
+            _, queue_depth = tub_writer.run_threaded(i)
+        self.assertEqual(queue_depth, 2)
+        self.assertEqual(tub_writer.dropped, 3)
+        t = Thread(target=tub_writer.update, daemon=True)
+        t.start()
+        tub_writer.close()
+        records = [record['input'] for record in tub_writer.tub]
+        self.assertEqual(records, [0, 1])
+
+    def test_tubwriter_threaded_frames(self):
+        from donkeycar.memory import FrameBuffer
+        tub_writer = TubWriter(self._path, inputs=['cam/image_array'],
+                               types=['image_array'], image_format='png')
+        buffer = FrameBuffer()
+        # writer thread not started yet, the producer overwrites the frame
+        # buffers while the records are queued
+        for i in range(5):
+            buffer.write(np.full((4, 4, 3), i, dtype=np.uint8))
+            frame, _ = buffer.read()
+            tub_writer.run_threaded(frame)
+        t = Thread(target=tub_writer.update, daemon=True)
+        t.start()
+        tub_writer.close()
+        images = [record['cam/image_array'] for record in tub_writer.tub]
+        for i, image in enumerate(images):
+            path = os.path.join(self._path, 'images', image)
+            self.assertEqual(np.asarray(Image.open(path))[0, 0, 0], i)
+
+    def test_tubwriter_flush_error(self):
+        tub_writer = TubWriter(self._path, inputs=['input'], types=['int'])
+        with mock.patch.object(tub_writer.tub, 'flush',
+                               side_effect=OSError('disk full')):
+            t = Thread(target=tub_writer.update, daemon=True)
+            t.start()
+            # the writer thread keeps running after failed commits
+            time.sleep(0.3)
+            self.assertTrue(t.is_alive())
+            tub_writer.run_threaded(1)
+        tub_writer.close()
+        self.assertFalse(t.is_alive())
+        self.assertEqual([r['input'] for r in tub_writer.tub], [1])
+
+    @pytest.mark.filterwarnings(
+        'ignore::pytest.PytestUnhandledThreadExceptionWarning')
+    def test_tubwriter_dead_thread(self):
+        tub_writer = TubWriter(self._path, inputs=['input'], types=['int'],
+                               queue_size=1, close_timeout=0.5)
+        tub_writer.run_threaded(0)
+        with mock.patch.object(tub_writer.queue, 'get',
+                               side_effect=RuntimeError('writer failed')):
+            t = Thread(target=tub_writer.update, daemon=True)
+            t.start()
+            t.join(timeout=1.0)
+        # the full queue does not block the drive loop forever
+        with self.assertRaises(RuntimeError):
+            tub_writer.run_threaded(1)
+        start = time.monotonic()
+        tub_writer.close()
+        self.assertLess(time.monotonic() - start, 5.0)
+
     def tearDown(self):
         shutil.rmtree(self._path)
 
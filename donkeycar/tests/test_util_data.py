@@ -158,3 +158,24 @@ def test_train_test_split():
     print(val_set)
     assert(len(train_set)==8)
     assert(len(val_set)==2)
+
+
+class TestNormalizeImage(unittest.TestCase):
+
+    def test_float32(self):
+        img = np.arange(256, dtype=np.uint8).reshape(16, 16, 1)
+        norm = normalize_image(img)
+        assert norm.dtype == np.float32
+        assert norm[0, 0, 0] == 0.0 and norm[-1, -1, 0] == 1.0
+
+    def test_out_buffer(self):
+        img = np.random.randint(0, 255, (4, 4, 3), dtype=np.uint8)
+        buffer = np.empty(img.shape, dtype=np.float32)
+        assert normalize_image(img, out=buffer) is buffer
+        np.testing.assert_array_equal(buffer, normalize_image(img))
+
+    def test_matches_tf_graph(self):
+        import tensorflow as tf
+        img = np.arange(256, dtype=np.uint8)
+        graph = tf.cast(img, tf.float32) * np.float32(ONE_BYTE_SCALE)
+        np.testing.assert_array_equal(normalize_image(img), graph.numpy())
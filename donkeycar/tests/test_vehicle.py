@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 import donkeycar as dk
 from donkeycar.parts.transform import Lambda
@@ -54,4 +55,236 @@ def test_should_raise_assertion_on_non_boolean_threaded_for_add_part():
     threaded = 'non_boolean'
     with pytest.raises(AssertionError):
         vehicle.add(_get_sample_lambda(), threaded=threaded)
-        pytest.fail("threaded is not a boolean: %r" % threaded)
\ No newline at end of file
+        pytest.fail("threaded is not a boolean: %r" % threaded)
+
+def test_latency_histogram():
+    from donkeycar.vehicle import LatencyHistogram
+    hist = LatencyHistogram()
+    samples = np.random.default_rng(0).lognormal(1, 1, 10000)
+    for sample in samples:
+        hist.add(sample)
+    assert len(hist.counts) < 300
+    assert hist.mean() == pytest.approx(samples.mean())
+    for pctile in (50, 90, 99):
+        assert hist.percentile(pctile) \
+               == pytest.approx(np.percentile(samples, pctile), rel=0.1)
+
+
+def test_perf_channels():
+    class Reader:
+        def __init__(self):
+            self.values = []
+
+        def run(self, loop_ms, part_ms, overruns):
+            self.values.append((loop_ms, part_ms, overruns))
+
+    v = dk.Vehicle()
+    v.add(_get_sample_lambda(), outputs=['test_out'])
+    v.add(_get_sample_lambda(), outputs=['test_out_2'])
+    reader = Reader()
+    v.add(reader, inputs=['perf/loop_ms', 'perf/Lambda_2_ms',
+                          'perf/overruns'])
+    assert v.profiler.channel_names[-3:] == \
+        ['perf/Lambda_ms', 'perf/Lambda_2_ms', 'perf/Reader_ms']
+    v.start(rate_hz=100, max_loop_count=5)
+    # perf channels of a loop are read in the next loop
+    assert reader.values[0] == (None, None, None)
+    loop_ms, part_ms, overruns = reader.values[-1]
+    assert loop_ms > part_ms > 0
+    assert overruns >= 0
+    assert v.profiler.loop.count == 6
+
+
+def test_perf_channels_part_added_twice():
+    v = dk.Vehicle()
+    part = _get_sample_lambda()
+    v.add(part, outputs=['test_out'])
+    v.add(part, outputs=['test_out_2'])
+    assert v.profiler.channel_names[-1] == 'perf/Lambda_ms'
+    v.start(rate_hz=100, max_loop_count=2)
+    assert v.mem['perf/Lambda_ms'] >= 0
+
+
+def test_compiled_plan():
+    v = dk.Vehicle()
+    v.mem['run'] = False
+    v.add(Lambda(lambda: (1, 2)), outputs=['a', 'b'])
+    v.add(Lambda(lambda a, b: a + b), inputs=['a', 'b'], outputs=['sum'])
+    v.add(Lambda(lambda: 5), outputs=['sum'], run_condition='run')
+    v.update_parts()
+    assert v.mem.get(['a', 'b', 'sum']) == [1, 2, 3]
+    # adding a part recompiles the plan
+    v.add(Lambda(lambda: True), outputs=['run'])
+    assert v.plan is None
+    v.update_parts()
+    v.update_parts()
+    assert v.mem['sum'] == 5
+
+
+def test_compiled_plan_missing_outputs():
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: (1,)), outputs=['a', 'b'])
+    with pytest.raises(IndexError):
+        v.update_parts()
+
+
+def test_part_rate():
+    v = dk.Vehicle()
+    counts = dict(fast=0, slow=0)
+
+    def count(name):
+        counts[name] += 1
+    v.add(Lambda(lambda: count('fast')))
+    v.add(Lambda(lambda: count('slow')), rate_hz=25)
+    v.period = 0.01
+    for i in range(20):
+        v.loop_start = 1000 + i * v.period
+        v.update_parts()
+    assert counts == dict(fast=20, slow=5)
+
+
+def test_low_priority_deferred():
+    import time
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: time.sleep(0.02)))
+    low = _get_sample_lambda()
+    v.add(low, outputs=['low'], priority='low')
+    v.add(Lambda(lambda low: low), inputs=['low'], outputs=['actuator'])
+    v.start(rate_hz=100, max_loop_count=4)
+    # the late loop runs the low priority part once a second only
+    assert v.profiler.deferred[low] == 4
+    assert v.profiler.records[low].count == 0
+    assert v.mem['actuator'] == 1
+
+
+def test_deadline_misses():
+    import time
+    v = dk.Vehicle()
+    part = Lambda(lambda: time.sleep(0.005))
+    v.add(part, deadline_ms=1)
+    assert v.profiler.channel_names[-1] == 'perf/Lambda_misses'
+    v.start(rate_hz=100, max_loop_count=2)
+    assert v.profiler.misses[part] == 3
+    assert v.mem['perf/Lambda_misses'] == 3
+
+
+def test_unknown_priority():
+    v = dk.Vehicle()
+    with pytest.raises(ValueError):
+        v.add(_get_sample_lambda(), priority='high')
+
+
+def test_part_graph():
+    v = dk.Vehicle()
+    v.add(Lambda(lambda: 1), outputs=['a'])
+    v.add(Lambda(lambda: 2), outputs=['b'])
+    v.add(Lambda(lambda a: a), inputs=['a'], outputs=['c'])
+    v.add(Lambda(lambda b: b), inputs=['b'], outputs=['a'],
+          run_condition='c')
+    v.add(Lambda(lambda c: None), inputs=['c'])
+    v.add(Lambda(lambda a: None), inputs=['a'])
+    graph = dk.vehicle.PartGraph(v.parts)
+    # the fourth part writes 'a' only after the third part read it
+    assert graph.deps == [set(), set(), {0}, {0, 1, 2}, {2}, {3, 4}]
+    assert graph.levels() == [0, 0, 1, 2, 2, 3]
+    path, length = graph.critical_path([1, 5, 1, 1, 1, 1])
+    assert path == [1, 3, 5]
+    assert length == 7
+
+
+def test_dataflow():
+    import threading
+    v = dk.Vehicle(workers=2)
+    # both slow parts must wait at the barrier at the same time, otherwise
+    # it breaks after the timeout
+    barrier = threading.Barrier(2, timeout=5)
+
+    def add_one(a):
+        barrier.wait()
+        return a + 1
+
+    def triple(a):
+        barrier.wait()
+        return a * 3
+    v.add(Lambda(lambda: 2), outputs=['a'])
+    v.add(Lambda(add_one), inputs=['a'], outputs=['b'])
+    v.add(Lambda(triple), inputs=['a'], outputs=['c'])
+    v.add(Lambda(lambda b, c: b + c), inputs=['b', 'c'], outputs=['sum'])
+    v.update_parts()
+    assert v.mem['sum'] == 9
+    v.stop()
+    assert v.executor is None
+
+
+def test_camera_triggered_loop():
+    import threading
+    import time
+    from donkeycar.parts.camera import BaseCamera, CameraTrigger
+
+    class Camera(BaseCamera):
+        publishes_frames = True
+
+        def __init__(self):
+            super().__init__()
+            self.on = True
+
+        def update(self):
+            while self.on:
+                self.buffer.write(np.zeros((2, 3), dtype=np.uint8))
+                time.sleep(0.01)
+
+        def shutdown(self):
+            self.on = False
+
+    v = dk.Vehicle()
+    cam = Camera()
+    v.add(cam, outputs=['cam/image_array'], threaded=True)
+    trigger = CameraTrigger(cam)
+    v.add(trigger, outputs=['cam/timestamp'])
+    start = time.perf_counter()
+    # frames arrive faster than the loop rate, which still holds
+    v.start(rate_hz=20, max_loop_count=9, trigger=trigger)
+    assert 0.4 <= time.perf_counter() - start < 2
+    assert v.mem['cam/timestamp'] <= time.time()
+    # the first loop can start before the first frame
+    assert v.profiler.latency.count >= 9
+    assert v.mem['perf/latency_ms'] > 0
+
+
+def test_camera_trigger_without_frames():
+    import time
+    from donkeycar.parts.camera import (CameraTrigger, ImageListCamera,
+                                        MockCamera)
+    assert not MockCamera.publishes_frames
+    assert not ImageListCamera.publishes_frames
+
+    v = dk.Vehicle()
+    cam = MockCamera(image_w=4, image_h=2)
+    v.add(cam, outputs=['cam/image_array'], threaded=True)
+    trigger = CameraTrigger(cam)
+    v.add(trigger, outputs=['cam/timestamp'])
+    v.add(Lambda(lambda: time.sleep(0.03)))
+    start = time.perf_counter()
+    # no extra period is added when no frame arrives
+    v.start(rate_hz=20, max_loop_count=9, trigger=trigger)
+    assert time.perf_counter() - start < 0.7
+    assert v.mem['cam/timestamp'] is None
+
+
+def test_build_vehicle():
+    from donkeycar.vehicle import build_vehicle
+
+    def drive(rate_hz):
+        v = dk.Vehicle()
+        v.add(Lambda(lambda: 1), outputs=['a'])
+        v.start(rate_hz=rate_hz, max_loop_count=1)
+        return v
+
+    v = build_vehicle(drive, rate_hz=20)
+    assert v.profiler.records[v.parts[0]['part']].count == 0
+    v.update_parts()
+    assert v.mem['a'] == 1
+    # vehicles start again afterwards
+    assert drive(20).mem['a'] == 1
+    with pytest.raises(RuntimeError):
+        build_vehicle(lambda: None)
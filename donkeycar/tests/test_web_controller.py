@@ -2,6 +2,7 @@
 import pytest
 import json
 import os
+import numpy as np
 from donkeycar.parts.web_controller.web import LocalWebController
 import donkeycar.templates.cfg_complete as cfg
 from importlib import reload
@@ -30,3 +31,24 @@ def test_web_control_user_defined_port():
     
     assert server.port == 12345
 
+
+
+def test_frames_are_buffered(server):
+    from donkeycar.memory import FrameBuffer
+    buffer = FrameBuffer()
+    buffer.write(np.zeros((2, 3), dtype=np.uint8))
+    frame, _ = buffer.read()
+    server.run_threaded(frame)
+    # the video handler encodes the frame after the camera buffer is reused
+    buffer.write(np.ones((2, 3), dtype=np.uint8))
+    buffer.read()
+    buffer.write(np.full((2, 3), 2, dtype=np.uint8))
+    buffer.write(np.full((2, 3), 3, dtype=np.uint8))
+    assert (frame == 3).all()
+    img_arr, seq = server.buffer.read()
+    assert img_arr is not frame
+    assert seq == 1
+    assert (img_arr == 0).all()
+    # without a frame the last one is kept
+    server.run_threaded(None)
+    assert server.buffer.read()[1] == 1
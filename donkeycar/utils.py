@@ -5,6 +5,7 @@ Functions that don't fit anywhere else.
 
 '''
 from io import BytesIO
+import importlib
 import os
 import glob
 import socket
@@ -123,13 +124,18 @@ def img_crop(img_arr, top, bottom):
     return img_arr[top:end, ...]
 
 
-def normalize_image(img_arr_uint):
+def normalize_image(img_arr_uint, out=None):
     """
-    Convert uint8 numpy image array into [0,1] float image array
+    Convert uint8 numpy image array into [0,1] float image array. The
+    scaling is done in float32, like the tf.data training pipeline does it,
+    so training and inference see identical values.
     :param img_arr_uint:    [0,255]uint8 numpy image array
+    :param out:             optional preallocated float32 array of the same
+                            shape, which gets overwritten and returned
     :return:                [0,1] float32 numpy image array
     """
-    return img_arr_uint.astype(np.float64) * ONE_BYTE_SCALE
+    return np.multiply(img_arr_uint, np.float32(ONE_BYTE_SCALE), out=out,
+                       dtype=np.float32)
 
 
 def denormalize_image(img_arr_float):
@@ -150,7 +156,11 @@ def load_pil_image(filename, cfg):
     Returns: a PIL image.
     """
     try:
-        img = Image.open(filename)
+        if filename.endswith('.npy'):
+            # raw image arrays written by the tub
+            img = Image.fromarray(np.load(filename))
+        else:
+            img = Image.open(filename)
         if img.height != cfg.IMAGE_H or img.width != cfg.IMAGE_W:
             img = img.resize((cfg.IMAGE_W, cfg.IMAGE_H))
 
@@ -409,13 +419,29 @@ def eprint(*args, **kwargs):
     print(*args, file=sys.stderr, **kwargs)
 
 
+class LazyModule(object):
+    """
+    Stands in for a module which is imported on the first attribute access.
+    Heavy frameworks like tensorflow are only loaded once a pilot or
+    trainer uses them, not when a car or a command starts.
+    """
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, item: str) -> Any:
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, item)
+
+
 def get_model_by_type(model_type: str, cfg: 'Config') -> 'KerasPilot':
     '''
     given the string model_type and the configuration settings in cfg
     create a Keras model and return it.
     '''
     from donkeycar.parts.keras import KerasPilot, KerasCategorical, \
-        KerasLinear, KerasInferred
+        KerasLinear, KerasInferred, KerasRNN_LSTM, Keras3D_CNN
     from donkeycar.parts.tflite import TFLitePilot
 
     if model_type is None:
@@ -431,8 +457,20 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> 'KerasPilot':
                               throttle_range=cfg.MODEL_CATEGORICAL_MAX_THROTTLE_RANGE)
     elif model_type == 'inferred':
         kl = KerasInferred(input_shape=input_shape)
+    elif model_type == 'rnn':
+        kl = KerasRNN_LSTM(input_shape=input_shape,
+                           seq_length=cfg.SEQUENCE_LENGTH)
+    elif model_type == '3d':
+        kl = Keras3D_CNN(input_shape=input_shape,
+                         seq_length=cfg.SEQUENCE_LENGTH)
     elif model_type == "tflite_linear":
-        kl = TFLitePilot()
+        kl = TFLitePilot(num_threads=getattr(cfg, 'TFLITE_NUM_THREADS', None),
+                         delegate=getattr(cfg, 'TFLITE_DELEGATE', None))
+    elif model_type == "onnx_linear":
+        from donkeycar.parts.onnx import OnnxPilot
+        kl = OnnxPilot(num_threads=getattr(cfg, 'ONNX_NUM_THREADS', None),
+                       optimization=getattr(cfg, 'ONNX_GRAPH_OPTIMIZATION',
+                                            'all'))
     elif model_type == "tensorrt_linear":
         # Aggressively lazy load this. This module imports pycuda.autoinit
         # which causes a lot of unexpected things to happen when using TF-GPU
@@ -441,8 +479,8 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> 'KerasPilot':
         kl = TensorRTLinear(cfg=cfg)
     else:
         raise Exception("Unknown model type {:}, supported types are "
-                        "linear, categorical, inferred, tflite_linear, "
-                        "tensorrt_linear"
+                        "linear, categorical, inferred, rnn, 3d, "
+                        "tflite_linear, onnx_linear, tensorrt_linear"
                         .format(model_type))
 
     return kl
@@ -6,9 +6,13 @@ Created on Sun Jun 25 10:44:24 2017
 @author: wroscoe
 """
 
+import bisect
+import itertools
+import math
 import time
-import numpy as np
 import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from threading import Thread
 from .memory import Memory
 from prettytable import PrettyTable
@@ -17,24 +21,156 @@ import traceback
 logger = logging.getLogger(__name__)
 
 
+class LatencyHistogram:
+    """
+    Streaming histogram of durations in ms with logarithmic buckets. Memory
+    does not grow with the number of samples, so it can run for the whole
+    drive. Buckets grow by a factor of 2^(1/8), which keeps percentiles
+    within about 5% of the exact value.
+    """
+    def __init__(self, min_ms=0.001, max_ms=100000.0, buckets_per_octave=8):
+        self.min_ms = min_ms
+        self.log_min = math.log(min_ms)
+        self.scale = buckets_per_octave / math.log(2)
+        self.top = int(math.ceil(math.log(max_ms / min_ms) * self.scale))
+        self.counts = [0] * (self.top + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.last = ms
+        if ms < self.min:
+            self.min = ms
+        if ms > self.max:
+            self.max = ms
+        if ms > self.min_ms:
+            bucket = int((math.log(ms) - self.log_min) * self.scale)
+            self.counts[bucket if bucket < self.top else self.top] += 1
+        else:
+            self.counts[0] += 1
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, pctile):
+        """ Returns the geometric centre of the bucket holding pctile """
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pctile / 100 * self.count))
+        bucket = bisect.bisect_left(list(itertools.accumulate(self.counts)),
+                                    rank)
+        value = self.min_ms * math.exp((bucket + 0.5) / self.scale)
+        return min(max(value, self.min), self.max)
+
+
 class PartProfiler:
+    """
+    Keeps a LatencyHistogram of the run time of each part, of the drive
+    loop, of the time spent in Memory get and put and of the jitter, ie.
+    how far the time between two loop starts is off the loop period. When
+    parts publish the capture time of the camera frame on cam/timestamp,
+    it also keeps the glass to actuator latency, from the capture of the
+    frame to the end of the loop which ran the actuators on it. The
+    latest values are published into memory on the channels in
+    channel_names, like perf/loop_ms and perf/<part>_ms. Parts with a
+    deadline also publish their number of missed deadlines on
+    perf/<part>_misses.
+    """
+    LOOP_CHANNELS = ['perf/loop_ms', 'perf/jitter_ms', 'perf/memory_ms',
+                     'perf/overruns', 'perf/latency_ms']
+
     def __init__(self):
         self.records = {}
-
-    def profile_part(self, p):
-        self.records[p] = { "times" : [] }
+        self.names = {}
+        self.starts = {}
+        self.warm = set()
+        self.loop = LatencyHistogram()
+        self.jitter = LatencyHistogram()
+        self.memory = LatencyHistogram()
+        self.latency = LatencyHistogram()
+        self.memory_time = 0.0
+        self.overruns = 0
+        self.last_loop_start = None
+        # deadline misses and deferred runs per part
+        self.misses = {}
+        self.deferred = {}
+
+    @property
+    def channel_names(self):
+        return PartProfiler.LOOP_CHANNELS \
+            + [f'perf/{self.names[p]}_ms' for p in self.records] \
+            + [f'perf/{self.names[p]}_misses' for p in self.misses]
+
+    def profile_part(self, p, deadline=False):
+        if deadline:
+            self.misses.setdefault(p, 0)
+        # a part added twice shares its histogram and channel
+        if p in self.records:
+            return
+        self.records[p] = LatencyHistogram()
+        # parts of the same class get numbered names
+        name = p.__class__.__name__
+        i = 1
+        while name in self.names.values():
+            i += 1
+            name = f'{p.__class__.__name__}_{i}'
+        self.names[p] = name
 
     def on_part_start(self, p):
-        self.records[p]['times'].append(time.time())
+        self.starts[p] = time.perf_counter()
 
     def on_part_finished(self, p):
-        now = time.time()
-        prev = self.records[p]['times'][-1]
-        delta = now - prev
-        thresh = 0.000001
-        if delta < thresh or delta > 100000.0:
-            delta = thresh
-        self.records[p]['times'][-1] = delta
+        self.on_part_run(p, time.perf_counter() - self.starts[p])
+
+    def on_part_run(self, p, delta):
+        """ Adds the run time of part p in seconds """
+        # skip the first run, there could be one-off time spent in
+        # initialisations
+        if p in self.warm:
+            self.records[p].add(delta * 1000)
+        else:
+            self.warm.add(p)
+
+    def on_deadline_miss(self, p):
+        self.misses[p] += 1
+
+    def on_deferred(self, p):
+        """ Counts a run of a low priority part put off by a late loop """
+        self.deferred[p] = self.deferred.get(p, 0) + 1
+
+    def on_memory(self, delta):
+        """ Adds time spent in Memory.get() or Memory.put() in this loop """
+        self.memory_time += delta
+
+    def on_frame_latency(self, delta):
+        """ Adds the time from the capture of the frame in seconds """
+        self.latency.add(delta * 1000)
+
+    def on_loop_start(self, start, period):
+        if self.last_loop_start is not None:
+            jitter = abs(start - self.last_loop_start - period)
+            self.jitter.add(jitter * 1000)
+        self.last_loop_start = start
+        self.memory_time = 0.0
+
+    def on_loop_finished(self, start, period):
+        loop_time = time.perf_counter() - start
+        self.loop.add(loop_time * 1000)
+        self.memory.add(self.memory_time * 1000)
+        if loop_time > period:
+            self.overruns += 1
+
+    def channels(self):
+        """ Latest values of the channels in channel_names """
+        return [self.loop.last, self.jitter.last, self.memory.last,
+                self.overruns, self.latency.last] \
+            + [h.last for h in self.records.values()] \
+            + list(self.misses.values())
 
     def report(self):
         logger.info("Part Profile Summary: (times in ms)")
@@ -42,24 +178,179 @@ class PartProfiler:
         field_names = ["part", "max", "min", "avg"]
         pctile = [50, 90, 99, 99.9]
         pt.field_names = field_names + [str(p) + '%' for p in pctile]
-        for p, val in self.records.items():
-            # remove first and last entry because you there could be one-off
-            # time spent in initialisations, and the latest diff could be
-            # incomplete because of user keyboard interrupt
-            arr = val['times'][1:-1]
-            if len(arr) == 0:
+        rows = [(self.names[p], hist) for p, hist in self.records.items()] \
+            + [('loop', self.loop), ('memory', self.memory),
+               ('jitter', self.jitter), ('latency', self.latency)]
+        for name, hist in rows:
+            if hist.count == 0:
                 continue
-            row = [p.__class__.__name__,
-                   "%.2f" % (max(arr) * 1000),
-                   "%.2f" % (min(arr) * 1000),
-                   "%.2f" % (sum(arr) / len(arr) * 1000)]
-            row += ["%.2f" % (np.percentile(arr, p) * 1000) for p in pctile]
+            row = [name,
+                   "%.2f" % hist.max,
+                   "%.2f" % hist.min,
+                   "%.2f" % hist.mean()]
+            row += ["%.2f" % hist.percentile(p) for p in pctile]
             pt.add_row(row)
         logger.info('\n' + str(pt))
+        logger.info(f'Loop overruns: {self.overruns} of {self.loop.count}')
+        for p, misses in self.misses.items():
+            logger.info(f'{self.names[p]} missed its deadline {misses} times')
+        for p, deferred in self.deferred.items():
+            logger.info(f'{self.names[p]} was deferred {deferred} times')
+
+
+class PartSchedule:
+    """
+    When a part runs in the drive loop, see Vehicle.add(). A part with a
+    rate runs in the first loop after its next run is due. Low priority
+    parts are deferred while the loop is late, ie. it already used up its
+    period, but they run at least once per interval or second. Normal
+    priority parts, like actuators, are never deferred. A deadline counts
+    the loops in which the part finished later than deadline_ms after the
+    loop start.
+    """
+    PRIORITIES = ('normal', 'low')
+
+    def __init__(self, rate_hz=None, priority='normal', deadline_ms=None):
+        if priority not in PartSchedule.PRIORITIES:
+            raise ValueError(f'Unknown priority {priority}, expected one of '
+                             f'{PartSchedule.PRIORITIES}')
+        self.interval = 1.0 / rate_hz if rate_hz else 0.0
+        self.low = priority == 'low'
+        self.deadline = deadline_ms / 1000 if deadline_ms else None
+        self.next_run = 0.0
+        self.last_run = 0.0
+
+    def due(self, now, loop_start, period):
+        """
+        Returns if the part runs now, 'deferred' if a low priority part
+        is put off because the loop is late.
+        """
+        # half a period of slack, so loop jitter does not skip a whole loop
+        if loop_start + 0.5 * (period or 0.0) < self.next_run:
+            return False
+        if self.low and period and now - loop_start > period \
+                and now - self.last_run < max(self.interval, 1.0):
+            return 'deferred'
+        return True
+
+    def ran(self, loop_start):
+        self.last_run = loop_start
+        if self.interval:
+            # keep the phase, unless the part fell behind by a whole interval
+            self.next_run += self.interval
+            if self.next_run <= loop_start:
+                self.next_run = loop_start + self.interval
+
+
+class PartGraph:
+    """
+    Dependency graph of the parts of a vehicle, built from the declared
+    inputs, outputs and run conditions. A part depends on the last part
+    before it which wrote one of its inputs or its run condition, on the
+    parts before it which read or wrote one of its outputs since, so it
+    does not overwrite a value they still need, and on earlier entries of
+    the same part object. Parts without outputs, like actuators and
+    displays, only have side effects, so they keep their order among each
+    other. Any order which respects the graph gives the same memory as
+    running the parts one after the other.
+    """
+    def __init__(self, entries):
+        self.deps = [set() for _ in entries]
+        last_writer = {}
+        readers = {}
+        last_entry = {}
+        last_sink = None
+        for i, entry in enumerate(entries):
+            deps = self.deps[i]
+            reads = list(entry['inputs'])
+            if entry.get('run_condition'):
+                reads.append(entry['run_condition'])
+            for key in reads:
+                if key in last_writer:
+                    deps.add(last_writer[key])
+            for key in entry['outputs']:
+                deps.update(readers.get(key, ()))
+                if key in last_writer:
+                    deps.add(last_writer[key])
+            part_id = id(entry['part'])
+            if part_id in last_entry:
+                deps.add(last_entry[part_id])
+            last_entry[part_id] = i
+            if not entry['outputs']:
+                if last_sink is not None:
+                    deps.add(last_sink)
+                last_sink = i
+            deps.discard(i)
+            for key in reads:
+                readers.setdefault(key, []).append(i)
+            for key in entry['outputs']:
+                last_writer[key] = i
+                readers[key] = []
+        self.dependents = [[] for _ in entries]
+        for i, deps in enumerate(self.deps):
+            for dep in deps:
+                self.dependents[dep].append(i)
+
+    def levels(self):
+        """ Level of each part, parts of the same level are independent """
+        levels = []
+        for deps in self.deps:
+            levels.append(max((levels[dep] + 1 for dep in deps), default=0))
+        return levels
+
+    def critical_path(self, weights):
+        """
+        Returns the longest chain of dependent parts, given the weight, ie.
+        the run time, of each part, and its total weight.
+        """
+        total = []
+        previous = []
+        for i, deps in enumerate(self.deps):
+            dep = max(deps, key=lambda d: total[d], default=None)
+            previous.append(dep)
+            total.append(weights[i] + (total[dep] if dep is not None else 0))
+        if not total:
+            return [], 0
+        i = max(range(len(total)), key=lambda j: total[j])
+        length = total[i]
+        path = []
+        while i is not None:
+            path.append(i)
+            i = previous[i]
+        return path[::-1], length
+
+
+def timed_run(run, args):
+    """ Runs a part on a worker thread, returns its result and run time """
+    start = time.perf_counter()
+    result = run(*args)
+    return result, time.perf_counter() - start
+
+
+def put_outputs(part, data, outputs, result):
+    """ Writes the result of a part into the memory slots of its outputs """
+    if len(outputs) == 1:
+        data[outputs[0]] = result
+    elif len(result) < len(outputs):
+        raise IndexError(
+            f'{part.__class__.__name__} returned {len(result)} '
+            f'values for {len(outputs)} outputs')
+    else:
+        for index, value in zip(outputs, result):
+            data[index] = value
 
 
 class Vehicle:
-    def __init__(self, mem=None):
+    # collects the vehicles instead of starting them, see build_vehicle()
+    _built = None
+
+    def __init__(self, mem=None, workers=0):
+        """
+        :param mem:         memory of the vehicle, a new one by default
+        :param workers:     run independent parts concurrently on this many
+                            worker threads, see PartGraph, 0 to run the
+                            parts one after the other
+        """
 
         if not mem:
             mem = Memory()
@@ -68,9 +359,22 @@ class Vehicle:
         self.on = True
         self.threads = []
         self.profiler = PartProfiler()
+        # compiled from parts by compile(), rebuilt when parts change
+        self.plan = None
+        self.perf_slots = []
+        self.timestamp_slot = None
+        # loop period and start of the current loop, used by PartSchedule
+        self.period = None
+        self.loop_start = 0.0
+        self.workers = workers
+        self.graph = None
+        self.executor = None
+        # parts faster than this run on the drive loop thread
+        self.inline_ms = 0.5
 
     def add(self, part, inputs=[], outputs=[],
-            threaded=False, run_condition=None):
+            threaded=False, run_condition=None, rate_hz=None,
+            priority='normal', deadline_ms=None):
         """
         Method to add a part to the vehicle drive loop.
 
@@ -86,6 +390,14 @@ class Vehicle:
                 If a part should be run in a separate thread.
             run_condition : str
                 If a part should be run or not
+            rate_hz : float
+                Run the part at this rate, None to run it in every loop
+            priority : str
+                'normal' or 'low', low priority parts are deferred while
+                the loop is late
+            deadline_ms : float
+                Count a deadline miss if the part finishes later than this
+                after the loop start
         """
         assert type(inputs) is list, "inputs is not a list: %r" % inputs
         assert type(outputs) is list, "outputs is not a list: %r" % outputs
@@ -98,6 +410,8 @@ class Vehicle:
         entry['inputs'] = inputs
         entry['outputs'] = outputs
         entry['run_condition'] = run_condition
+        if rate_hz or priority != 'normal' or deadline_ms:
+            entry['schedule'] = PartSchedule(rate_hz, priority, deadline_ms)
 
         if threaded:
             t = Thread(target=part.update, args=())
@@ -105,15 +419,45 @@ class Vehicle:
             entry['thread'] = t
 
         self.parts.append(entry)
-        self.profiler.profile_part(part)
+        self.profiler.profile_part(part, deadline=bool(deadline_ms))
+        self.plan = None
 
     def remove(self, part):
         """
         remove part form list
         """
         self.parts.remove(part)
+        self.plan = None
 
-    def start(self, rate_hz=10, max_loop_count=None, verbose=False):
+    def compile(self):
+        """
+        Compiles the parts into the flat plan run by update_parts(). Each
+        step holds the part, its bound run or run_threaded method, the
+        memory slots of its run condition, inputs and outputs and its
+        PartSchedule, so the drive loop does not look up entries or channel
+        names.
+        """
+        slot = self.mem.slot
+        self.plan = []
+        for entry in self.parts:
+            part = entry['part']
+            run = part.run_threaded if entry.get('thread') else part.run
+            condition = entry.get('run_condition')
+            self.plan.append(
+                (part, run, slot(condition) if condition else None,
+                 tuple(slot(key) for key in entry['inputs']),
+                 tuple(slot(key) for key in entry['outputs']),
+                 entry.get('schedule')))
+        self.perf_slots = [slot(key) for key in self.profiler.channel_names]
+        self.timestamp_slot = slot('cam/timestamp')
+        if self.workers:
+            self.graph = PartGraph(self.parts)
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix='vehicle')
+
+    def start(self, rate_hz=10, max_loop_count=None, verbose=False,
+              trigger=None):
         """
         Start vehicle's main drive loop.
 
@@ -132,7 +476,15 @@ class Vehicle:
             used for testing that all the parts of the vehicle work.
         verbose: bool
             If debug output should be printed into shell
+        trigger:
+            Part with a wait(timeout) method, like CameraTrigger. The loop
+            waits for the trigger, ie. a new camera frame, until the end of
+            the loop period. The loop still runs at most at rate_hz and does
+            not wait longer when the trigger does not fire.
         """
+        if Vehicle._built is not None:
+            Vehicle._built.append(self)
+            return
 
         try:
 
@@ -147,8 +499,12 @@ class Vehicle:
             logger.info('Starting vehicle at {} Hz'.format(rate_hz))
 
             loop_count = 0
+            period = 1.0 / rate_hz
+            self.period = period
             while self.on:
-                start_time = time.time()
+                start_time = time.perf_counter()
+                self.loop_start = start_time
+                self.profiler.on_loop_start(start_time, period)
                 loop_count += 1
 
                 self.update_parts()
@@ -157,9 +513,26 @@ class Vehicle:
                 if max_loop_count and loop_count > max_loop_count:
                     self.on = False
 
-                sleep_time = 1.0 / rate_hz - (time.time() - start_time)
+                # publish loop timing, parts read it in the next loop
+                data = self.mem.data
+                timestamp = data[self.timestamp_slot]
+                if timestamp:
+                    self.profiler.on_frame_latency(time.time() - timestamp)
+                self.profiler.on_loop_finished(start_time, period)
+                for index, value in zip(self.perf_slots,
+                                        self.profiler.channels()):
+                    data[index] = value
+
+                sleep_time = period - (time.perf_counter() - start_time)
                 if sleep_time > 0.0:
-                    time.sleep(sleep_time)
+                    if trigger is not None:
+                        # wait for the next frame within the loop period,
+                        # then keep the period so the loop never runs
+                        # faster than rate_hz
+                        trigger.wait(sleep_time)
+                        sleep_time = period - (time.perf_counter()
+                                               - start_time)
+                    time.sleep(max(sleep_time, 0.0))
                 else:
                     # print a message when could not maintain loop rate.
                     if verbose:
@@ -180,32 +553,116 @@ class Vehicle:
         '''
         loop over all parts
         '''
-        for entry in self.parts:
-
-            run = True
+        if self.plan is None:
+            self.compile()
+        if self.workers:
+            self.update_parts_dataflow()
+            return
+        data = self.mem.data
+        profiler = self.profiler
+        clock = time.perf_counter
+        loop_start = self.loop_start or clock()
+        period = self.period
+        for part, run, condition, inputs, outputs, schedule in self.plan:
             # check run condition, if it exists
-            if entry.get('run_condition'):
-                run_condition = entry.get('run_condition')
-                run = self.mem.get([run_condition])[0]
-            
-            if run:
-                # get part
-                p = entry['part']
-                # start timing part run
-                self.profiler.on_part_start(p)
-                # get inputs from memory
-                inputs = self.mem.get(entry['inputs'])
-                # run the part
-                if entry.get('thread'):
-                    outputs = p.run_threaded(*inputs)
+            if condition is not None and not data[condition]:
+                continue
+            # get inputs from memory
+            start = clock()
+            if schedule is not None:
+                due = schedule.due(start, loop_start, period)
+                if due == 'deferred':
+                    profiler.on_deferred(part)
+                if due is not True:
+                    continue
+                schedule.ran(loop_start)
+            args = [data[index] for index in inputs]
+            # run the part
+            run_start = clock()
+            result = run(*args)
+            run_end = clock()
+            # save the output to memory
+            if result is not None and outputs:
+                put_outputs(part, data, outputs, result)
+            end = clock()
+            profiler.on_part_run(part, end - start)
+            profiler.on_memory(run_start - start + end - run_end)
+            if schedule is not None and schedule.deadline is not None \
+                    and end - loop_start > schedule.deadline:
+                profiler.on_deadline_miss(part)
+
+    def update_parts_dataflow(self):
+        """
+        Runs the parts in the order of the PartGraph. Parts run as soon as
+        the parts they depend on have finished, slow parts on the worker
+        threads and fast and threaded parts, whose run_threaded() only
+        hands over values, on the drive loop thread. Memory is only read
+        and written on the drive loop thread.
+        """
+        data = self.mem.data
+        profiler = self.profiler
+        clock = time.perf_counter
+        plan = self.plan
+        dependents = self.graph.dependents
+        waiting = [len(deps) for deps in self.graph.deps]
+        ready = deque(i for i, count in enumerate(waiting) if count == 0)
+        running = {}
+        loop_start = self.loop_start or clock()
+        period = self.period
+
+        def finish(i):
+            for j in dependents[i]:
+                waiting[j] -= 1
+                if waiting[j] == 0:
+                    ready.append(j)
+
+        def store(i, result, run_time, get_time):
+            part, _, _, _, outputs, schedule = plan[i]
+            put_start = clock()
+            if result is not None and outputs:
+                put_outputs(part, data, outputs, result)
+            end = clock()
+            memory_time = get_time + end - put_start
+            profiler.on_part_run(part, run_time + memory_time)
+            profiler.on_memory(memory_time)
+            if schedule is not None and schedule.deadline is not None \
+                    and end - loop_start > schedule.deadline:
+                profiler.on_deadline_miss(part)
+            finish(i)
+
+        while ready or running:
+            while ready:
+                i = ready.popleft()
+                part, run, condition, inputs, _, schedule = plan[i]
+                if condition is not None and not data[condition]:
+                    finish(i)
+                    continue
+                start = clock()
+                if schedule is not None:
+                    due = schedule.due(start, loop_start, period)
+                    if due == 'deferred':
+                        profiler.on_deferred(part)
+                    if due is not True:
+                        finish(i)
+                        continue
+                    schedule.ran(loop_start)
+                args = [data[index] for index in inputs]
+                record = profiler.records[part]
+                if self.parts[i].get('thread') \
+                        or record.count and record.mean() < self.inline_ms:
+                    run_start = clock()
+                    result = run(*args)
+                    run_end = clock()
+                    store(i, result, run_end - run_start, run_start - start)
                 else:
-                    outputs = p.run(*inputs)
-
-                # save the output to memory
-                if outputs is not None:
-                    self.mem.put(entry['outputs'], outputs)
-                # finish timing part run
-                self.profiler.on_part_finished(p)
+                    future = self.executor.submit(timed_run, run, args)
+                    running[future] = i, clock() - start
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    i, get_time = running.pop(future)
+                    result, run_time = future.result()
+                    store(i, result, run_time, get_time)
 
     def stop(self):        
         logger.info('Shutting down vehicle and its parts...')
@@ -217,5 +674,25 @@ class Vehicle:
                 pass
             except Exception as e:
                 logger.error(e)
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
 
         self.profiler.report()
+
+
+def build_vehicle(drive, *args, **kwargs):
+    """
+    Calls drive(*args, **kwargs), usually drive() of a template, up to the
+    start of the drive loop and returns the vehicle it built without
+    starting it. Threaded parts are not started, call update_parts() to run
+    the parts and stop() to shut them down.
+    """
+    built = Vehicle._built = []
+    try:
+        drive(*args, **kwargs)
+    finally:
+        Vehicle._built = None
+    if not built:
+        raise RuntimeError(f'{drive.__name__}() did not start a vehicle')
+    return built[0]
@@ -0,0 +1,110 @@
+"""
+Script to measure the overhead of the vehicle drive loop per part on the
+part graph of the complete template. All parts are replaced by stubs which
+return their outputs right away, so only the loop itself is timed. The
+compiled plan of Vehicle.update_parts() is compared to running the part
+entries through Memory.get() and Memory.put().
+
+Usage:
+    vehicle_overhead.py [--config=<config>] [--loops=<loops>]
+
+Options:
+    -h --help           Show this screen.
+    --config=<config>   car config, defaults to the complete template config
+    --loops=<loops>     number of drive loops to time [default: 10000]
+"""
+import os
+import tempfile
+import time
+
+from docopt import docopt
+
+import donkeycar as dk
+from donkeycar.vehicle import Vehicle, build_vehicle
+
+
+class Stub:
+    """ Stands in for a part, returns 1 for each output """
+    def __init__(self, num_outputs):
+        self.result = None if num_outputs == 0 else \
+            1 if num_outputs == 1 else (1,) * num_outputs
+
+    def run(self, *args):
+        return self.result
+
+    def run_threaded(self, *args):
+        return self.result
+
+    def update(self):
+        pass
+
+
+def complete_parts(cfg):
+    """ Returns the part entries of the vehicle built by complete.drive() """
+    from donkeycar.templates import complete
+
+    return build_vehicle(complete.drive, cfg=cfg).parts
+
+
+def stub_vehicle(parts):
+    vehicle = Vehicle()
+    for entry in parts:
+        vehicle.add(Stub(len(entry['outputs'])), inputs=entry['inputs'],
+                    outputs=entry['outputs'],
+                    threaded=entry.get('thread') is not None,
+                    run_condition=entry['run_condition'])
+    return vehicle
+
+
+def entry_update_parts(vehicle):
+    """ Runs the part entries like update_parts() without a plan """
+    for entry in vehicle.parts:
+        run = True
+        if entry.get('run_condition'):
+            run = vehicle.mem.get([entry.get('run_condition')])[0]
+        if run:
+            p = entry['part']
+            vehicle.profiler.on_part_start(p)
+            inputs = vehicle.mem.get(entry['inputs'])
+            if entry.get('thread'):
+                outputs = p.run_threaded(*inputs)
+            else:
+                outputs = p.run(*inputs)
+            if outputs is not None:
+                vehicle.mem.put(entry['outputs'], outputs)
+            vehicle.profiler.on_part_finished(p)
+
+
+def time_loops(update, loops):
+    update()
+    start = time.perf_counter()
+    for _ in range(loops):
+        update()
+    return time.perf_counter() - start
+
+
+def overhead(config_path, loops):
+    cfg = dk.load_config(config_path)
+    cfg.CAMERA_TYPE = 'MOCK'
+    cfg.DRIVE_TRAIN_TYPE = 'None'
+    cfg.USE_SSD1306_128_32 = False
+    cfg.DATA_PATH = tempfile.mkdtemp()
+    parts = complete_parts(cfg)
+    vehicle = stub_vehicle(parts)
+    num_parts = len(vehicle.parts)
+    compiled = time_loops(vehicle.update_parts, loops)
+    entries = time_loops(lambda: entry_update_parts(vehicle), loops)
+    print(f'{num_parts} parts, {loops} loops')
+    for name, seconds in (('compiled plan', compiled),
+                          ('part entries', entries)):
+        per_part = seconds / loops / num_parts * 1e6
+        per_loop = seconds / loops * 1e6
+        print(f'{name:<14} {per_part:6.2f} us per part '
+              f'{per_loop:8.1f} us per loop')
+
+
+if __name__ == '__main__':
+    args = docopt(__doc__)
+    config = args['--config'] or os.path.join(
+        os.path.dirname(dk.__file__), 'templates', 'cfg_complete.py')
+    overhead(config, int(args['--loops']))
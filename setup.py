@@ -66,7 +66,7 @@ setup(name='donkeycar',
           ],
           'pc': [
               'matplotlib',
-              'imgaug',
+              'opencv-python',
               'kivy'
           ],
           'dev': [
@@ -77,6 +77,7 @@ setup(name='donkeycar',
           ],
           'ci': ['codecov'],
           'tf': ['tensorflow==2.2.0'],
+          'onnx': ['onnxruntime', 'tf2onnx'],
           'torch': [
               'pytorch>=1.7.1',
               'torchvision',